@@ -31,7 +31,9 @@ STATS_FILE = Path(os.environ.get("SCRAPE_STATS_PATH") or _default_stats_path())
 
 # State for scheduling
 _last_smart_money_run = 0
-SMART_MONEY_INTERVAL_SECONDS = 6 * 3600  # 6 hours
+# Smart money runs every (hourly) cycle by default; the tiered holder schedule decides which markets are due.
+# Measured from the end of the previous run, hence a bit under the 60-minute cycle.
+SMART_MONEY_INTERVAL_SECONDS = int(os.environ.get("SMART_MONEY_INTERVAL_SECONDS", str(50 * 60)))
 
 def log_stats(job_name, duration):
     file_exists = STATS_FILE.exists()
@@ -73,7 +75,10 @@ def job_coordinated_refresh():
     
     # We run smart money if interval passed OR if it's the first run (huge time_since_last)
     if time_since_last >= SMART_MONEY_INTERVAL_SECONDS:
-        logger.info("Step 2/2: Smart Money Analysis (Interval reached: %.1fh >= 6.0h)", time_since_last / 3600)
+        logger.info(
+            "Step 2/2: Smart Money Analysis (Interval reached: %.1fh >= %.1fh)",
+            time_since_last / 3600, SMART_MONEY_INTERVAL_SECONDS / 3600,
+        )
         t0_sm = time.time()
         try:
             run_smart_money()
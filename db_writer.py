@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import concurrent.futures
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+logger = logging.getLogger("polylab.db_writer")
+
+
+# Operations per transaction, max seconds an operation waits for its commit, and queue bound
+# (producers block once this many operations are waiting)
+DB_WRITER_BATCH_SIZE = int(os.environ.get("DB_WRITER_BATCH_SIZE", "500"))
+DB_WRITER_FLUSH_SECONDS = float(os.environ.get("DB_WRITER_FLUSH_SECONDS", "2"))
+DB_WRITER_QUEUE_SIZE = int(os.environ.get("DB_WRITER_QUEUE_SIZE", "2000"))
+DB_WRITER_BEGIN_RETRIES = 5
+
+_STOP = object()
+
+
+class DbWriter:
+    """
+    Single writer thread that owns the only write connection of a job.
+
+    Producers `submit(func, *args)`; the thread calls `func(conn, *args)` and groups operations into
+    one `BEGIN IMMEDIATE` transaction until `batch_size` operations or `flush_interval` seconds have
+    accumulated. Each operation runs inside a savepoint, so a failing one is rolled back and counted
+    without losing the rest of the batch. Time spent waiting for the SQLite write lock is recorded.
+
+    `submit` returns a future that resolves once the operation is committed (or fails with its error),
+    so callers can act on a confirmed write without waiting for it.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], sqlite3.Connection],
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        name: str = "db-writer",
+    ):
+        self._connect = connect
+        self.batch_size = max(1, batch_size or DB_WRITER_BATCH_SIZE)
+        self.flush_interval = DB_WRITER_FLUSH_SECONDS if flush_interval is None else max(0.0, flush_interval)
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size or DB_WRITER_QUEUE_SIZE))
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self.counters: dict[str, Any] = {
+            "ops": 0,
+            "failed": 0,
+            "commits": 0,
+            "lock_wait_seconds": 0.0,
+            "max_lock_wait_seconds": 0.0,
+            "queue_peak": 0,
+        }
+
+    def start(self) -> "DbWriter":
+        self._thread.start()
+        return self
+
+    def __enter__(self) -> "DbWriter":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _put(self, item: Any) -> None:
+        while True:
+            if self._error is not None or not self._thread.is_alive():
+                raise RuntimeError(f"DB writer is not running: {self._error}")
+            try:
+                self._queue.put(item, timeout=0.5)
+            except queue.Full:
+                continue
+            depth = self._queue.qsize()
+            if depth > self.counters["queue_peak"]:
+                with self._lock:
+                    self.counters["queue_peak"] = max(self.counters["queue_peak"], depth)
+            return
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> concurrent.futures.Future:
+        """
+        Queues `func(conn, *args)`; blocks while the queue is full. The returned future gets the
+        operation's result after its transaction commits, or its exception if it was rolled back.
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._put((func, args, future))
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Blocks until everything submitted so far is committed.
+        """
+        done = threading.Event()
+        self._put(done)
+        while not done.wait(0.5 if timeout is None else timeout):
+            if timeout is not None or not self._thread.is_alive():
+                raise RuntimeError(f"DB writer did not flush: {self._error}")
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        stats = self.stats()
+        logger.info(
+            "DB writer: %d ops in %d commits (%d failed), %.2fs waiting for the write lock (max %.2fs), queue peak %d",
+            stats["ops"], stats["commits"], stats["failed"], stats["lock_wait_seconds"],
+            stats["max_lock_wait_seconds"], stats["queue_peak"],
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+        stats["lock_wait_seconds"] = round(stats["lock_wait_seconds"], 4)
+        stats["max_lock_wait_seconds"] = round(stats["max_lock_wait_seconds"], 4)
+        return stats
+
+    def _begin(self, conn: sqlite3.Connection) -> None:
+        started = time.monotonic()
+        for attempt in range(DB_WRITER_BEGIN_RETRIES):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt == DB_WRITER_BEGIN_RETRIES - 1:
+                    raise
+                logger.warning("Write lock busy (attempt %d/%d), retrying", attempt + 1, DB_WRITER_BEGIN_RETRIES)
+        waited = time.monotonic() - started
+        with self._lock:
+            self.counters["lock_wait_seconds"] += waited
+            self.counters["max_lock_wait_seconds"] = max(self.counters["max_lock_wait_seconds"], waited)
+
+    def _apply(self, conn: sqlite3.Connection, func: Callable[..., Any], args: tuple, future, pending: list) -> None:
+        conn.execute("SAVEPOINT writer_op")
+        try:
+            result = func(conn, *args)
+        except Exception as e:
+            conn.execute("ROLLBACK TO writer_op")
+            conn.execute("RELEASE writer_op")
+            with self._lock:
+                self.counters["failed"] += 1
+            logger.error("DB writer operation %s failed: %s", getattr(func, "__name__", func), e)
+            future.set_exception(e)
+        else:
+            conn.execute("RELEASE writer_op")
+            with self._lock:
+                self.counters["ops"] += 1
+            pending.append((future, result))
+
+    def _commit(self, conn: sqlite3.Connection, pending: int, applied: list) -> None:
+        if not pending:
+            return
+        conn.commit()
+        with self._lock:
+            self.counters["commits"] += 1
+        for future, result in applied:
+            future.set_result(result)
+        applied.clear()
+
+    def _run(self) -> None:
+        conn = None
+        applied: list = []  # (future, result) of operations in the open transaction
+        try:
+            conn = self._connect()
+            pending = 0
+            first_at = 0.0
+            while True:
+                timeout = None
+                if pending:
+                    timeout = max(0.0, self.flush_interval - (time.monotonic() - first_at))
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._commit(conn, pending, applied)
+                    pending = 0
+                    continue
+
+                if item is _STOP:
+                    self._commit(conn, pending, applied)
+                    return
+                if isinstance(item, threading.Event):
+                    self._commit(conn, pending, applied)
+                    pending = 0
+                    item.set()
+                    continue
+
+                if not pending:
+                    self._begin(conn)
+                    first_at = time.monotonic()
+                func, args, future = item
+                self._apply(conn, func, args, future, applied)
+                pending += 1
+                if pending >= self.batch_size:
+                    self._commit(conn, pending, applied)
+                    pending = 0
+        except Exception as e:
+            self._error = e
+            logger.error("DB writer stopped: %s", e)
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            # Nothing of the open transaction was committed, nor will anything still queued be
+            for future, _ in applied:
+                future.set_exception(e)
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    item[2].set_exception(e)
+        finally:
+            if conn is not None:
+                conn.close()
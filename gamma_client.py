@@ -1,40 +1,142 @@
-import requests
+import asyncio
+import contextlib
+import logging
+import os
 import time
-from typing import List, Dict, Any, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from http_cache import GAMMA_HTTP_CACHE_PATHS, ResponseCache, get_response_cache
+from http_transport import HttpTransport, get_transport
+from rate_limit import THROTTLE_STATUSES, TokenBucket, get_rate_limiter, retry_after_from
+
+# Shared query filters for the paginated crawls
+MARKETS_QUERY = {
+    "active": True,
+    "closed": False,
+    "archived": False,
+    "enableOrderBook": False # We don't need OB for dashboard, basic info is enough
+}
+EVENTS_QUERY = {
+    "active": True,
+    "closed": False,
+    "archived": False,
+}
+
+# Async crawl tuning (overridable via env)
+GAMMA_FETCH_CONCURRENCY = int(os.environ.get("GAMMA_FETCH_CONCURRENCY", "8"))
+GAMMA_PREFETCH_PAGES = int(os.environ.get("GAMMA_PREFETCH_PAGES", "4"))
+GAMMA_MAX_RETRIES = int(os.environ.get("GAMMA_MAX_RETRIES", "5"))
+
+logger = logging.getLogger("polylab.gamma")
+
+class GammaFetchError(RuntimeError):
+    """
+    A Gamma page could not be fetched after all retries. Raised instead of returning `[]` so that a
+    failed page is never mistaken for the end of pagination.
+    """
+    def __init__(self, message: str, url: str = "", params: Optional[Dict[str, Any]] = None, status: Optional[int] = None):
+        super().__init__(message)
+        self.url = url
+        self.params = dict(params or {})
+        self.status = status
 
 class GammaClient:
     """
     Standalone client for Polymarket Gamma API.
     Removed dependency on 'agents' package.
+
+    All instances share one token-bucket limiter for the Gamma host; 429/503 responses slow it
+    down and honour `Retry-After`. Paths in `cache_paths` go through the on-disk response cache
+    (conditional requests; 304 or an unchanged body reuses the cached payload).
     """
-    def __init__(self):
+    def __init__(
+        self,
+        transport: Optional[HttpTransport] = None,
+        limiter: Optional[TokenBucket] = None,
+        retries: Optional[int] = None,
+        cache: Optional[ResponseCache] = None,
+        cache_paths: Optional[Tuple[str, ...]] = None,
+    ):
         self.base_url = "https://gamma-api.polymarket.com"
-        
-    def get_markets(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        url = f"{self.base_url}/markets"
-        retries = 3
-        for attempt in range(retries):
+        self.transport = transport or get_transport()
+        self.limiter = limiter or get_rate_limiter("gamma-api.polymarket.com")
+        self.retries = max(1, retries or GAMMA_MAX_RETRIES)
+        self.cache = cache if cache is not None else get_response_cache()
+        self.cache_paths = GAMMA_HTTP_CACHE_PATHS if cache_paths is None else cache_paths
+
+    def _get_json(self, path: str, params: Dict[str, Any]) -> Any:
+        url = f"{self.base_url}/{path}"
+        cache = self.cache if path in self.cache_paths else None
+        entry = cache.lookup(url, params) if cache is not None else None
+        # Only pass headers when there is something to send
+        request_kwargs: Dict[str, Any] = {"params": params, "timeout": 30}
+        if entry is not None:
+            request_kwargs["headers"] = entry.conditional_headers()
+        last_error: Optional[Exception] = None
+        status: Optional[int] = None
+        for attempt in range(self.retries):
+            self.limiter.acquire()
             try:
-                response = requests.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                return response.json()
+                response = self.transport.get(url, **request_kwargs)
             except Exception as e:
-                print(f"[GammaClient] Error fetching markets (attempt {attempt+1}/{retries}): {e}")
+                last_error, status = e, None
+                logger.warning("Error fetching %s (attempt %d/%d): %s", path, attempt + 1, self.retries, e)
                 time.sleep(2 ** attempt)
-        return []
+                continue
 
-    def get_events(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        url = f"{self.base_url}/events"
-        retries = 3
-        for attempt in range(retries):
+            status = response.status_code
+            if status in THROTTLE_STATUSES:
+                last_error = None
+                retry_after = retry_after_from(response)
+                # The pause applies to every caller sharing the limiter; without a header fall back to exponential
+                self.limiter.throttle(retry_after if retry_after is not None else float(2 ** attempt))
+                continue
+            if status == 304 and entry is not None:
+                try:
+                    payload = cache.load(entry)
+                except KeyError:
+                    # Evicted by another worker since lookup(); nothing to reuse, ask for the full body
+                    logger.info("Cached %s page evicted before its 304; refetching unconditionally", path)
+                    entry = None
+                    request_kwargs.pop("headers", None)
+                    continue
+                self.limiter.record_success()
+                return payload
+            if 400 <= status < 500:
+                raise GammaFetchError(f"Gamma {path} returned HTTP {status}", url=url, params=params, status=status)
             try:
-                response = requests.get(url, params=params, timeout=30)
                 response.raise_for_status()
-                return response.json()
+                payload = self._parse(response, cache, url, params, entry)
             except Exception as e:
-                print(f"[GammaClient] Error fetching events (attempt {attempt+1}/{retries}): {e}")
+                last_error = e
+                logger.warning("Error fetching %s (attempt %d/%d): %s", path, attempt + 1, self.retries, e)
                 time.sleep(2 ** attempt)
-        return []
+                continue
+            self.limiter.record_success()
+            return payload
+
+        reason = f": {last_error}" if last_error is not None else (f" (HTTP {status})" if status else "")
+        raise GammaFetchError(
+            f"Gamma {path} failed after {self.retries} attempts{reason}", url=url, params=params, status=status
+        )
+
+    def _parse(self, response, cache: Optional[ResponseCache], url: str, params: Dict[str, Any], entry) -> Any:
+        body = getattr(response, "content", None)
+        if cache is None or not isinstance(body, (bytes, bytearray)):
+            return response.json()
+        headers = getattr(response, "headers", None) or {}
+        return cache.store(
+            url, params, bytes(body),
+            etag=headers.get("ETag"), last_modified=headers.get("Last-Modified"), entry=entry,
+        )
+
+    def get_markets(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return self._get_json("markets", params)
+
+    def get_events(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return self._get_json("events", params)
 
 class MarketFetcher:
     """
@@ -47,14 +149,7 @@ class MarketFetcher:
         results = []
         offset = 0
         while True:
-            params = {
-                "active": True,
-                "closed": False,
-                "archived": False,
-                "limit": limit,
-                "offset": offset,
-                "enableOrderBook": False # We don't need OB for dashboard, basic info is enough
-            }
+            params = {**MARKETS_QUERY, "limit": limit, "offset": offset}
             batch = self.client.get_markets(params)
             if not batch:
                 break
@@ -69,13 +164,7 @@ class MarketFetcher:
         results = []
         offset = 0
         while True:
-            params = {
-                "active": True,
-                "closed": False,
-                "archived": False,
-                "limit": limit,
-                "offset": offset
-            }
+            params = {**EVENTS_QUERY, "limit": limit, "offset": offset}
             batch = self.client.get_events(params)
             if not batch:
                 break
@@ -85,3 +174,88 @@ class MarketFetcher:
             if len(batch) < limit:
                 break
         return results
+
+class AsyncMarketFetcher:
+    """
+    Concurrent variant of `MarketFetcher`.
+
+    Pages are requested through the blocking `GammaClient` on a worker thread pool, with at most
+    `concurrency` requests in flight across all crawls. Each crawl keeps `prefetch` offset windows
+    scheduled ahead of the page it is consuming and stops at the first short (or empty) page;
+    speculative pages past the end are cancelled or discarded.
+    """
+    def __init__(self, concurrency: Optional[int] = None, prefetch: Optional[int] = None):
+        self.client = GammaClient()
+        self.concurrency = max(1, concurrency or GAMMA_FETCH_CONCURRENCY)
+        self.prefetch = max(1, prefetch or GAMMA_PREFETCH_PAGES)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _fetch_page(self, fetch: Callable[[Dict[str, Any]], List[Dict[str, Any]]], params: Dict[str, Any]):
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fetch, params)
+
+    async def iter_pages(self, fetch: Callable[[Dict[str, Any]], List[Dict[str, Any]]], query: Dict[str, Any], limit: int = 100):
+        """
+        Yields non-empty pages in offset order while the next `prefetch` pages are already in flight.
+        """
+        pending = deque()
+        next_offset = 0
+        try:
+            while True:
+                while len(pending) < self.prefetch:
+                    params = {**query, "limit": limit, "offset": next_offset}
+                    pending.append(asyncio.ensure_future(self._fetch_page(fetch, params)))
+                    next_offset += limit
+                batch = await pending.popleft()
+                if batch:
+                    yield batch
+                if not batch or len(batch) < limit:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """
+        Sets up the shared concurrency budget and worker pool for the crawls run inside the block.
+        """
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="gamma")
+        try:
+            yield self
+        finally:
+            # Drop queued speculative requests past the last page; let in-flight ones finish so no
+            # worker outlives the crawl (failed pages now retry instead of returning immediately)
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def iter_event_pages(self, limit: int = 100):
+        return self.iter_pages(self.client.get_events, EVENTS_QUERY, limit)
+
+    def iter_market_pages(self, limit: int = 100):
+        return self.iter_pages(self.client.get_markets, MARKETS_QUERY, limit)
+
+    async def _collect(self, pages) -> List[Dict[str, Any]]:
+        results = []
+        async for batch in pages:
+            results.extend(batch)
+        return results
+
+    async def fetch_events_and_markets_async(self, limit=100) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        async with self.session():
+            events, markets = await asyncio.gather(
+                self._collect(self.iter_event_pages(limit)),
+                self._collect(self.iter_market_pages(limit)),
+            )
+        return events, markets
+
+    def fetch_events_and_markets(self, limit=100) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Runs the events and markets crawls concurrently and returns `(events, markets)`.
+        """
+        return asyncio.run(self.fetch_events_and_markets_async(limit=limit))
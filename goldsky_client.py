@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Iterable, Iterator, Optional
+
+import requests
+
+from http_transport import HttpTransport, get_transport
+from rate_limit import THROTTLE_STATUSES, TokenBucket, get_rate_limiter, retry_after_from
+
+
+logger = logging.getLogger("polylab.holders.goldsky")
+
+
+GOLDSKY_SUBGRAPH_URL = os.environ.get(
+    "GOLDSKY_SUBGRAPH_URL",
+    "https://api.goldsky.com/api/public/project_cl6mb8i9h0003e201j6li0diw/subgraphs/positions-subgraph/0.0.7/gn",
+)
+# (condition, outcome) streams aliased into one GraphQL request, and balances per stream per page (subgraph max 1000)
+GOLDSKY_BATCH_SIZE = int(os.environ.get("GOLDSKY_BATCH_SIZE", "20"))
+GOLDSKY_PAGE_SIZE = int(os.environ.get("GOLDSKY_PAGE_SIZE", "1000"))
+# Batch requests in flight and the request budget for the subgraph host
+GOLDSKY_CONCURRENCY = int(os.environ.get("GOLDSKY_CONCURRENCY", "4"))
+GOLDSKY_RPS = float(os.environ.get("GOLDSKY_RPS", "5"))
+GOLDSKY_MAX_RETRIES = int(os.environ.get("GOLDSKY_MAX_RETRIES", "3"))
+# Balances at or below this many shares are dust and are not fetched
+GOLDSKY_MIN_SHARES = float(os.environ.get("GOLDSKY_MIN_SHARES", "1"))
+
+# Outcome tokens have 6 decimals
+SHARE_UNITS = 1_000_000
+
+
+class GoldskyFetchError(RuntimeError):
+    """
+    A batch request failed after all retries (HTTP error or GraphQL `errors`).
+    """
+
+
+class GoldskyHoldersClient:
+    """
+    Full-depth holders from the Goldsky positions subgraph.
+
+    Each (condition, outcome) pair is a stream paged by `id_gt` cursor over `userBalances`. Up to
+    `batch_size` streams from different markets share one GraphQL request as aliased fields, and up
+    to `concurrency` such requests run at once. A stream with a full page goes back to the front of
+    the queue with its new cursor, so deep markets finish (and free their rows) before new ones start.
+    """
+
+    def __init__(
+        self,
+        transport: Optional[HttpTransport] = None,
+        limiter: Optional[TokenBucket] = None,
+        url: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        page_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        min_shares: Optional[float] = None,
+        outcomes: tuple[int, ...] = (0, 1),
+    ):
+        self.url = url or GOLDSKY_SUBGRAPH_URL
+        self.transport = transport or get_transport()
+        self.limiter = limiter or get_rate_limiter("api.goldsky.com", rate=GOLDSKY_RPS, burst=GOLDSKY_RPS)
+        self.batch_size = max(1, batch_size or GOLDSKY_BATCH_SIZE)
+        self.page_size = max(1, min(1000, page_size or GOLDSKY_PAGE_SIZE))
+        self.concurrency = max(1, concurrency or GOLDSKY_CONCURRENCY)
+        shares = GOLDSKY_MIN_SHARES if min_shares is None else min_shares
+        self.min_balance = str(max(0, int(shares * SHARE_UNITS)))
+        self.outcomes = outcomes
+        self.requests = 0
+
+    def _build_query(self, streams: list[tuple[str, int, str]]) -> tuple[str, dict[str, Any]]:
+        params, fields, variables = ["$first: Int!", "$minBalance: BigInt!"], [], {}
+        variables["first"] = self.page_size
+        variables["minBalance"] = self.min_balance
+        for i, (condition_id, outcome_index, cursor) in enumerate(streams):
+            params += [f"$c{i}: String!", f"$o{i}: BigInt!", f"$after{i}: String!"]
+            variables.update({f"c{i}": condition_id, f"o{i}": str(outcome_index), f"after{i}": cursor})
+            fields.append(
+                f"b{i}: userBalances(first: $first, orderBy: id, orderDirection: asc, "
+                f"where: {{asset_: {{condition: $c{i}, outcomeIndex: $o{i}}}, balance_gt: $minBalance, id_gt: $after{i}}}) "
+                "{ id user balance }"
+            )
+        return f"query Holders({', '.join(params)}) {{ {' '.join(fields)} }}", variables
+
+    def _post(self, payload: dict[str, Any]) -> dict[str, Any]:
+        last_error: Optional[Exception] = None
+        for attempt in range(max(1, GOLDSKY_MAX_RETRIES)):
+            self.limiter.acquire()
+            self.requests += 1
+            try:
+                response = self.transport.post(self.url, json=payload, timeout=45)
+            except requests.exceptions.RequestException as e:
+                last_error = e
+                time.sleep(2 ** attempt)
+                continue
+            if response.status_code in THROTTLE_STATUSES:
+                self.limiter.throttle(retry_after_from(response))
+                last_error = GoldskyFetchError(f"HTTP {response.status_code}")
+                continue
+            if response.status_code >= 500:
+                last_error = GoldskyFetchError(f"HTTP {response.status_code}")
+                time.sleep(2 ** attempt)
+                continue
+            response.raise_for_status()
+            data = response.json()
+            if data.get("errors"):
+                # Query errors are not transient (bad id, indexer limits); retrying would repeat them
+                raise GoldskyFetchError(f"GraphQL errors: {data['errors']}")
+            self.limiter.record_success()
+            return data.get("data") or {}
+        raise GoldskyFetchError(f"Goldsky request failed after {GOLDSKY_MAX_RETRIES} attempts: {last_error}")
+
+    def fetch_page(self, streams: list[tuple[str, int, str]]) -> list[list[dict[str, Any]]]:
+        """
+        One request for many streams: the next page of balances of each (condition_id, outcome_index, cursor).
+        """
+
+        query, variables = self._build_query(streams)
+        data = self._post({"query": query, "variables": variables})
+        return [data.get(f"b{i}") or [] for i in range(len(streams))]
+
+    def iter_holders(self, condition_ids: Iterable[str]) -> Iterator[tuple[str, Optional[list[dict[str, Any]]]]]:
+        """
+        Yields (condition_id, holders) as each market's outcomes are fully paged, or (condition_id, None)
+        if any of its requests failed. Holders have the data-api shape used by `save_holders_batch`.
+        """
+
+        source = iter(dict.fromkeys(condition_ids))
+        queue: deque[tuple[str, int, str]] = deque()
+        open_streams: dict[str, int] = {}
+        holders: dict[str, list[dict[str, Any]]] = {}
+        failed: set[str] = set()
+        window = self.batch_size * self.concurrency
+
+        def refill() -> None:
+            while len(queue) < window:
+                condition_id = next(source, None)
+                if condition_id is None:
+                    return
+                open_streams[condition_id] = len(self.outcomes)
+                holders[condition_id] = []
+                queue.extend((condition_id, outcome, "") for outcome in self.outcomes)
+
+        def close_stream(condition_id: str) -> Optional[tuple[str, Optional[list[dict[str, Any]]]]]:
+            open_streams[condition_id] -= 1
+            if open_streams[condition_id] > 0:
+                return None
+            del open_streams[condition_id]
+            rows = holders.pop(condition_id)
+            if condition_id in failed:
+                failed.discard(condition_id)
+                return condition_id, None
+            rows.sort(key=lambda h: h["positionSize"], reverse=True)
+            return condition_id, rows
+
+        in_flight: dict[Future, list[tuple[str, int, str]]] = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="goldsky") as executor:
+            refill()
+            while queue or in_flight:
+                finished = []
+                while queue and len(in_flight) < self.concurrency:
+                    batch = []
+                    while queue and len(batch) < self.batch_size:
+                        stream = queue.popleft()
+                        if stream[0] in failed:
+                            # The market is already lost; don't spend requests on its other outcomes
+                            finished.append(close_stream(stream[0]))
+                        else:
+                            batch.append(stream)
+                    if batch:
+                        in_flight[executor.submit(self.fetch_page, batch)] = batch
+                if not in_flight:
+                    yield from (result for result in finished if result is not None)
+                    refill()
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        logger.error(f"Goldsky batch of {len(batch)} streams failed: {e}")
+                        pages = None
+                    for i, (condition_id, outcome_index, _) in enumerate(batch):
+                        if pages is None:
+                            failed.add(condition_id)
+                            finished.append(close_stream(condition_id))
+                            continue
+                        page = pages[i]
+                        for item in page:
+                            address = item.get("user")
+                            if not address:
+                                continue
+                            holders[condition_id].append({
+                                "address": address,
+                                "positionSize": int(item.get("balance") or 0) / SHARE_UNITS,
+                                "outcomeIndex": outcome_index,
+                                "name": None,
+                            })
+                        if len(page) >= self.page_size and condition_id not in failed:
+                            queue.appendleft((condition_id, outcome_index, page[-1]["id"]))
+                        else:
+                            finished.append(close_stream(condition_id))
+                refill()
+                for result in finished:
+                    if result is not None:
+                        yield result
+
+    def fetch_holders(self, condition_id: str, limit: Optional[int] = None) -> Optional[list[dict[str, Any]]]:
+        """
+        Single-market form with the `HoldersClient.fetch_holders` contract; `limit` caps holders per
+        outcome (largest first) after the full fetch.
+        """
+
+        for _, rows in self.iter_holders([condition_id]):
+            if rows is None or not limit:
+                return rows
+            kept = []
+            for outcome in self.outcomes:
+                kept.extend([h for h in rows if h["outcomeIndex"] == outcome][:limit])
+            kept.sort(key=lambda h: h["positionSize"], reverse=True)
+            return kept
+        return None
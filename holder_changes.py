@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional
+
+
+# A position change is logged when it moves at least this many shares and at least this fraction of
+# the previous size; entries and exits need a position of at least the absolute threshold
+HOLDER_CHANGE_MIN_DELTA = float(os.environ.get("HOLDER_CHANGE_MIN_DELTA", "1000"))
+HOLDER_CHANGE_MIN_RATIO = float(os.environ.get("HOLDER_CHANGE_MIN_RATIO", "0.1"))
+HOLDER_CHANGES_RETENTION_DAYS = float(os.environ.get("HOLDER_CHANGES_RETENTION_DAYS", "30"))
+
+CHANGE_KINDS = ("enter", "exit", "resize")
+
+
+def ensure_holder_changes_schema(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS holder_changes (
+            id INTEGER PRIMARY KEY,
+            detected_at TEXT NOT NULL,
+            market_id TEXT NOT NULL,
+            outcome_index INTEGER,
+            wallet_address TEXT NOT NULL,
+            change TEXT NOT NULL,
+            old_size REAL,
+            new_size REAL,
+            delta REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_holder_changes_detected ON holder_changes(detected_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_holder_changes_market ON holder_changes(market_id, detected_at)")
+
+
+def _as_index(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def diff_holders(
+    previous: Iterable[tuple[Any, str, float]],
+    current: Iterable[tuple[Any, str, float]],
+    min_delta: Optional[float] = None,
+    min_ratio: Optional[float] = None,
+) -> list[tuple[Optional[int], str, str, Optional[float], Optional[float], float]]:
+    """
+    Compares two holder sets of one market, each as (outcome_index, wallet, size) rows.
+
+    Returns (outcome_index, wallet, change, old_size, new_size, delta) for entries, exits and size
+    changes that pass the thresholds. Holder lists are top-N per outcome, so a wallet dropping out
+    of the list shows up as an exit even if it still holds a (smaller) position.
+    """
+
+    threshold = HOLDER_CHANGE_MIN_DELTA if min_delta is None else min_delta
+    ratio = HOLDER_CHANGE_MIN_RATIO if min_ratio is None else min_ratio
+    before = {(_as_index(o), w): float(s or 0.0) for o, w, s in previous if w}
+    after = {(_as_index(o), w): float(s or 0.0) for o, w, s in current if w}
+
+    changes = []
+    for key in after.keys() | before.keys():
+        old, new = before.get(key), after.get(key)
+        if old is None:
+            if new >= threshold:
+                changes.append((key[0], key[1], "enter", None, new, new))
+        elif new is None:
+            if old >= threshold:
+                changes.append((key[0], key[1], "exit", old, None, -old))
+        else:
+            delta = new - old
+            if abs(delta) >= threshold and (old <= 0 or abs(delta) / old >= ratio):
+                changes.append((key[0], key[1], "resize", old, new, delta))
+    changes.sort(key=lambda c: -abs(c[5]))
+    return changes
+
+
+def record_holder_changes(
+    conn,
+    market_id: str,
+    previous: list[tuple[Any, str, float]],
+    current: list[tuple[Any, str, float]],
+    detected_at: str,
+) -> int:
+    """
+    Appends the changes between a market's previous and new holder sets. A market seen for the
+    first time (no previous holders) has nothing to compare against and logs nothing.
+    """
+
+    if not previous:
+        return 0
+    changes = diff_holders(previous, current)
+    if changes:
+        conn.executemany(
+            """
+            INSERT INTO holder_changes
+                (detected_at, market_id, outcome_index, wallet_address, change, old_size, new_size, delta)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(detected_at, market_id, *change) for change in changes],
+        )
+    return len(changes)
+
+
+def prune_holder_changes(conn, now: Optional[datetime] = None, retention_days: Optional[float] = None) -> int:
+    days = HOLDER_CHANGES_RETENTION_DAYS if retention_days is None else retention_days
+    if days <= 0:
+        return 0
+    cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=days)).isoformat()
+    return conn.execute("DELETE FROM holder_changes WHERE detected_at < ?", (cutoff,)).rowcount
+
+
+def query_whale_moves(
+    conn,
+    since: datetime,
+    until: datetime,
+    min_delta: float = 0.0,
+    market_id: Optional[str] = None,
+    wallet: Optional[str] = None,
+    change: Optional[str] = None,
+    limit: int = 100,
+) -> list[dict[str, Any]]:
+    """
+    Logged holder changes in [since, until], newest first (largest moves first within a run).
+    """
+
+    where = ["c.detected_at >= ?", "c.detected_at <= ?"]
+    params: list[Any] = [since.isoformat(), until.isoformat()]
+    if min_delta > 0:
+        where.append("ABS(c.delta) >= ?")
+        params.append(min_delta)
+    if market_id:
+        where.append("c.market_id = ?")
+        params.append(market_id)
+    if wallet:
+        where.append("c.wallet_address = ?")
+        params.append(wallet)
+    if change:
+        where.append("c.change = ?")
+        params.append(change)
+    params.append(limit)
+
+    rows = conn.execute(
+        f"""
+        SELECT c.detected_at, c.market_id AS condition_id, c.outcome_index, c.wallet_address, c.change,
+               c.old_size, c.new_size, c.delta,
+               ws.alias, ws.total_pnl,
+               (SELECT o.question FROM active_market_outcomes o
+                 WHERE o.condition_id = c.market_id LIMIT 1) AS question,
+               (SELECT o.outcome_name FROM active_market_outcomes o
+                 WHERE o.condition_id = c.market_id AND o.outcome_index = c.outcome_index LIMIT 1) AS outcome_name
+        FROM holder_changes c
+        LEFT JOIN wallets_stats ws ON ws.wallet_address = c.wallet_address
+        WHERE {" AND ".join(where)}
+        ORDER BY c.detected_at DESC, ABS(c.delta) DESC
+        LIMIT ?
+        """,
+        params,
+    ).fetchall()
+    columns = (
+        "detected_at", "condition_id", "outcome_index", "wallet_address", "change", "old_size", "new_size",
+        "delta", "alias", "total_pnl", "question", "outcome_name",
+    )
+    return [dict(zip(columns, row)) for row in rows]
@@ -2,13 +2,20 @@ import requests
 import time
 import logging
 import os # Import os for environment variables
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+from http_transport import HttpTransport, get_transport
+from rate_limit import CircuitBreaker, TokenBucket, retry_after_from
 
 logger = logging.getLogger("polylab.holders")
 
 class HoldersClient:
-    def __init__(self):
+    def __init__(self, transport: Optional[HttpTransport] = None, limiter: Optional[TokenBucket] = None):
         self.base_url = "https://data-api.polymarket.com"
+        self.transport = transport or get_transport()
+        # Optional shared request budget; 429s then pause every caller of the limiter instead of sleeping here
+        self.limiter = limiter
 
     def fetch_holders(self, market_id: str, limit: int = 20) -> Optional[List[Dict[str, Any]]]:
         """
@@ -25,9 +32,14 @@ class HoldersClient:
         retries = 3
         for attempt in range(retries):
             try:
-                response = requests.get(url, params=params, timeout=15)
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                response = self.transport.get(url, params=params, timeout=15)
                 
                 # Handle 429 specifically
+                if response.status_code == 429 and self.limiter is not None:
+                    self.limiter.throttle(retry_after_from(response))
+                    continue
                 if response.status_code == 429:
                     logger.warning(f"Rate limited (429) for market {market_id}, waiting 5s (attempt {attempt+1}/{retries})")
                     time.sleep(5)
@@ -35,6 +47,8 @@ class HoldersClient:
 
                 response.raise_for_status()
                 data = response.json()
+                if self.limiter is not None:
+                    self.limiter.record_success()
 
                 if not isinstance(data, list):
                     logger.warning(f"Unexpected response format for market {market_id}: {type(data)}")
@@ -74,9 +88,73 @@ class HoldersClient:
         return None
 
 
+class FailoverHoldersClient:
+    """
+    `fetch_holders` over several backends in order of preference, each behind a circuit breaker.
+
+    A backend whose breaker is open is skipped without a request. A failed fetch that leaves the
+    breaker closed is an isolated failure and returns None (the market goes to the retry pass with
+    the same backend); once a breaker trips, the market and those after it move to the next
+    backend until a half-open probe succeeds. While the preferred upstream is degraded, a market
+    costs one refused call instead of a full round of retries and sleeps.
+    """
+
+    def __init__(self, backends: List[Tuple[str, Any]], breakers: Optional[Dict[str, CircuitBreaker]] = None):
+        self.backends = backends
+        breakers = breakers or {}
+        self.breakers = {name: breakers.get(name) or CircuitBreaker(name=f"holders:{name}") for name, _ in backends}
+        self.served = {name: 0 for name, _ in backends}
+        self.failovers = 0  # markets served by a backend other than the preferred one
+        self.unavailable = 0  # markets no backend could serve
+        self._lock = threading.Lock()
+
+    def fetch_holders(self, market_id: str, limit: int = 20) -> Optional[List[Dict[str, Any]]]:
+        for position, (name, client) in enumerate(self.backends):
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            try:
+                data = client.fetch_holders(market_id, limit=limit)
+            except Exception as e:
+                logger.error(f"Holders backend {name} failed for {market_id}: {e}")
+                data = None
+            breaker.record(data is not None)
+            if data is not None:
+                with self._lock:
+                    self.served[name] += 1
+                    if position > 0:
+                        self.failovers += 1
+                return data
+            if breaker.state == CircuitBreaker.CLOSED:
+                break
+        with self._lock:
+            self.unavailable += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "served": dict(self.served),
+                "failovers": self.failovers,
+                "unavailable": self.unavailable,
+                "breakers": {name: breaker.stats() for name, breaker in self.breakers.items()},
+            }
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        served = ", ".join(f"{name} {count}" for name, count in stats["served"].items())
+        states = ", ".join(f"{name} {b['state']}" for name, b in stats["breakers"].items())
+        logger.info(
+            f"Holders failover: served {served}; {stats['failovers']} failovers, "
+            f"{stats['unavailable']} markets unavailable; breakers {states}"
+        )
+
+
 class PnLClient:
-    def __init__(self):
+    def __init__(self, transport: Optional[HttpTransport] = None, limiter: Optional[TokenBucket] = None):
         self.base_url = "https://user-pnl-api.polymarket.com"
+        self.transport = transport or get_transport()
+        self.limiter = limiter
 
     def fetch_user_pnl(self, wallet_address: str) -> Optional[float]:
         """
@@ -89,8 +167,13 @@ class PnLClient:
         retries = 5
         for attempt in range(retries):
             try:
-                response = requests.get(url, params=params, timeout=15)
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                response = self.transport.get(url, params=params, timeout=15)
                 
+                if response.status_code == 429 and self.limiter is not None:
+                    self.limiter.throttle(retry_after_from(response))
+                    continue
                 if response.status_code == 429:
                     wait_time = (2 ** attempt) + 1
                     logger.warning(f"Rate limited (429) for {wallet_address}, waiting {wait_time}s (attempt {attempt+1}/{retries})")
@@ -99,6 +182,8 @@ class PnLClient:
                     
                 response.raise_for_status()
                 data = response.json()
+                if self.limiter is not None:
+                    self.limiter.record_success()
                 
                 if isinstance(data, list) and len(data) > 0:
                     last_point = data[-1]
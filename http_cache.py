@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Optional
+
+from runtime_paths import env_flag, resolve_repo_path
+
+
+logger = logging.getLogger("polylab.http_cache")
+
+
+# On-disk cache of Gamma responses (conditional requests + body-hash reuse), bounded by size
+GAMMA_HTTP_CACHE = env_flag("GAMMA_HTTP_CACHE", default=True)
+GAMMA_HTTP_CACHE_PATH = os.environ.get("GAMMA_HTTP_CACHE_PATH", "data/http_cache.db")
+GAMMA_HTTP_CACHE_MAX_MB = float(os.environ.get("GAMMA_HTTP_CACHE_MAX_MB", "64"))
+# Endpoints worth caching: events change rarely, market pages carry live prices
+GAMMA_HTTP_CACHE_PATHS = tuple(
+    p.strip() for p in os.environ.get("GAMMA_HTTP_CACHE_PATHS", "events").split(",") if p.strip()
+)
+
+
+def cache_key(url: str, params: Optional[dict[str, Any]] = None) -> str:
+    canonical = json.dumps(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+    return hashlib.sha256(f"{url}?{canonical}".encode("utf-8")).hexdigest()
+
+
+def body_hash(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class CacheEntry:
+    __slots__ = ("key", "etag", "last_modified", "body_hash", "size")
+
+    def __init__(self, key: str, etag: Optional[str], last_modified: Optional[str], body_hash: str, size: int):
+        self.key = key
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_hash = body_hash
+        self.size = size
+
+    def conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache keyed by request URL + params.
+
+    Stores validators (ETag / Last-Modified), a hash of the body and the zlib-compressed body.
+    Callers send the validators as conditional headers; on 304, or on a 200 whose body hash is
+    unchanged, the cached payload is reused. Entries are evicted least-recently-used once the
+    stored bodies exceed `max_bytes`. Parsed payloads are not kept in memory: the cache lives for the
+    whole process (hourly in-process refreshes), so a reused body is re-parsed from the stored bytes.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.path = str(resolve_repo_path(path or GAMMA_HTTP_CACHE_PATH))
+        self.max_bytes = int(max_bytes if max_bytes is not None else GAMMA_HTTP_CACHE_MAX_MB * 1024 * 1024)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_tick = 0.0
+        self.counters = {"not_modified": 0, "unchanged": 0, "stored": 0, "evicted": 0, "bytes_saved": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    key TEXT PRIMARY KEY,
+                    url TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    body_hash TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_at REAL,
+                    last_used REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_last_used ON http_cache(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, url: str, params: Optional[dict[str, Any]] = None) -> Optional[CacheEntry]:
+        key = cache_key(url, params)
+        with self._lock:
+            row = self._db().execute(
+                "SELECT etag, last_modified, body_hash, size FROM http_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        return CacheEntry(key, row[0], row[1], row[2], row[3])
+
+    def load(self, entry: CacheEntry) -> Any:
+        """
+        Payload of a cached entry (after a 304); refreshes its LRU position. Raises `KeyError` when
+        the entry was evicted since `lookup()`.
+        """
+
+        with self._lock:
+            row = self._db().execute("SELECT body FROM http_cache WHERE key = ?", (entry.key,)).fetchone()
+            if not row:
+                raise KeyError(entry.key)
+            payload = json.loads(zlib.decompress(row[0]))
+            self._touch(entry.key)
+            self.counters["not_modified"] += 1
+            self.counters["bytes_saved"] += entry.size
+        return payload
+
+    def _tick(self) -> float:
+        # Strictly increasing use stamps keep LRU order exact within one clock tick
+        self._last_tick = max(time.time(), self._last_tick + 1e-6)
+        return self._last_tick
+
+    def _touch(self, key: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> bool:
+        cursor = self._db().execute(
+            """
+            UPDATE http_cache SET last_used = ?,
+                etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+            WHERE key = ?
+            """,
+            (self._tick(), etag, last_modified, key),
+        )
+        self._db().commit()
+        return cursor.rowcount > 0
+
+    def store(
+        self,
+        url: str,
+        params: Optional[dict[str, Any]],
+        body: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        entry: Optional[CacheEntry] = None,
+    ) -> Any:
+        """
+        Records a 200 response and returns its parsed payload. An unchanged body (same hash as the
+        cached entry) only refreshes validators instead of rewriting the compressed body.
+        """
+
+        digest = body_hash(body)
+        payload = json.loads(body)
+        with self._lock:
+            # An entry evicted since lookup() has no row left to touch; store it again
+            if entry is not None and entry.body_hash == digest and self._touch(entry.key, etag, last_modified):
+                self.counters["unchanged"] += 1
+                return payload
+
+            compressed = zlib.compress(body, 6)
+            now = self._tick()
+            self._db().execute(
+                """
+                INSERT OR REPLACE INTO http_cache
+                    (key, url, etag, last_modified, body_hash, body, size, stored_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (cache_key(url, params), url, etag, last_modified, digest, compressed, len(compressed), now, now),
+            )
+            self.counters["stored"] += 1
+            self._evict()
+            self._db().commit()
+        return payload
+
+    def _evict(self) -> None:
+        conn = self._db()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% so eviction doesn't run on every subsequent store
+        target = int(self.max_bytes * 0.9)
+        for key, size in conn.execute("SELECT key, size FROM http_cache ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM http_cache WHERE key = ?", (key,))
+            total -= size
+            self.counters["evicted"] += 1
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return int(self._db().execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0])
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Process-wide Gamma response cache, or None when disabled via GAMMA_HTTP_CACHE=0.
+    """
+
+    global _cache
+    if not GAMMA_HTTP_CACHE:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+
+def log_cache_stats(prefix: str = "HTTP cache") -> None:
+    if _cache is None:
+        return
+    stats = _cache.stats()
+    logger.info(
+        "%s: %d not modified, %d unchanged bodies, %d stored, %d evicted, %.1f KiB not re-downloaded",
+        prefix, stats["not_modified"], stats["unchanged"], stats["stored"], stats["evicted"],
+        stats["bytes_saved"] / 1024.0,
+    )
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import THROTTLE_STATUSES, AimdConcurrency
+from runtime_paths import env_flag
+
+
+logger = logging.getLogger("polylab.http")
+
+
+# Number of per-host pools kept alive, connections kept per host, and whether callers
+# wait for a free connection (True) or open a throwaway one (False) when a pool is full.
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "8"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+HTTP_POOL_BLOCK = env_flag("HTTP_POOL_BLOCK", default=False)
+# Optional concurrent-request caps per host, e.g. "data-api.polymarket.com=10,user-pnl-api.polymarket.com=10"
+HTTP_HOST_LIMITS = os.environ.get("HTTP_HOST_LIMITS", "")
+# Hosts whose concurrency adapts to throttling (AIMD window, see rate_limit.AimdConcurrency); empty disables
+HTTP_ADAPTIVE_HOSTS = os.environ.get("HTTP_ADAPTIVE_HOSTS", "data-api.polymarket.com,user-pnl-api.polymarket.com")
+
+DEFAULT_HEADERS = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "polylab-scanner/1.0",
+}
+
+
+def parse_host_limits(raw: Optional[str]) -> dict[str, int]:
+    limits: dict[str, int] = {}
+    for item in (raw or "").split(","):
+        host, sep, value = item.partition("=")
+        if not sep or not host.strip():
+            continue
+        try:
+            limits[host.strip().lower()] = max(1, int(value))
+        except ValueError:
+            logger.warning("Ignoring invalid host limit %r", item)
+    return limits
+
+
+class HttpTransport:
+    """
+    Keep-alive HTTP transport shared by the upstream API clients.
+
+    A single `requests.Session` backed by urllib3 connection pools (which are thread-safe) so that
+    worker threads reuse TCP+TLS connections instead of handshaking on every call.
+    """
+
+    def __init__(
+        self,
+        pool_connections: Optional[int] = None,
+        pool_maxsize: Optional[int] = None,
+        pool_block: Optional[bool] = None,
+        host_limits: Optional[dict[str, int]] = None,
+        adaptive_hosts: Optional[list[str]] = None,
+    ):
+        self.pool_maxsize = max(1, pool_maxsize or HTTP_POOL_MAXSIZE)
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        self.adapter = HTTPAdapter(
+            pool_connections=max(1, pool_connections or HTTP_POOL_CONNECTIONS),
+            pool_maxsize=self.pool_maxsize,
+            pool_block=HTTP_POOL_BLOCK if pool_block is None else pool_block,
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        limits = parse_host_limits(HTTP_HOST_LIMITS) if host_limits is None else host_limits
+        self._host_slots = {host.lower(): threading.BoundedSemaphore(n) for host, n in limits.items()}
+        if adaptive_hosts is None:
+            adaptive_hosts = HTTP_ADAPTIVE_HOSTS.split(",")
+        self._adaptive = {
+            host.strip().lower(): AimdConcurrency(name=host.strip().lower())
+            for host in adaptive_hosts if host.strip()
+        }
+        self._lock = threading.Lock()
+        self._requests_by_host: dict[str, int] = {}
+
+    def _count(self, host: str) -> None:
+        with self._lock:
+            self._requests_by_host[host] = self._requests_by_host.get(host, 0) + 1
+
+    def _send(self, send, host: str, url: str, kwargs: dict[str, Any]) -> requests.Response:
+        slot = self._host_slots.get(host)
+        if slot is None:
+            return send(url, **kwargs)
+        with slot:
+            return send(url, **kwargs)
+
+    def _request(self, send, url: str, kwargs: dict[str, Any]) -> requests.Response:
+        host = (urlsplit(url).hostname or "").lower()
+        self._count(host)
+        window = self._adaptive.get(host)
+        if window is None:
+            return self._send(send, host, url, kwargs)
+
+        ticket = window.acquire()
+        outcome = "error"
+        try:
+            response = self._send(send, host, url, kwargs)
+            status = getattr(response, "status_code", None)
+            if status in THROTTLE_STATUSES:
+                outcome = "throttled"
+            elif not isinstance(status, int) or status < 500:
+                outcome = "ok"
+            return response
+        except requests.exceptions.Timeout:
+            outcome = "timeout"
+            raise
+        finally:
+            window.release(ticket, outcome)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self._request(self.session.get, url, kwargs)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self._request(self.session.post, url, kwargs)
+
+    def adaptive_stats(self) -> dict[str, dict[str, Any]]:
+        return {host: window.stats() for host, window in self._adaptive.items()}
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Connection reuse counters, aggregated from the live urllib3 pools.
+        """
+
+        hosts: dict[str, dict[str, int]] = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            entry = hosts.setdefault(str(pool.host), {"requests": 0, "connections": 0})
+            entry["requests"] += int(getattr(pool, "num_requests", 0))
+            entry["connections"] += int(getattr(pool, "num_connections", 0))
+
+        total_requests = sum(h["requests"] for h in hosts.values())
+        total_connections = sum(h["connections"] for h in hosts.values())
+        reused = max(0, total_requests - total_connections)
+        with self._lock:
+            issued = sum(self._requests_by_host.values())
+        return {
+            "requests": issued,
+            "pooled_requests": total_requests,
+            "connections_opened": total_connections,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / total_requests, 4) if total_requests else 0.0,
+            "hosts": hosts,
+            "adaptive": self.adaptive_stats(),
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """
+    Process-wide shared transport (created lazily). UPSTREAM_MODE=record|replay swaps in the
+    recording / offline replay transport from `upstream_replay`.
+    """
+
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                from upstream_replay import build_transport
+
+                _transport = build_transport(HttpTransport)
+    return _transport
+
+
+def set_transport(transport: Optional[Any]) -> Optional[Any]:
+    """
+    Replaces the shared transport (benchmarks, tests). Returns the previous one; None resets to lazy creation.
+    """
+
+    global _transport
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    return previous
+
+
+def log_transport_stats(prefix: str = "HTTP transport") -> None:
+    if _transport is None:
+        return
+    stats = _transport.stats()
+    logger.info(
+        "%s: %d requests, %d connections opened, %d reused (%.1f%%)",
+        prefix,
+        stats["requests"],
+        stats["connections_opened"],
+        stats["connections_reused"],
+        stats["reuse_ratio"] * 100.0,
+    )
+    for host, window in (stats.get("adaptive") or {}).items():
+        if window["successes"] or window["throttle_events"] or window["timeouts"]:
+            logger.info(
+                "%s %s: window %.1f (peak in flight %d), %d throttled, %d timeouts, %d cuts",
+                prefix, host, window["window"], window["peak_in_flight"],
+                window["throttle_events"], window["timeouts"], window["cuts"],
+            )
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import sqlite3
 import time
@@ -21,12 +22,28 @@ from bootstrap_snapshots import (
     load_precomputed_snapshot,
     refresh_precomputed_snapshots,
 )
+from holder_changes import CHANGE_KINDS, ensure_holder_changes_schema, query_whale_moves
 from logging_setup import setup_logging
-from market_queries import get_status_timestamps, get_tag_stats, query_markets
+from market_search import ensure_search_index
+from market_queries import (
+    CursorExpired,
+    get_status_timestamps,
+    get_tag_stats,
+    markets_data_token,
+    markets_filter_key,
+    next_markets_cursor,
+    query_markets,
+    resolve_markets_cursor,
+)
+from price_history import RESOLUTIONS, ensure_price_history_schema, query_history
+from read_pool import ReadConnectionPool
+from result_cache import MARKETS_CACHE_CLOCK_BUCKET_SECONDS, ResultCache
 from smart_money_materialized import (
     ensure_market_smart_money_stats_schema,
-    rebuild_market_smart_money_stats,
+    ensure_smart_money_dirty_tracking,
+    refresh_market_smart_money_stats,
 )
+from snapshot_tables import ensure_data_versions_schema, ensure_snapshot_indexes
 
 setup_logging("web")
 logger = logging.getLogger("polylab")
@@ -112,6 +129,31 @@ class HolderDetail(BaseModel):
 
 
 
+class HistoryPoint(BaseModel):
+    outcome_index: int
+    ts: str
+    resolution: int
+    price: Optional[float] = None
+    price_low: Optional[float] = None
+    price_high: Optional[float] = None
+    spread: Optional[float] = None
+    volume_usd: Optional[float] = None
+    liquidity_usd: Optional[float] = None
+
+class WhaleMove(BaseModel):
+    detected_at: str
+    condition_id: str
+    outcome_index: Optional[int] = None
+    wallet_address: str
+    change: str
+    old_size: Optional[float] = None
+    new_size: Optional[float] = None
+    delta: float
+    alias: Optional[str] = None
+    total_pnl: Optional[float] = None
+    question: Optional[str] = None
+    outcome_name: Optional[str] = None
+
 class PerfScenarioResult(BaseModel):
 
     name: str
@@ -133,6 +175,12 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+def get_read_connection():
+    """
+    The request thread's pooled read-only connection; for endpoints that never write.
+    """
+    return read_pool.connection(DB_PATH)
+
 def get_metrics_connection():
     conn = sqlite3.connect(METRICS_DB_PATH)
     conn.row_factory = sqlite3.Row
@@ -247,27 +295,17 @@ def ensure_indices():
             CREATE INDEX IF NOT EXISTS idx_holders_market_outcome ON holders(market_id, outcome_index);
             CREATE INDEX IF NOT EXISTS idx_holders_market_outcome_wallet ON holders(market_id, outcome_index, wallet_address);
             CREATE INDEX IF NOT EXISTS idx_wallets_stats_address ON wallets_stats(wallet_address);
-
-            CREATE INDEX IF NOT EXISTS idx_market_tags_label ON market_tags(tag_label);
-            CREATE INDEX IF NOT EXISTS idx_market_tags_market_id ON market_tags(market_id);
-            CREATE INDEX IF NOT EXISTS idx_amo_market_id ON active_market_outcomes(market_id);
-            CREATE INDEX IF NOT EXISTS idx_amo_condition_id ON active_market_outcomes(condition_id);
-            CREATE INDEX IF NOT EXISTS idx_amo_outcome_index ON active_market_outcomes(outcome_index);
-            CREATE INDEX IF NOT EXISTS idx_amo_volume ON active_market_outcomes(volume_usd DESC);
-            CREATE INDEX IF NOT EXISTS idx_amo_liquidity ON active_market_outcomes(liquidity_usd DESC);
-            CREATE INDEX IF NOT EXISTS idx_amo_end_date ON active_market_outcomes(end_date);
-            
-            -- Missing indices for sliders (Critical for performance)
-            CREATE INDEX IF NOT EXISTS idx_amo_price ON active_market_outcomes(price);
-            CREATE INDEX IF NOT EXISTS idx_amo_spread ON active_market_outcomes(spread);
-            CREATE INDEX IF NOT EXISTS idx_amo_apr ON active_market_outcomes(apr);
-            
-            -- Text Search Indices (helps with sorting/exact match)
-            CREATE INDEX IF NOT EXISTS idx_amo_question ON active_market_outcomes(question);
-            CREATE INDEX IF NOT EXISTS idx_amo_outcome ON active_market_outcomes(outcome_name);
-            
-            ANALYZE;
         """)
+
+        # Snapshot tables (active_market_outcomes, market_tags) normally arrive fully indexed from the
+        # scraper's staging swap; this only backfills indexes on databases from before that flow.
+        ensure_snapshot_indexes(conn)
+        ensure_search_index(conn)
+        ensure_smart_money_dirty_tracking(conn)
+        ensure_holder_changes_schema(conn)
+        ensure_data_versions_schema(conn)
+        ensure_price_history_schema(conn)
+        conn.execute("ANALYZE;")
         conn.commit()
         logger.info("Database WAL mode enabled and indices verified.")
     except Exception as e:
@@ -277,20 +315,16 @@ def ensure_indices():
 
 
 def _top_tags(limit: int = 5) -> list[str]:
-    conn = get_db_connection()
-    try:
+    with get_read_connection() as conn:
         rows = conn.execute(
             "SELECT tag_label FROM market_tags GROUP BY tag_label ORDER BY COUNT(*) DESC LIMIT ?",
             (limit,),
         ).fetchall()
         return [r["tag_label"] for r in rows if r and r["tag_label"]]
-    finally:
-        conn.close()
 
 
 def _percentile_value(column: str, quantile: float) -> Optional[float]:
-    conn = get_db_connection()
-    try:
+    with get_read_connection() as conn:
         row = conn.execute(
             f"SELECT COUNT(*) AS n FROM active_market_outcomes WHERE {column} IS NOT NULL"
         ).fetchone()
@@ -305,13 +339,10 @@ def _percentile_value(column: str, quantile: float) -> Optional[float]:
         if not row2 or row2["v"] is None:
             return None
         return float(row2["v"])
-    finally:
-        conn.close()
 
 
 def _compute_hours_to_expire_default() -> int:
-    conn = get_db_connection()
-    try:
+    with get_read_connection() as conn:
         row = conn.execute(
             """
             SELECT end_date FROM active_market_outcomes
@@ -336,16 +367,14 @@ def _compute_hours_to_expire_default() -> int:
         now = datetime.now(end_dt.tzinfo)
         hours = int(((end_dt - now).total_seconds() / 3600.0) + 1.0)
         return max(1, min(hours, 24 * 14))
-    finally:
-        conn.close()
 
 
-def refresh_materialized_smart_money_stats() -> str:
+def refresh_materialized_smart_money_stats(full: bool = False) -> str:
     conn = get_db_connection()
     try:
-        updated_at = rebuild_market_smart_money_stats(conn)
+        result = refresh_market_smart_money_stats(conn, full=full)
         conn.commit()
-        return updated_at
+        return result["updated_at"]
     finally:
         conn.close()
 
@@ -359,6 +388,74 @@ def refresh_bootstrap_snapshots() -> None:
         conn.close()
 
 
+# /api/markets results, keyed by the data version they were read from
+markets_cache = ResultCache()
+read_pool = ReadConnectionPool()
+# Versioned data endpoints may be reused this long without revalidating; kept well under the
+# bootstrap snapshots' s-maxage, since incremental scrapes publish between full ones
+DATA_CACHE_MAX_AGE_SECONDS = int(os.environ.get("DATA_CACHE_MAX_AGE_SECONDS", "60"))
+DATA_CACHE_CONTROL = f"public, max-age={DATA_CACHE_MAX_AGE_SECONDS}, must-revalidate"
+
+
+def _markets_cache_key(token: Optional[tuple], filters: dict, cursor: Optional[str] = None) -> Optional[tuple]:
+    """
+    Identity of a markets result: None when it can't be pinned down, because the database has no
+    markets version to tie it to (data written outside the publish path could change under it).
+    """
+
+    if token is None:
+        return None
+    clock = None
+    if filters["min_hours_to_expire"] or filters["max_hours_to_expire"] or not filters["include_expired"]:
+        clock = int(time.time() // max(1, MARKETS_CACHE_CLOCK_BUCKET_SECONDS))
+    return DB_PATH, token, markets_filter_key(**filters), cursor, clock
+
+
+def _fetch_markets(conn, filters: dict, cache_key: Optional[tuple] = None) -> list[dict[str, Any]]:
+    if cache_key is not None and markets_cache.enabled:
+        cached = markets_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    result = query_markets(conn, **filters)
+    if cache_key is not None:
+        markets_cache.put(cache_key, result)
+    return result
+
+
+def _data_etag(scope: str, key: Optional[tuple]) -> Optional[str]:
+    if key is None:
+        return None
+    return f'"{scope}-{hashlib.sha1(repr(key).encode()).hexdigest()[:24]}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison, so a W/ prefix added by a proxy still matches
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return any(value == "*" or value.removeprefix("W/") == etag for value in candidates)
+
+
+def _conditional_response(request: Optional[Request], response: Optional[Response], etag: Optional[str]) -> Optional[Response]:
+    """
+    Marks a versioned payload cacheable; returns the 304 to send instead when the client already has it.
+    Without an ETag the endpoint's own headers are left as they are.
+    """
+
+    if etag is None:
+        return None
+    headers = {"ETag": etag, "Cache-Control": DATA_CACHE_CONTROL}
+    if request is not None and _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if response is None:
+        return None
+    for name in ("Pragma", "Expires"):
+        if name in response.headers:
+            del response.headers[name]
+    response.headers.update(headers)
+    return None
+
+
 def _load_or_build_snapshot(snapshot_key: str, builder):
     conn = get_db_connection()
     try:
@@ -393,6 +490,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 @app.middleware("http")
@@ -455,24 +553,80 @@ def get_market_holders(market_id: str):
     finally:
         conn.close()
 
+@app.get("/api/markets/{market_id}/history", response_model=List[HistoryPoint])
+def get_market_history(
+    market_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    outcome_index: Optional[int] = None,
+    resolution: Optional[str] = None,
+):
+    """
+    Price/spread/volume/liquidity history for a market (Gamma id or condition id).
+    Defaults to the last 7 days; `resolution` = raw | hour | day.
+    """
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {sorted(RESOLUTIONS)}")
+    try:
+        end_dt = datetime.fromisoformat(end.replace("Z", "+00:00")) if end else datetime.now(timezone.utc)
+        start_dt = datetime.fromisoformat(start.replace("Z", "+00:00")) if start else end_dt - timedelta(days=7)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO 8601 timestamps")
+
+    with get_read_connection() as conn:
+        rows = query_history(conn, market_id, start_dt, end_dt, outcome_index=outcome_index, resolution=resolution)
+        return [HistoryPoint(**r) for r in rows]
+
+@app.get("/api/whale-moves", response_model=List[WhaleMove])
+def get_whale_moves(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    min_delta: float = 0.0,
+    market_id: Optional[str] = None,
+    wallet: Optional[str] = None,
+    change: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Holder entries, exits and size changes logged by the smart money scraper, newest first.
+    Defaults to the last 24 hours; `change` = enter | exit | resize.
+    """
+    if change is not None and change not in CHANGE_KINDS:
+        raise HTTPException(status_code=400, detail=f"change must be one of {list(CHANGE_KINDS)}")
+    try:
+        until_dt = datetime.fromisoformat(until.replace("Z", "+00:00")) if until else datetime.now(timezone.utc)
+        since_dt = datetime.fromisoformat(since.replace("Z", "+00:00")) if since else until_dt - timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since/until must be ISO 8601 timestamps")
+
+    with get_read_connection() as conn:
+        rows = query_whale_moves(
+            conn, since_dt, until_dt, min_delta=min_delta, market_id=market_id, wallet=wallet, change=change, limit=limit
+        )
+        return [WhaleMove(**r) for r in rows]
+
 @app.get("/api/tags", response_model=List[TagStats])
 
 
-def get_tags():
-    conn = get_db_connection()
-    try:
+def get_tags(request: Request, response: Response):
+    with get_read_connection() as conn:
+        token = markets_data_token(conn)
+        etag = _data_etag("tags", None if token is None else (DB_PATH, token))
+        not_modified = _conditional_response(request, response, etag)
+        if not_modified is not None:
+            return not_modified
         return get_tag_stats(conn)
-    finally:
-        conn.close()
 
 @app.get("/api/status")
-def get_status(response: Response):
+def get_status(request: Request, response: Response):
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    conn = get_db_connection()
-    try:
+    with get_read_connection() as conn:
+        token = markets_data_token(conn)
+        etag = _data_etag("status", None if token is None else (DB_PATH, token))
+        not_modified = _conditional_response(request, response, etag)
+        if not_modified is not None:
+            return not_modified
         return get_status_timestamps(conn)
-    finally:
-        conn.close()
 
 @app.get("/api/markets")
 def get_markets(
@@ -495,7 +649,9 @@ def get_markets(
     search: Optional[str] = None,
     profit_threshold: float = 1000.0,
     min_profitable: int = 0,
-    min_losing_opposite: int = 0
+    min_losing_opposite: int = 0,
+    cursor: Optional[str] = None,
+    request: Request = None,
 ):
     # When calling endpoint functions directly (tests/tools), FastAPI's `Query(...)` defaults
     # are not resolved and can show up as `fastapi.params.Query` instances.
@@ -513,32 +669,50 @@ def get_markets(
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
-    conn = get_db_connection()
-    try:
-        return query_markets(
-            conn,
-            included_tags=included_tags,
-            excluded_tags=excluded_tags,
-            sort_by=sort_by,
-            sort_dir=sort_dir,
-            limit=limit,
-            offset=offset,
-            min_volume=min_volume,
-            min_liquidity=min_liquidity,
-            min_price=min_price,
-            max_price=max_price,
-            max_spread=max_spread,
-            min_apr=min_apr,
-            min_hours_to_expire=min_hours_to_expire,
-            max_hours_to_expire=max_hours_to_expire,
-            include_expired=include_expired,
-            search=search,
-            profit_threshold=profit_threshold,
-            min_profitable=min_profitable,
-            min_losing_opposite=min_losing_opposite,
-        )
-    finally:
-        conn.close()
+    filters = dict(
+        included_tags=included_tags,
+        excluded_tags=excluded_tags,
+        sort_by=sort_by,
+        sort_dir=sort_dir,
+        limit=limit,
+        offset=offset,
+        min_volume=min_volume,
+        min_liquidity=min_liquidity,
+        min_price=min_price,
+        max_price=max_price,
+        max_spread=max_spread,
+        min_apr=min_apr,
+        min_hours_to_expire=min_hours_to_expire,
+        max_hours_to_expire=max_hours_to_expire,
+        include_expired=include_expired,
+        search=search,
+        profit_threshold=profit_threshold,
+        min_profitable=min_profitable,
+        min_losing_opposite=min_losing_opposite,
+    )
+    with get_read_connection() as conn:
+        token = markets_data_token(conn)
+        version = token[0] if token else 0
+        query_filters = filters
+        if cursor:
+            # Keyset paging: the cursor pins the snapshot generation and the last row served
+            try:
+                page = resolve_markets_cursor(conn, cursor, filters)
+            except CursorExpired as e:
+                raise HTTPException(status_code=410, detail=str(e))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            version = page["version"]
+            query_filters = {**filters, "offset": 0, "after": page["after"], "generation": page["generation"]}
+        cache_key = _markets_cache_key(token, filters, cursor)
+        not_modified = _conditional_response(request, response, _data_etag("markets", cache_key))
+        if not_modified is not None:
+            return not_modified
+        rows = _fetch_markets(conn, query_filters, cache_key)
+    next_cursor = next_markets_cursor(version, filters, rows, smart_money_version=token[1] if token else 0)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 
 @app.get("/api/homepage-bootstrap")
@@ -586,7 +760,9 @@ def get_admin_stats(request: Request, days: int = 1):
         "period": f"Last {days} days",
         "total_requests": count,
         "avg_latency_ms": round(avg_latency or 0, 2),
-        "slowest_queries": [dict(r) for r in slow_queries]
+        "slowest_queries": [dict(r) for r in slow_queries],
+        "markets_cache": markets_cache.stats(),
+        "read_pool": read_pool.stats(),
     }
 
 
@@ -639,7 +815,9 @@ def diagnostics_perf(request: Request, mode: str = "fast"):
     results: list[PerfScenarioResult] = []
     for name, params in scenarios:
         t0 = time.perf_counter()
-        rows = get_markets(Response(), **params)
+        # Straight to the query: timings of cache hits would say nothing about the SQL
+        with get_read_connection() as conn:
+            rows = query_markets(conn, **params)
         t1 = time.perf_counter()
         results.append(
             PerfScenarioResult(
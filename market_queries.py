@@ -1,10 +1,21 @@
 from __future__ import annotations
 
+import base64
+import hashlib
+import json
 import logging
 import time
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
 
+from market_search import SEARCH_TABLE, fts_match_expression, search_table_exists
+from snapshot_tables import (
+    MARKETS_VERSION_KEY,
+    PREV_SUFFIX,
+    SMART_MONEY_VERSION_KEY,
+    get_data_version,
+    prev_name,
+)
 
 logger = logging.getLogger("polylab.market_queries")
 
@@ -24,6 +35,12 @@ VALID_SORTS = {
     "no_losing_count": "COALESCE(msm.no_losing_count, 0)",
     "no_total": "COALESCE(msm.no_total, 0)",
 }
+# Sorts on `market_smart_money_stats`, which is refreshed separately from the market snapshots
+SMART_MONEY_SORTS = frozenset(
+    ("yes_profitable_count", "yes_losing_count", "yes_total", "no_profitable_count", "no_losing_count", "no_total")
+)
+# Best full-text match first for "desc"; only applies to searches served by the FTS index
+RELEVANCE_SORT = "relevance"
 
 
 def _pragma_column_name(row):
@@ -83,8 +100,14 @@ def get_status_timestamps(conn) -> dict[str, Optional[str]]:
     except Exception:
         return {"last_updated": None, "smart_money_last_updated": None}
 
+    last_updated = last_updated_row["last_updated"] if last_updated_row else None
+    # Incremental scrapes only restamp changed markets; the data version records the run itself.
+    version = get_data_version(conn)
+    if version and version.get("updated_at") and (last_updated is None or version["updated_at"] > last_updated):
+        last_updated = version["updated_at"]
+
     return {
-        "last_updated": last_updated_row["last_updated"] if last_updated_row else None,
+        "last_updated": last_updated,
         "smart_money_last_updated": smart_row["smart_money_last_updated"] if smart_row else None,
     }
 
@@ -137,7 +160,14 @@ def build_markets_sql(
     profit_threshold: float = 1000.0,
     min_profitable: int = 0,
     min_losing_opposite: int = 0,
+    after: Optional[tuple[Any, int]] = None,
+    generation: str = "",
 ) -> tuple[str, list[Any]]:
+    """
+    `after` = (sort value, id) of the last row already served switches from OFFSET to keyset paging;
+    `generation` is the snapshot table suffix to read ("" live, `PREV_SUFFIX` previous).
+    """
+
     del profit_threshold
 
     apr_sql = _build_apr_sql(conn)
@@ -190,7 +220,14 @@ def build_markets_sql(
         )
         params.append(int(min_losing_opposite))
 
-    if search:
+    search_table = f"{SEARCH_TABLE}{generation}"
+    match = fts_match_expression(search)
+    if match is not None and not search_table_exists(conn, search_table):
+        match = None
+    if match is not None:
+        where_clauses.append(f"{search_table} MATCH ?")
+        params.append(match)
+    elif search:
         where_clauses.append("(amo.question LIKE ? OR amo.outcome_name LIKE ?)")
         params.append(f"%{search}%")
         params.append(f"%{search}%")
@@ -229,18 +266,43 @@ def build_markets_sql(
     if included_tags:
         placeholders = ",".join("?" * len(included_tags))
         where_clauses.append(
-            f"amo.market_id IN (SELECT market_id FROM market_tags WHERE tag_label IN ({placeholders}))"
+            f"amo.market_id IN (SELECT market_id FROM market_tags{generation} WHERE tag_label IN ({placeholders}))"
         )
         params.extend(included_tags)
 
     if excluded_tags:
         placeholders = ",".join("?" * len(excluded_tags))
         where_clauses.append(
-            f"amo.market_id NOT IN (SELECT market_id FROM market_tags WHERE tag_label IN ({placeholders}))"
+            f"amo.market_id NOT IN (SELECT market_id FROM market_tags{generation} WHERE tag_label IN ({placeholders}))"
         )
         params.extend(excluded_tags)
 
-    sort_sql = VALID_SORTS.get(sort_by, VALID_SORTS["volume_usd"])
+    if sort_by == RELEVANCE_SORT and match is not None:
+        if after is not None:
+            raise ValueError("Keyset paging is not available for relevance order")
+        # bm25() is lower for better matches
+        sort_sql = f"bm25({search_table})"
+        sort_dir = "asc" if sort_dir != "asc" else "desc"
+    else:
+        sort_sql = VALID_SORTS.get(sort_by, VALID_SORTS["volume_usd"])
+    direction = "ASC" if sort_dir == "asc" else "DESC"
+
+    if after is not None:
+        # Same order as ORDER BY below: NULLs sort first ascending, last descending; ties by rowid (= id).
+        key_sql = f"({apr_sql})" if sort_sql == "apr" else sort_sql
+        last_value, last_id = after
+        op = ">" if direction == "ASC" else "<"
+        if last_value is None:
+            clause = f"({key_sql} IS NULL AND amo.rowid {op} ?)"
+            where_clauses.append(f"({clause} OR {key_sql} IS NOT NULL)" if direction == "ASC" else clause)
+            params.append(int(last_id))
+        else:
+            tail = f" OR {key_sql} IS NULL" if direction == "DESC" else ""
+            where_clauses.append(f"(({key_sql} {op}= ? AND ({key_sql} {op} ? OR amo.rowid {op} ?)){tail})")
+            params.extend([last_value, last_value, int(last_id)])
+        offset = 0
+
+    search_join = f"JOIN {search_table} ON {search_table}.rowid = amo.id" if match is not None else ""
     where_sql = " AND ".join(where_clauses)
 
     sql = f"""
@@ -253,17 +315,186 @@ def build_markets_sql(
             COALESCE(msm.no_profitable_count, 0) AS no_profitable_count,
             COALESCE(msm.no_losing_count, 0) AS no_losing_count,
             COALESCE(msm.no_total, 0) AS no_total
-        FROM active_market_outcomes amo
+        FROM active_market_outcomes{generation} amo
+        {search_join}
         LEFT JOIN market_smart_money_stats msm
           ON msm.condition_id = amo.condition_id
         WHERE {where_sql}
-        ORDER BY {sort_sql} {'ASC' if sort_dir == 'asc' else 'DESC'}
+        ORDER BY {sort_sql} {direction}, amo.rowid {direction}
         LIMIT ? OFFSET ?
     """
     params.extend([int(limit), int(offset)])
     return sql, params
 
 
+def _number(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def markets_filter_key(
+    *,
+    included_tags: Optional[list[str]] = None,
+    excluded_tags: Optional[list[str]] = None,
+    sort_by: str = "volume_usd",
+    sort_dir: str = "desc",
+    limit: int = 100,
+    offset: int = 0,
+    min_volume: Optional[float] = 0,
+    min_liquidity: Optional[float] = 0,
+    min_price: Optional[float] = 0.0,
+    max_price: Optional[float] = 1.0,
+    max_spread: Optional[float] = None,
+    min_apr: Optional[float] = None,
+    min_hours_to_expire: Optional[int] = None,
+    max_hours_to_expire: Optional[int] = None,
+    include_expired: bool = True,
+    search: Optional[str] = None,
+    profit_threshold: float = 1000.0,
+    min_profitable: int = 0,
+    min_losing_opposite: int = 0,
+) -> tuple:
+    """
+    Hashable form of `build_markets_sql` filters: filters it treats the same give the same key
+    (tag order and duplicates, `5` vs `5.0`, no-op thresholds, swapped expiry bounds).
+    """
+
+    del profit_threshold
+
+    if min_hours_to_expire is not None and int(min_hours_to_expire) <= 0:
+        min_hours_to_expire = None
+    if max_hours_to_expire is not None and int(max_hours_to_expire) <= 0:
+        max_hours_to_expire = None
+    if min_hours_to_expire is not None and max_hours_to_expire is not None and int(min_hours_to_expire) > int(max_hours_to_expire):
+        min_hours_to_expire, max_hours_to_expire = max_hours_to_expire, min_hours_to_expire
+
+    return (
+        tuple(sorted(normalize_tag_filters(included_tags) or ())),
+        tuple(sorted(normalize_tag_filters(excluded_tags) or ())),
+        sort_by if sort_by in VALID_SORTS or sort_by == RELEVANCE_SORT else "volume_usd",
+        "asc" if sort_dir == "asc" else "desc",
+        int(limit),
+        int(offset),
+        float(min_volume) if min_volume else 0.0,
+        float(min_liquidity) if min_liquidity else 0.0,
+        _number(min_price),
+        _number(max_price),
+        _number(max_spread),
+        float(min_apr) if min_apr is not None and float(min_apr) > 0 else None,
+        None if min_hours_to_expire is None else int(min_hours_to_expire),
+        None if max_hours_to_expire is None else int(max_hours_to_expire),
+        bool(include_expired),
+        search or None,
+        max(0, int(min_profitable)),
+        max(0, int(min_losing_opposite)),
+    )
+
+
+def markets_data_token(conn) -> Optional[tuple[int, int]]:
+    """
+    (markets version, smart-money version) of the data /api/markets reads, or None when the
+    database has no markets version yet (nothing published through the versioned path).
+    """
+
+    markets = get_data_version(conn, MARKETS_VERSION_KEY)
+    if not markets:
+        return None
+    smart_money = get_data_version(conn, SMART_MONEY_VERSION_KEY)
+    return int(markets["version"]), int(smart_money["version"]) if smart_money else 0
+
+
+class CursorExpired(ValueError):
+    """
+    The cursor was issued for a snapshot generation that is neither live nor kept as previous, or
+    for smart-money stats that have changed since.
+    """
+
+
+def _uses_smart_money(filters: dict[str, Any]) -> bool:
+    # Smart-money stats have no `_prev` generation; orders or filters on them can't be pinned
+    return (
+        filters.get("sort_by") in SMART_MONEY_SORTS
+        or int(filters.get("min_profitable") or 0) > 0
+        or int(filters.get("min_losing_opposite") or 0) > 0
+    )
+
+
+def _filters_digest(filters: dict[str, Any]) -> str:
+    # Page size may change between pages; everything else must stay as it was
+    key = markets_filter_key(**{**filters, "limit": 0, "offset": 0})
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+
+
+def _decode_cursor(cursor: str) -> dict[str, Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        position = {"v": int(data["v"]), "f": str(data["f"]), "k": data["k"], "id": int(data["id"])}
+        position["s"] = int(data["s"]) if data.get("s") is not None else None
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Malformed cursor")
+    if position["k"] is not None and not isinstance(position["k"], (int, float, str)):
+        raise ValueError("Malformed cursor")
+    return position
+
+
+def next_markets_cursor(
+    version: int,
+    filters: dict[str, Any],
+    rows: list[dict[str, Any]],
+    smart_money_version: int = 0,
+) -> Optional[str]:
+    """
+    Opaque cursor for the page after `rows` of snapshot `version`: the last row's sort value and id,
+    plus a digest of the filters. When the sort or filters use smart-money stats it also pins
+    `smart_money_version`. None when the page was not full or the order has no keyset form.
+    """
+
+    sort_by = filters.get("sort_by") or "volume_usd"
+    sort_by = sort_by if sort_by in VALID_SORTS or sort_by == RELEVANCE_SORT else "volume_usd"
+    if sort_by == RELEVANCE_SORT or not rows or len(rows) < int(filters.get("limit", 100)):
+        return None
+    last = rows[-1]
+    if last.get("id") is None:
+        return None
+    data = {"v": int(version), "f": _filters_digest(filters), "k": last.get(sort_by), "id": last["id"]}
+    if _uses_smart_money(filters):
+        data["s"] = int(smart_money_version)
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def resolve_markets_cursor(conn, cursor: str, filters: dict[str, Any]) -> dict[str, Any]:
+    """
+    Keyset arguments for `query_markets` ({"after", "generation"}) and the snapshot version the
+    cursor belongs to. A cursor from the generation before the last publish reads the `_prev`
+    tables, so a client paging through a refresh keeps a consistent result set. Smart-money stats
+    are only kept live, so a cursor that sorts or filters on them expires once they are refreshed.
+
+    Raises ValueError for a malformed cursor or one issued for other filters, `CursorExpired`
+    when its generation (or its smart-money version) is gone.
+    """
+
+    position = _decode_cursor(cursor)
+    if position["f"] != _filters_digest(filters):
+        raise ValueError("Cursor was issued for different filters or sort order")
+    current = get_data_version(conn, MARKETS_VERSION_KEY)
+    live = int(current["version"]) if current else 0
+    if position["v"] == live:
+        generation = ""
+    elif (
+        current
+        and current.get("previous_version") is not None
+        and position["v"] == int(current["previous_version"])
+        and table_exists(conn, prev_name("active_market_outcomes"))
+    ):
+        generation = PREV_SUFFIX
+    else:
+        raise CursorExpired(f"Snapshot {position['v']} is no longer available; start again without a cursor")
+    if position["s"] is not None:
+        smart_money = get_data_version(conn, SMART_MONEY_VERSION_KEY)
+        if position["s"] != (int(smart_money["version"]) if smart_money else 0):
+            raise CursorExpired("Smart-money stats were refreshed since this cursor; start again without a cursor")
+    return {"after": (position["k"], position["id"]), "generation": generation, "version": position["v"]}
+
+
 def query_markets(conn, **kwargs) -> list[dict[str, Any]]:
     sql, params = build_markets_sql(conn, **kwargs)
     cursor = conn.cursor()
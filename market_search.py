@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import Optional
+
+
+logger = logging.getLogger("polylab.market_search")
+
+
+# FTS5 index over active_market_outcomes (rowid = outcome row id). It is a generation artifact like
+# the snapshot indexes: built on staging, renamed with the tables on publish/rollback. Triggers on
+# the outcomes table keep it current through in-place writes; RENAME rewrites their references, so
+# each generation's triggers keep pointing at that generation's index.
+SEARCH_TABLE = "market_search"
+SEARCH_SOURCE_TABLE = "active_market_outcomes"
+SEARCH_TRIGGER_PREFIX = "trg_market_search_"
+
+# The trigram tokenizer keeps the substring semantics of `LIKE '%term%'` ("coin" finds "Bitcoin")
+# while the lookup goes through the index. Diacritics are folded where SQLite supports it (3.45+).
+SEARCH_TOKENIZERS = ("trigram remove_diacritics 1", "trigram")
+# Trigram queries need at least one whole trigram; shorter searches stay on LIKE
+SEARCH_MIN_LENGTH = 3
+
+SEARCH_TABLE_DDL = """
+    CREATE VIRTUAL TABLE {name} USING fts5(
+        question,
+        outcome_name,
+        tokenize = '{tokenizer}'
+    )
+"""
+
+SEARCH_TRIGGERS_DDL = (
+    """
+    CREATE TRIGGER {trigger}ai{slot} AFTER INSERT ON {source} BEGIN
+        INSERT INTO {name} (rowid, question, outcome_name) VALUES (new.id, new.question, new.outcome_name);
+    END
+    """,
+    """
+    CREATE TRIGGER {trigger}ad{slot} AFTER DELETE ON {source} BEGIN
+        DELETE FROM {name} WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER {trigger}au{slot} AFTER UPDATE OF id, question, outcome_name ON {source} BEGIN
+        DELETE FROM {name} WHERE rowid = old.id;
+        INSERT INTO {name} (rowid, question, outcome_name) VALUES (new.id, new.question, new.outcome_name);
+    END
+    """,
+)
+
+# Searches with LIKE wildcards keep their wildcard meaning on LIKE
+_LIKE_WILDCARDS = re.compile(r"[%_]")
+
+_search_tokenizer: Optional[str] = None
+_search_tokenizer_probed = False
+
+
+def search_tokenizer(conn) -> Optional[str]:
+    """
+    The best FTS5 tokenizer from `SEARCH_TOKENIZERS` this SQLite supports, or None (no FTS5 or no trigram).
+    """
+
+    global _search_tokenizer, _search_tokenizer_probed
+    if not _search_tokenizer_probed:
+        for tokenizer in SEARCH_TOKENIZERS:
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize = '{tokenizer}')")
+                conn.execute("DROP TABLE temp._fts5_probe")
+                _search_tokenizer = tokenizer
+                break
+            except Exception:
+                continue
+        else:
+            logger.warning("SQLite has no FTS5 trigram tokenizer; market search stays on LIKE")
+        _search_tokenizer_probed = True
+    return _search_tokenizer
+
+
+def search_table_exists(conn, name: str = SEARCH_TABLE) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ? LIMIT 1", (name,)).fetchone()
+    return bool(row)
+
+
+def _trigger_names(conn, table: Optional[str] = None) -> set[str]:
+    sql = "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?"
+    params: tuple = (f"{SEARCH_TRIGGER_PREFIX}%",)
+    if table is not None:
+        sql += " AND tbl_name = ?"
+        params += (table,)
+    return {row[0] for row in conn.execute(sql, params).fetchall()}
+
+
+def _free_trigger_slot(conn) -> str:
+    # Trigger names are global and travel with their table, like the snapshot index names
+    used = _trigger_names(conn)
+    generation = 0
+    while True:
+        slot = f"_g{generation}" if generation else ""
+        if not any(f"{SEARCH_TRIGGER_PREFIX}{kind}{slot}" in used for kind in ("ai", "ad", "au")):
+            return slot
+        generation += 1
+
+
+def build_search_index(conn, name: str = SEARCH_TABLE, source: str = SEARCH_SOURCE_TABLE) -> bool:
+    """
+    (Re)creates `name` from every row of `source` and the triggers that keep it in sync.
+    Returns False when FTS5 is not available.
+    """
+
+    tokenizer = search_tokenizer(conn)
+    if tokenizer is None:
+        return False
+    for trigger in _trigger_names(conn, source):
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.execute(SEARCH_TABLE_DDL.format(name=name, tokenizer=tokenizer))
+    conn.execute(f"INSERT INTO {name} (rowid, question, outcome_name) SELECT id, question, outcome_name FROM {source}")
+    conn.execute(f"INSERT INTO {name} ({name}) VALUES ('optimize')")
+    slot = _free_trigger_slot(conn)
+    for ddl in SEARCH_TRIGGERS_DDL:
+        conn.execute(ddl.format(trigger=SEARCH_TRIGGER_PREFIX, slot=slot, source=source, name=name))
+    return True
+
+
+def _is_trigram_index(conn, name: str = SEARCH_TABLE) -> bool:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return bool(row) and "trigram" in (row[0] or "")
+
+
+def ensure_search_index(conn) -> bool:
+    """
+    Builds the live index on databases from before it existed (or from before it was a trigram
+    index). Returns whether one is in place.
+    """
+
+    if search_table_exists(conn) and _is_trigram_index(conn):
+        return True
+    if not search_table_exists(conn, SEARCH_SOURCE_TABLE):
+        return False
+    return build_search_index(conn)
+
+
+def fts_match_expression(search: Optional[str]) -> Optional[str]:
+    """
+    FTS5 query matching the rows `LIKE '%search%'` matches on question or outcome name: the whole
+    string as one trigram phrase ("coin" -> `"coin"`, finds "Bitcoin"). None when `search` is too
+    short for a trigram or uses LIKE wildcards, so it stays on LIKE.
+    """
+
+    if not search or len(search) < SEARCH_MIN_LENGTH or _LIKE_WILDCARDS.search(search):
+        return None
+    return '"' + search.replace('"', '""') + '"'
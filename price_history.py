@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+logger = logging.getLogger("polylab.price_history")
+
+
+# Tiers are disjoint in time: raw samples older than the raw retention are rolled up into hourly
+# buckets (and deleted), hourly into daily, and daily rows past their retention are dropped.
+# At hourly scrapes each outcome holds at most about 24*RAW + 24*HOURLY + DAILY rows
+# (~700 with the defaults), at roughly 20-25 bytes each.
+HISTORY_RAW_RETENTION_DAYS = float(os.environ.get("HISTORY_RAW_RETENTION_DAYS", "2"))
+HISTORY_HOURLY_RETENTION_DAYS = float(os.environ.get("HISTORY_HOURLY_RETENTION_DAYS", "14"))
+HISTORY_DAILY_RETENTION_DAYS = float(os.environ.get("HISTORY_DAILY_RETENTION_DAYS", "365"))
+
+RESOLUTION_RAW = 0
+RESOLUTION_HOUR = 3600
+RESOLUTION_DAY = 86400
+RESOLUTIONS = {"raw": RESOLUTION_RAW, "hour": RESOLUTION_HOUR, "day": RESOLUTION_DAY}
+
+# Prices/spreads are stored as integers in 1e-4 units, volume/liquidity in whole USD, timestamps
+# in unix seconds, so most rows encode as small varints.
+PRICE_SCALE = 10000
+
+
+def ensure_price_history_schema(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS history_outcomes (
+            outcome_key INTEGER PRIMARY KEY,
+            market_id TEXT NOT NULL,
+            condition_id TEXT,
+            outcome_index INTEGER NOT NULL,
+            UNIQUE (market_id, outcome_index)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_outcomes_condition ON history_outcomes(condition_id)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_history (
+            outcome_key INTEGER NOT NULL,
+            resolution INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            price INTEGER,
+            price_low INTEGER,
+            price_high INTEGER,
+            spread INTEGER,
+            volume INTEGER,
+            liquidity INTEGER,
+            PRIMARY KEY (outcome_key, resolution, ts)
+        ) WITHOUT ROWID
+        """
+    )
+    # Compaction selects whole tiers by age; without this each hourly run scans the full table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_price_history_resolution_ts ON price_history(resolution, ts)")
+
+
+def _to_unix(value: str | datetime) -> int:
+    if isinstance(value, str):
+        value = value.strip()
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def record_snapshot(conn, snapshot_at: str) -> int:
+    """
+    Appends one raw sample per live outcome (from `active_market_outcomes`) at `snapshot_at`.
+    Runs in the caller's transaction; returns the number of samples written.
+    """
+
+    ensure_price_history_schema(conn)
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO history_outcomes (market_id, condition_id, outcome_index)
+        SELECT market_id, MAX(condition_id), outcome_index
+        FROM active_market_outcomes
+        WHERE market_id IS NOT NULL AND outcome_index IS NOT NULL
+        GROUP BY market_id, outcome_index
+        """
+    )
+    cur = conn.execute(
+        f"""
+        INSERT OR REPLACE INTO price_history (
+            outcome_key, resolution, ts, price, price_low, price_high, spread, volume, liquidity
+        )
+        SELECT
+            ho.outcome_key, {RESOLUTION_RAW}, ?,
+            CAST(ROUND(amo.price * {PRICE_SCALE}) AS INTEGER), NULL, NULL,
+            CAST(ROUND(amo.spread * {PRICE_SCALE}) AS INTEGER),
+            CAST(ROUND(amo.volume_usd) AS INTEGER),
+            CAST(ROUND(amo.liquidity_usd) AS INTEGER)
+        FROM active_market_outcomes amo
+        JOIN history_outcomes ho ON ho.market_id = amo.market_id AND ho.outcome_index = amo.outcome_index
+        """,
+        (_to_unix(snapshot_at),),
+    )
+    return max(0, cur.rowcount)
+
+
+def _rollup(conn, source: int, target: int, cutoff: int) -> int:
+    # Whole target buckets strictly before `cutoff` only, so each bucket is rolled up exactly once.
+    cutoff -= cutoff % target
+    # Bare columns next to MAX(ts) come from the latest row of the bucket (close values).
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO price_history (
+            outcome_key, resolution, ts, price, price_low, price_high, spread, volume, liquidity
+        )
+        SELECT outcome_key, {target}, bucket, price, low, high, spread, volume, liquidity
+        FROM (
+            SELECT
+                outcome_key,
+                (ts / {target}) * {target} AS bucket,
+                MAX(ts),
+                price,
+                MIN(COALESCE(price_low, price)) AS low,
+                MAX(COALESCE(price_high, price)) AS high,
+                spread, volume, liquidity
+            FROM price_history
+            WHERE resolution = ? AND ts < ?
+            GROUP BY outcome_key, bucket
+        )
+        """,
+        (source, cutoff),
+    )
+    cur = conn.execute("DELETE FROM price_history WHERE resolution = ? AND ts < ?", (source, cutoff))
+    return max(0, cur.rowcount)
+
+
+def compact_history(conn, now: Optional[datetime] = None) -> dict[str, int]:
+    """
+    Applies downsampling (raw -> hourly -> daily) and daily retention. Runs in the caller's transaction.
+    """
+
+    ensure_price_history_schema(conn)
+    now_ts = _to_unix(now or datetime.now(timezone.utc))
+    raw = _rollup(conn, RESOLUTION_RAW, RESOLUTION_HOUR, now_ts - int(HISTORY_RAW_RETENTION_DAYS * 86400))
+    hourly = _rollup(conn, RESOLUTION_HOUR, RESOLUTION_DAY, now_ts - int(HISTORY_HOURLY_RETENTION_DAYS * 86400))
+    cur = conn.execute(
+        "DELETE FROM price_history WHERE resolution = ? AND ts < ?",
+        (RESOLUTION_DAY, now_ts - int(HISTORY_DAILY_RETENTION_DAYS * 86400)),
+    )
+    expired = max(0, cur.rowcount)
+    if expired:
+        # Outcomes with no samples left anywhere
+        conn.execute(
+            """
+            DELETE FROM history_outcomes
+            WHERE NOT EXISTS (SELECT 1 FROM price_history ph WHERE ph.outcome_key = history_outcomes.outcome_key)
+            """
+        )
+    return {"raw_rolled_up": raw, "hourly_rolled_up": hourly, "daily_expired": expired}
+
+
+def record_and_compact(conn, snapshot_at: str) -> int:
+    """
+    Scraper hook: records the published snapshot and compacts older tiers in one transaction.
+    """
+
+    try:
+        samples = record_snapshot(conn, snapshot_at)
+        stats = compact_history(conn, datetime.fromtimestamp(_to_unix(snapshot_at), tz=timezone.utc))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    logger.info(
+        "Price history: %d samples recorded, %d raw / %d hourly rolled up, %d daily expired",
+        samples, stats["raw_rolled_up"], stats["hourly_rolled_up"], stats["daily_expired"],
+    )
+    return samples
+
+
+def query_history(
+    conn,
+    market_id: str,
+    start: str | datetime,
+    end: str | datetime,
+    outcome_index: Optional[int] = None,
+    resolution: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    """
+    Samples for a market (Gamma market id or condition id) between `start` and `end`, across all tiers,
+    ordered by outcome and time. `resolution` ("hour"/"day") additionally buckets finer samples on read.
+
+    Each outcome is one primary-key range seek per tier.
+    """
+
+    try:
+        keys = conn.execute(
+            """
+            SELECT outcome_key, outcome_index FROM history_outcomes
+            WHERE market_id = ? OR condition_id = ?
+            ORDER BY outcome_index
+            """,
+            (market_id, market_id),
+        ).fetchall()
+    except Exception:
+        return []
+    start_ts, end_ts = _to_unix(start), _to_unix(end)
+    bucket = RESOLUTIONS.get(resolution or "raw", RESOLUTION_RAW)
+
+    points: list[dict[str, Any]] = []
+    for outcome_key, idx in keys:
+        if outcome_index is not None and idx != outcome_index:
+            continue
+        rows: list[tuple] = []
+        for tier in (RESOLUTION_DAY, RESOLUTION_HOUR, RESOLUTION_RAW):
+            rows.extend(
+                conn.execute(
+                    """
+                    SELECT resolution, ts, price, price_low, price_high, spread, volume, liquidity
+                    FROM price_history
+                    WHERE outcome_key = ? AND resolution = ? AND ts >= ? AND ts <= ?
+                    ORDER BY ts
+                    """,
+                    (outcome_key, tier, start_ts, end_ts),
+                ).fetchall()
+            )
+        rows.sort(key=lambda r: r[1])
+        if bucket:
+            rows = _bucket_rows(rows, bucket)
+        for res, ts, price, low, high, spread, volume, liquidity in rows:
+            points.append(
+                {
+                    "outcome_index": idx,
+                    "ts": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+                    "resolution": res,
+                    "price": _unscale(price),
+                    "price_low": _unscale(low if low is not None else price),
+                    "price_high": _unscale(high if high is not None else price),
+                    "spread": _unscale(spread),
+                    "volume_usd": volume,
+                    "liquidity_usd": liquidity,
+                }
+            )
+    return points
+
+
+def _bucket_rows(rows: list[tuple], bucket: int) -> list[tuple]:
+    out: list[tuple] = []
+    for row in rows:
+        res, ts, price, low, high, spread, volume, liquidity = row
+        if res >= bucket:
+            out.append(row)
+            continue
+        start = (ts // bucket) * bucket
+        low = price if low is None else low
+        high = price if high is None else high
+        if out and out[-1][0] == bucket and out[-1][1] == start:
+            low = min(low, out[-1][3])
+            high = max(high, out[-1][4])
+            out[-1] = (bucket, start, price, low, high, spread, volume, liquidity)
+        else:
+            out.append((bucket, start, price, low, high, spread, volume, liquidity))
+    return out
+
+
+def _unscale(value: Optional[int]) -> Optional[float]:
+    return None if value is None else value / PRICE_SCALE
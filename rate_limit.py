@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+
+logger = logging.getLogger("polylab.rate_limit")
+
+
+# Per-host request budget for the Gamma crawls (requests/second and burst size)
+GAMMA_RATE_LIMIT_RPS = float(os.environ.get("GAMMA_RATE_LIMIT_RPS", "25"))
+GAMMA_RATE_LIMIT_BURST = float(os.environ.get("GAMMA_RATE_LIMIT_BURST", "50"))
+# Upper bound on a single server-requested pause, so a bogus header cannot stall a run
+RATE_LIMIT_MAX_RETRY_AFTER = float(os.environ.get("RATE_LIMIT_MAX_RETRY_AFTER", "120"))
+
+THROTTLE_STATUSES = (429, 503)
+
+# Adaptive (AIMD) concurrency window per upstream host: starting size, bounds and the cut factor
+ADAPTIVE_INITIAL_WINDOW = float(os.environ.get("ADAPTIVE_INITIAL_WINDOW", "8"))
+ADAPTIVE_MIN_WINDOW = float(os.environ.get("ADAPTIVE_MIN_WINDOW", "1"))
+ADAPTIVE_MAX_WINDOW = float(os.environ.get("ADAPTIVE_MAX_WINDOW", "64"))
+ADAPTIVE_DECREASE = float(os.environ.get("ADAPTIVE_DECREASE", "0.5"))
+
+# Circuit breaker per upstream backend: outcomes kept, calls needed before judging, failure share that
+# opens it, and how long it stays open before a probe (doubling on each failed probe up to the max)
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("BREAKER_COOLDOWN_SECONDS", "30"))
+BREAKER_MAX_COOLDOWN_SECONDS = float(os.environ.get("BREAKER_MAX_COOLDOWN_SECONDS", "600"))
+
+
+def parse_retry_after(value: Any, now: Optional[datetime] = None) -> Optional[float]:
+    """
+    `Retry-After` as seconds to wait (delta-seconds or HTTP-date form), capped; None if absent/invalid.
+    """
+
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when is None:
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        seconds = (when - (now or datetime.now(timezone.utc))).total_seconds()
+    return min(max(0.0, seconds), RATE_LIMIT_MAX_RETRY_AFTER)
+
+
+def retry_after_from(response: Any) -> Optional[float]:
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return parse_retry_after(headers.get("Retry-After"))
+    except Exception:
+        return None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all callers of one upstream host.
+
+    `acquire()` blocks until a token is available. `throttle()` reacts to a 429/503: it halves the
+    refill rate (down to `min_rate`), drains the bucket and pauses every caller until the
+    server-provided `Retry-After` has passed. `record_success()` recovers the rate additively
+    toward the configured maximum.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: Optional[float] = None, name: str = ""):
+        self.name = name
+        self.max_rate = max(0.01, float(rate))
+        self.min_rate = max(0.01, float(min_rate)) if min_rate else max(0.01, self.max_rate / 16.0)
+        self.rate = self.max_rate
+        self.burst = max(1.0, float(burst) if burst else self.max_rate)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._updated)
+        self._updated = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+
+    def acquire(self) -> float:
+        """
+        Takes one token, sleeping as needed. Returns the seconds spent waiting.
+        """
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0 and self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.acquired += 1
+                    self.waited_seconds += waited
+                    return waited
+                wait = max(wait, (1.0 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def throttle(self, retry_after: Optional[float] = None) -> float:
+        """
+        Records a throttling response. Returns the pause applied to all callers.
+        """
+
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2.0)
+            self.tokens = 0.0
+            delay = retry_after if retry_after is not None else 1.0 / self.rate
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logger.warning(
+            "Rate limited by %s, pausing %.1fs (rate now %.2f req/s)", self.name or "upstream", delay, self.rate
+        )
+        return delay
+
+    def record_success(self) -> None:
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20.0)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+class AimdConcurrency:
+    """
+    Additive-increase / multiplicative-decrease window on requests in flight to one host.
+
+    `acquire()` blocks while `window` requests are already in flight and returns a ticket that is
+    handed back to `release()` with the outcome. Every success grows the window by 1/window (about
+    +1 per window of successes); a 429/503 or a timeout multiplies it by `decrease`. Only requests
+    issued after the previous cut can cut again, so one burst of throttled responses counts as a
+    single congestion event.
+    """
+
+    def __init__(
+        self,
+        initial: Optional[float] = None,
+        min_window: Optional[float] = None,
+        max_window: Optional[float] = None,
+        decrease: Optional[float] = None,
+        name: str = "",
+    ):
+        self.name = name
+        self.min_window = max(1.0, float(min_window if min_window is not None else ADAPTIVE_MIN_WINDOW))
+        self.max_window = max(self.min_window, float(max_window if max_window is not None else ADAPTIVE_MAX_WINDOW))
+        self.decrease = min(0.95, max(0.05, float(decrease if decrease is not None else ADAPTIVE_DECREASE)))
+        start = float(initial if initial is not None else ADAPTIVE_INITIAL_WINDOW)
+        self.window = min(self.max_window, max(self.min_window, start))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.successes = 0
+        self.throttle_events = 0
+        self.timeouts = 0
+        self.cuts = 0
+        self._generation = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        with self._cond:
+            while self.in_flight >= int(self.window):
+                self._cond.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self._generation
+
+    def release(self, ticket: int, outcome: str = "ok") -> None:
+        """
+        `outcome` is "ok", "throttled", "timeout" or "error" (neutral: neither grows nor cuts).
+        """
+
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if outcome == "ok":
+                self.successes += 1
+                self.window = min(self.max_window, self.window + 1.0 / self.window)
+            elif outcome in ("throttled", "timeout"):
+                if outcome == "throttled":
+                    self.throttle_events += 1
+                else:
+                    self.timeouts += 1
+                if ticket == self._generation:
+                    self._generation += 1
+                    self.cuts += 1
+                    self.window = max(self.min_window, self.window * self.decrease)
+                    logger.warning(
+                        "Upstream %s %s, concurrency window cut to %d", self.name or "host", outcome, int(self.window)
+                    )
+            self._cond.notify_all()
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "successes": self.successes,
+                "throttle_events": self.throttle_events,
+                "timeouts": self.timeouts,
+                "cuts": self.cuts,
+            }
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker for one upstream backend.
+
+    Closed: calls pass and the outcomes of the last `window` calls are kept; once `min_calls` are in
+    and the failure share reaches `error_rate`, it opens. Open: `allow()` refuses calls until the
+    cooldown has passed, then the breaker goes half-open and lets a single probe through. A good
+    probe closes it with a clean history; a bad one re-opens it with twice the cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str = "",
+        window: Optional[int] = None,
+        min_calls: Optional[int] = None,
+        error_rate: Optional[float] = None,
+        cooldown: Optional[float] = None,
+        max_cooldown: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.window = max(1, int(window if window is not None else BREAKER_WINDOW))
+        self.min_calls = max(1, min(self.window, int(min_calls if min_calls is not None else BREAKER_MIN_CALLS)))
+        self.error_rate = float(error_rate if error_rate is not None else BREAKER_ERROR_RATE)
+        self.base_cooldown = float(cooldown if cooldown is not None else BREAKER_COOLDOWN_SECONDS)
+        self.max_cooldown = max(self.base_cooldown, float(max_cooldown if max_cooldown is not None else BREAKER_MAX_COOLDOWN_SECONDS))
+        self.clock = clock
+        self.state = self.CLOSED
+        self.cooldown = self.base_cooldown
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+        self.successes = 0
+        self.failures = 0
+        self._outcomes: list[bool] = []
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self.probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def _open(self) -> None:
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self.opened += 1
+        logger.warning("Circuit %s open for %.0fs", self.name or "breaker", self.cooldown)
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.successes += 1
+            else:
+                self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if ok:
+                    self.state = self.CLOSED
+                    self.cooldown = self.base_cooldown
+                    self._outcomes = []
+                    logger.info("Circuit %s closed after a successful probe", self.name or "breaker")
+                else:
+                    self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    self._open()
+                return
+            if self.state == self.OPEN:
+                return  # a call admitted before the breaker opened
+            self._outcomes.append(ok)
+            if len(self._outcomes) > self.window:
+                del self._outcomes[0]
+            if len(self._outcomes) >= self.min_calls:
+                failed = self._outcomes.count(False)
+                if failed / len(self._outcomes) >= self.error_rate:
+                    self._outcomes = []
+                    self._open()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            recent = len(self._outcomes)
+            return {
+                "state": self.state,
+                "error_rate": round(self._outcomes.count(False) / recent, 3) if recent else 0.0,
+                "successes": self.successes,
+                "failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "probes": self.probes,
+            }
+
+
+_limiters: dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str, rate: Optional[float] = None, burst: Optional[float] = None) -> TokenBucket:
+    """
+    Process-wide limiter for `name` (usually an upstream host), created on first use.
+    """
+
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = TokenBucket(
+                    rate if rate is not None else GAMMA_RATE_LIMIT_RPS,
+                    burst if burst is not None else GAMMA_RATE_LIMIT_BURST,
+                    name=name,
+                )
+                _limiters[name] = limiter
+    return limiter
+
+
+def log_rate_limit_stats(prefix: str = "Rate limit") -> None:
+    for name, limiter in list(_limiters.items()):
+        stats = limiter.stats()
+        if stats["acquired"]:
+            logger.info(
+                "%s %s: %d requests, %d throttled, %.1fs waited, rate %.2f/%.2f req/s",
+                prefix, name, stats["acquired"], stats["throttled"], stats["waited_seconds"],
+                stats["rate"], stats["max_rate"],
+            )
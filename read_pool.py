@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from snapshot_tables import get_data_version
+
+
+logger = logging.getLogger("polylab.read_pool")
+
+
+# Tuning of the API's read connections; the pages they cache survive across requests
+SQLITE_READ_MMAP_SIZE = int(os.environ.get("SQLITE_READ_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative = KiB, as in PRAGMA cache_size
+SQLITE_READ_CACHE_SIZE = int(os.environ.get("SQLITE_READ_CACHE_SIZE", str(-64 * 1024)))
+SQLITE_READ_TEMP_STORE = os.environ.get("SQLITE_READ_TEMP_STORE", "MEMORY").upper()
+SQLITE_READ_STATEMENT_CACHE = int(os.environ.get("SQLITE_READ_STATEMENT_CACHE", "256"))
+
+_TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+
+
+def _file_identity(path: str) -> Optional[tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _generation(conn) -> Optional[int]:
+    version = get_data_version(conn)
+    return version["version"] if version else None
+
+
+class _Slot:
+    __slots__ = ("conn", "path", "identity", "generation")
+
+    def __init__(self, conn: sqlite3.Connection, path: str, identity, generation):
+        self.conn = conn
+        self.path = path
+        self.identity = identity
+        self.generation = generation
+
+
+class ReadConnectionPool:
+    """
+    One read-only connection per thread (`mode=ro`), kept open so its page cache, mmap and
+    prepared statements are reused by the next request on that thread.
+
+    A connection is replaced when the database path changes, when the file at that path is a
+    different file (swapped in by a copy/restore), or when the markets snapshot generation moves,
+    so a new snapshot starts from a fresh cache instead of pages of the old tables.
+    """
+
+    def __init__(
+        self,
+        mmap_size: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        temp_store: Optional[str] = None,
+        statement_cache: Optional[int] = None,
+    ):
+        self.mmap_size = SQLITE_READ_MMAP_SIZE if mmap_size is None else mmap_size
+        self.cache_size = SQLITE_READ_CACHE_SIZE if cache_size is None else cache_size
+        temp_store = (temp_store or SQLITE_READ_TEMP_STORE).upper()
+        self.temp_store = temp_store if temp_store in _TEMP_STORES else "MEMORY"
+        self.statement_cache = SQLITE_READ_STATEMENT_CACHE if statement_cache is None else statement_cache
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open: set[sqlite3.Connection] = set()
+        self.opened = 0
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        uri = f"{Path(path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=self.statement_cache, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA temp_store = {self.temp_store}")
+        with self._lock:
+            self._open.add(conn)
+            self.opened += 1
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._open.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _checkout(self, path: str) -> sqlite3.Connection:
+        slot: Optional[_Slot] = getattr(self._local, "slot", None)
+        identity = _file_identity(path)
+        if slot is not None:
+            if slot.path == path and slot.identity == identity and _generation(slot.conn) == slot.generation:
+                return slot.conn
+            self._discard(slot.conn)
+            self._local.slot = None
+
+        conn = self._connect(path)
+        self._local.slot = _Slot(conn, path, identity, _generation(conn))
+        return conn
+
+    @contextmanager
+    def connection(self, path: str) -> Iterator[sqlite3.Connection]:
+        """
+        The calling thread's read connection to `path`. Falls back to a one-off connection when the
+        file can't be opened read-only (e.g. it doesn't exist yet).
+        """
+
+        try:
+            conn = self._checkout(path)
+        except sqlite3.OperationalError as e:
+            logger.warning("Read-only connection to %s failed (%s); using a one-off connection", path, e)
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns, self._open = list(self._open), set()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open": len(self._open), "opened": self.opened}
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+
+logger = logging.getLogger("polylab.refresh_planner")
+
+
+# Wallets whose PnL was refreshed within this many hours are skipped (0 refreshes every wallet every run)
+SMART_MONEY_PNL_TTL_HOURS = float(os.environ.get("SMART_MONEY_PNL_TTL_HOURS", "24"))
+# PnL API calls allowed per run (0 = no cap); the stalest, most exposed wallets go first
+SMART_MONEY_PNL_BUDGET = int(os.environ.get("SMART_MONEY_PNL_BUDGET", "0"))
+
+# Holder refresh tiers: a market lands in the first tier whose volume, liquidity or time-to-expiry
+# threshold it meets, and is due once its holders are older than that tier's interval
+HOLDERS_HOT_MIN_VOLUME = float(os.environ.get("HOLDERS_HOT_MIN_VOLUME", "1000000"))
+HOLDERS_HOT_MIN_LIQUIDITY = float(os.environ.get("HOLDERS_HOT_MIN_LIQUIDITY", "100000"))
+HOLDERS_HOT_MAX_HOURS_TO_EXPIRE = float(os.environ.get("HOLDERS_HOT_MAX_HOURS_TO_EXPIRE", "48"))
+HOLDERS_HOT_INTERVAL_HOURS = float(os.environ.get("HOLDERS_HOT_INTERVAL_HOURS", "1"))
+HOLDERS_WARM_MIN_VOLUME = float(os.environ.get("HOLDERS_WARM_MIN_VOLUME", "50000"))
+HOLDERS_WARM_MIN_LIQUIDITY = float(os.environ.get("HOLDERS_WARM_MIN_LIQUIDITY", "10000"))
+HOLDERS_WARM_MAX_HOURS_TO_EXPIRE = float(os.environ.get("HOLDERS_WARM_MAX_HOURS_TO_EXPIRE", "168"))
+HOLDERS_WARM_INTERVAL_HOURS = float(os.environ.get("HOLDERS_WARM_INTERVAL_HOURS", "6"))
+HOLDERS_COLD_INTERVAL_HOURS = float(os.environ.get("HOLDERS_COLD_INTERVAL_HOURS", "24"))
+# Holder API calls allowed per run (0 = no cap); hot tiers are served first
+HOLDERS_REFRESH_BUDGET = int(os.environ.get("HOLDERS_REFRESH_BUDGET", "0"))
+# A market counts as due this much before its interval ends, so an hourly job keeps an hourly tier hourly
+HOLDERS_SCHEDULE_SLACK_MINUTES = float(os.environ.get("HOLDERS_SCHEDULE_SLACK_MINUTES", "10"))
+
+
+@dataclass
+class PnlRefreshPlan:
+    refresh: list[str] = field(default_factory=list)  # wallets to fetch, highest priority first
+    fresh: list[str] = field(default_factory=list)  # refreshed within the TTL
+    deferred: list[str] = field(default_factory=list)  # due, but over this run's call budget
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def _wallet_state(conn, wallets: list[str]) -> dict[str, tuple[Optional[str], float]]:
+    """
+    {wallet: (wallets_stats.last_updated, position size held across active markets)}.
+    """
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _pnl_plan_wallets (address TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM _pnl_plan_wallets")
+    conn.executemany("INSERT OR IGNORE INTO _pnl_plan_wallets (address) VALUES (?)", ((w,) for w in wallets))
+    try:
+        rows = conn.execute(
+            """
+            SELECT w.address,
+                   ws.last_updated,
+                   (SELECT COALESCE(SUM(h.position_size), 0)
+                      FROM holders h
+                     WHERE h.wallet_address = w.address
+                       AND h.market_id IN (SELECT condition_id FROM active_market_outcomes)) AS exposure
+            FROM _pnl_plan_wallets w
+            LEFT JOIN wallets_stats ws ON ws.wallet_address = w.address
+            """
+        ).fetchall()
+    finally:
+        conn.execute("DELETE FROM _pnl_plan_wallets")
+    return {row[0]: (row[1], float(row[2] or 0.0)) for row in rows}
+
+
+def plan_pnl_refresh(
+    conn,
+    wallets: Iterable[str],
+    ttl_hours: Optional[float] = None,
+    budget: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> PnlRefreshPlan:
+    """
+    Splits `wallets` into those to refresh now (priority order), those still fresh and those deferred.
+
+    Wallets never fetched come first (largest position first). The rest are ranked by hours since
+    the last refresh, weighted by the log of their position size across active markets, so a
+    stale whale outranks a slightly staler dust wallet.
+    """
+
+    ttl = SMART_MONEY_PNL_TTL_HOURS if ttl_hours is None else ttl_hours
+    cap = SMART_MONEY_PNL_BUDGET if budget is None else budget
+    now = now or datetime.now(timezone.utc)
+
+    wallets = list(dict.fromkeys(wallets))
+    state = _wallet_state(conn, wallets)
+    plan = PnlRefreshPlan()
+    ranked = []
+    for wallet in wallets:
+        last_updated, exposure = state.get(wallet, (None, 0.0))
+        last = _parse_ts(last_updated)
+        if last is None:
+            ranked.append(((0, -exposure), wallet))
+            continue
+        age_hours = max(0.0, (now - last).total_seconds() / 3600.0)
+        if ttl > 0 and age_hours < ttl:
+            plan.fresh.append(wallet)
+            continue
+        ranked.append(((1, -age_hours * (1.0 + math.log10(1.0 + max(0.0, exposure)))), wallet))
+
+    ranked.sort(key=lambda item: item[0])
+    due = [wallet for _, wallet in ranked]
+    if cap and cap > 0:
+        plan.refresh, plan.deferred = due[:cap], due[cap:]
+    else:
+        plan.refresh = due
+    return plan
+
+
+@dataclass(frozen=True)
+class HolderTier:
+    name: str
+    interval_hours: float
+    min_volume: Optional[float] = None
+    min_liquidity: Optional[float] = None
+    max_hours_to_expire: Optional[float] = None
+
+    def matches(self, volume: float, liquidity: float, hours_to_expire: Optional[float]) -> bool:
+        thresholds = (self.min_volume, self.min_liquidity, self.max_hours_to_expire)
+        if all(t is None for t in thresholds):
+            return True
+        if self.min_volume is not None and volume >= self.min_volume:
+            return True
+        if self.min_liquidity is not None and liquidity >= self.min_liquidity:
+            return True
+        return (
+            self.max_hours_to_expire is not None
+            and hours_to_expire is not None
+            and 0 <= hours_to_expire <= self.max_hours_to_expire
+        )
+
+
+def default_holder_tiers() -> list[HolderTier]:
+    return [
+        HolderTier("hot", HOLDERS_HOT_INTERVAL_HOURS, HOLDERS_HOT_MIN_VOLUME, HOLDERS_HOT_MIN_LIQUIDITY,
+                   HOLDERS_HOT_MAX_HOURS_TO_EXPIRE),
+        HolderTier("warm", HOLDERS_WARM_INTERVAL_HOURS, HOLDERS_WARM_MIN_VOLUME, HOLDERS_WARM_MIN_LIQUIDITY,
+                   HOLDERS_WARM_MAX_HOURS_TO_EXPIRE),
+        HolderTier("cold", HOLDERS_COLD_INTERVAL_HOURS),
+    ]
+
+
+@dataclass
+class HolderRefreshPlan:
+    due: list[str] = field(default_factory=list)  # condition_ids to fetch, highest priority first
+    deferred: list[str] = field(default_factory=list)  # due, but over this run's call budget
+    not_due: int = 0
+    due_by_tier: dict[str, int] = field(default_factory=dict)
+
+
+def ensure_holder_schedule_schema(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS market_holder_refresh (
+            condition_id TEXT PRIMARY KEY,
+            last_fetched_at TEXT NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def mark_holders_fetched(conn, condition_id: str, fetched_at: Optional[str] = None) -> None:
+    conn.execute(
+        """
+        INSERT INTO market_holder_refresh (condition_id, last_fetched_at) VALUES (?, ?)
+        ON CONFLICT(condition_id) DO UPDATE SET last_fetched_at = excluded.last_fetched_at
+        """,
+        (condition_id, fetched_at or datetime.now(timezone.utc).isoformat()),
+    )
+
+
+def plan_holder_refresh(
+    conn,
+    tiers: Optional[list[HolderTier]] = None,
+    budget: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> HolderRefreshPlan:
+    """
+    Active markets whose holders are due for a refresh under the tier schedule.
+
+    Order: tier (hot first), then never-fetched markets, then how far past its interval a market
+    is (age / interval). The call budget cuts the tail of that order.
+    """
+
+    tiers = tiers or default_holder_tiers()
+    cap = HOLDERS_REFRESH_BUDGET if budget is None else budget
+    now = now or datetime.now(timezone.utc)
+
+    rows = conn.execute(
+        """
+        SELECT o.condition_id,
+               MAX(COALESCE(o.volume_usd, 0)) AS volume,
+               MAX(COALESCE(o.liquidity_usd, 0)) AS liquidity,
+               MIN(o.end_date) AS end_date,
+               r.last_fetched_at
+        FROM active_market_outcomes o
+        LEFT JOIN market_holder_refresh r ON r.condition_id = o.condition_id
+        WHERE o.condition_id IS NOT NULL
+        GROUP BY o.condition_id
+        """
+    ).fetchall()
+
+    plan = HolderRefreshPlan()
+    ranked = []
+    for row in rows:
+        condition_id, volume, liquidity, end_date, last_fetched_at = row[0], row[1], row[2], row[3], row[4]
+        end = _parse_ts(end_date)
+        hours_to_expire = (end - now).total_seconds() / 3600.0 if end else None
+        tier_index = next(
+            (i for i, tier in enumerate(tiers) if tier.matches(float(volume or 0), float(liquidity or 0), hours_to_expire)),
+            len(tiers) - 1,
+        )
+        tier = tiers[tier_index]
+        last = _parse_ts(last_fetched_at)
+        if last is None:
+            ranked.append(((tier_index, 0, 0.0), condition_id, tier.name))
+            continue
+        age_hours = max(0.0, (now - last).total_seconds() / 3600.0)
+        if age_hours < tier.interval_hours - HOLDERS_SCHEDULE_SLACK_MINUTES / 60.0:
+            plan.not_due += 1
+            continue
+        overdue = age_hours / tier.interval_hours if tier.interval_hours > 0 else age_hours
+        ranked.append(((tier_index, 1, -overdue), condition_id, tier.name))
+
+    ranked.sort(key=lambda item: item[0])
+    if cap and cap > 0:
+        selected, plan.deferred = ranked[:cap], [cid for _, cid, _ in ranked[cap:]]
+    else:
+        selected = ranked
+    plan.due = [cid for _, cid, _ in selected]
+    for _, _, name in selected:
+        plan.due_by_tier[name] = plan.due_by_tier.get(name, 0) + 1
+    return plan
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+# In-process /api/markets result cache; 0 entries disables it
+MARKETS_CACHE_MAX_ENTRIES = int(os.environ.get("MARKETS_CACHE_MAX_ENTRIES", "256"))
+MARKETS_CACHE_MAX_BYTES = int(os.environ.get("MARKETS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Results of expiry-window filters depend on the clock; they are only reused within this many seconds
+MARKETS_CACHE_CLOCK_BUCKET_SECONDS = int(os.environ.get("MARKETS_CACHE_CLOCK_BUCKET_SECONDS", "60"))
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Size of a JSON-serializable result as it would go over the wire; close enough to bound memory.
+    """
+
+    return len(json.dumps(value, default=str, separators=(",", ":")))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU of query results, bounded by entry count and by the estimated size of the
+    results. Keys carry the data version they were computed from, so a new version simply stops
+    hitting the old entries, which then age out; `clear()` is for when the data source changes.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = MARKETS_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = MARKETS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None) -> bool:
+        """
+        Stores `value` unless it alone exceeds the byte budget; returns whether it was stored.
+        """
+
+        if not self.enabled:
+            return False
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import logging
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+
+logger = logging.getLogger("polylab.run_ledger")
+
+
+# An unfinished smart-money run younger than this is continued by the next run instead of starting over
+SMART_MONEY_RUN_RESUME_HOURS = float(os.environ.get("SMART_MONEY_RUN_RESUME_HOURS", "12"))
+
+PHASE_HOLDERS = "holders"
+PHASE_PNL = "pnl"
+PHASE_METRICS = "metrics"
+
+MODE_FULL = "full"  # holders of active markets, then PnL of the wallets found
+MODE_WALLETS = "wallets"  # --resume: PnL of every wallet already in holders
+
+
+def ensure_run_ledger_schema(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS smart_money_runs (
+            run_id TEXT PRIMARY KEY,
+            mode TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            started_at TEXT NOT NULL,
+            finished_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS smart_money_run_items (
+            run_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            alias TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (run_id, kind, key)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+@dataclass
+class RunState:
+    run_id: str
+    mode: str
+    phase: str
+    resumed: bool
+
+
+def _parse_ts(value) -> Optional[datetime]:
+    try:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def start_run(conn, mode: str, now: Optional[datetime] = None, resume_hours: Optional[float] = None) -> RunState:
+    """
+    Continues the newest unfinished run of the same mode if it started within the resume window,
+    otherwise opens a new run. Any other unfinished run is closed as abandoned.
+    """
+
+    window = SMART_MONEY_RUN_RESUME_HOURS if resume_hours is None else resume_hours
+    now = now or datetime.now(timezone.utc)
+    rows = conn.execute(
+        "SELECT run_id, mode, phase, started_at FROM smart_money_runs WHERE finished_at IS NULL ORDER BY started_at DESC"
+    ).fetchall()
+
+    state = None
+    for row in rows:
+        run_id, run_mode, phase, started_at = row[0], row[1], row[2], row[3]
+        started = _parse_ts(started_at)
+        if (
+            state is None
+            and run_mode == mode
+            and window > 0
+            and started is not None
+            and now - started < timedelta(hours=window)
+        ):
+            state = RunState(run_id, run_mode, phase, resumed=True)
+        else:
+            finish_run(conn, run_id, status="abandoned", finished_at=now.isoformat())
+
+    if state is None:
+        state = RunState(uuid.uuid4().hex, mode, PHASE_HOLDERS if mode == MODE_FULL else PHASE_PNL, resumed=False)
+        conn.execute(
+            "INSERT INTO smart_money_runs (run_id, mode, phase, started_at) VALUES (?, ?, ?, ?)",
+            (state.run_id, state.mode, state.phase, now.isoformat()),
+        )
+    return state
+
+
+def set_phase(conn, run_id: str, phase: str) -> None:
+    conn.execute("UPDATE smart_money_runs SET phase = ? WHERE run_id = ?", (phase, run_id))
+
+
+def finish_run(conn, run_id: str, status: str = "done", finished_at: Optional[str] = None) -> None:
+    """
+    Closes a run and drops its item rows; the run row stays as history.
+    """
+
+    conn.execute(
+        "UPDATE smart_money_runs SET status = ?, finished_at = ? WHERE run_id = ?",
+        (status, finished_at or datetime.now(timezone.utc).isoformat(), run_id),
+    )
+    conn.execute("DELETE FROM smart_money_run_items WHERE run_id = ?", (run_id,))
+
+
+def add_markets(conn, run_id: str, condition_ids: list[str]) -> None:
+    conn.executemany(
+        "INSERT OR IGNORE INTO smart_money_run_items (run_id, kind, key) VALUES (?, 'market', ?)",
+        [(run_id, cid) for cid in condition_ids],
+    )
+
+
+def add_wallets(conn, run_id: str, wallets: dict[str, Optional[str]]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO smart_money_run_items (run_id, kind, key, alias) VALUES (?, 'wallet', ?, ?)
+        ON CONFLICT(run_id, kind, key) DO UPDATE SET alias = COALESCE(excluded.alias, alias)
+        """,
+        [(run_id, wallet, alias) for wallet, alias in wallets.items()],
+    )
+
+
+def mark_market_done(conn, run_id: str, condition_id: str, wallets: dict[str, Optional[str]]) -> None:
+    conn.execute(
+        "UPDATE smart_money_run_items SET state = 'done', attempts = attempts + 1 "
+        "WHERE run_id = ? AND kind = 'market' AND key = ?",
+        (run_id, condition_id),
+    )
+    add_wallets(conn, run_id, wallets)
+
+
+def mark_market_failed(conn, run_id: str, condition_id: str) -> None:
+    conn.execute(
+        "UPDATE smart_money_run_items SET state = 'failed', attempts = attempts + 1 "
+        "WHERE run_id = ? AND kind = 'market' AND key = ?",
+        (run_id, condition_id),
+    )
+
+
+def mark_wallets_done(conn, run_id: str, wallets: list[str]) -> None:
+    conn.executemany(
+        "UPDATE smart_money_run_items SET state = 'done' WHERE run_id = ? AND kind = 'wallet' AND key = ?",
+        [(run_id, wallet) for wallet in wallets],
+    )
+
+
+def remaining_markets(conn, run_id: str) -> list[str]:
+    """
+    Markets not yet saved in this run; failed ones come first so the retry pass picks them up again.
+    """
+
+    rows = conn.execute(
+        "SELECT key FROM smart_money_run_items WHERE run_id = ? AND kind = 'market' AND state != 'done' "
+        "ORDER BY state = 'pending', key",
+        (run_id,),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def run_wallets(conn, run_id: str) -> tuple[dict[str, Optional[str]], set[str]]:
+    """
+    ({wallet: alias} found so far in this run, wallets whose PnL this run already handled).
+    """
+
+    rows = conn.execute(
+        "SELECT key, alias, state FROM smart_money_run_items WHERE run_id = ? AND kind = 'wallet'", (run_id,)
+    ).fetchall()
+    return {row[0]: row[1] for row in rows}, {row[0] for row in rows if row[2] == "done"}
+
+
+class RunLedger:
+    """
+    Progress of one smart-money run, persisted so a crashed or restarted run continues where it stopped.
+
+    Writes go through the run's DbWriter when there is one, so a completion mark is committed with
+    (or after) the data it vouches for; otherwise through `conn` when the caller commits it with its
+    own batch, or a short-lived connection of its own.
+    """
+
+    def __init__(self, connect: Callable, state: RunState, writer=None):
+        self.connect = connect
+        self.state = state
+        self.writer = writer
+
+    @property
+    def run_id(self) -> str:
+        return self.state.run_id
+
+    def record(self, func: Callable, *args, conn=None) -> None:
+        if self.writer is not None:
+            self.writer.submit(func, self.run_id, *args)
+        elif conn is not None:
+            func(conn, self.run_id, *args)
+        else:
+            own = self.connect()
+            try:
+                func(own, self.run_id, *args)
+                own.commit()
+            finally:
+                own.close()
+
+    def read(self, func: Callable):
+        if self.writer is not None:
+            self.writer.flush()
+        conn = self.connect()
+        try:
+            return func(conn, self.run_id)
+        finally:
+            conn.close()
@@ -4,12 +4,39 @@ import sys
 import time
 import datetime
 import ast
+import asyncio
+import contextlib
+import hashlib
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - non-Unix
+    resource = None
 
 # Import local client
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from gamma_client import MarketFetcher
+from gamma_client import AsyncMarketFetcher
+from http_cache import log_cache_stats
+from http_transport import log_transport_stats
+from price_history import record_and_compact
+from rate_limit import log_rate_limit_stats
+from runtime_paths import env_flag
+from snapshot_tables import (
+    FULL_SNAPSHOT_VERSION_KEY,
+    MARKETS_VERSION_KEY,
+    bump_data_version,
+    create_staging_tables,
+    drop_staging_tables,
+    finalize_staging_tables,
+    get_data_version,
+    has_live_snapshot,
+    publish_staging_tables,
+    record_market_changes,
+    rollback_snapshot,
+    staging_name,
+)
 logger = logging.getLogger("polylab.scraper")
 
 # Paths
@@ -17,211 +44,587 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 DB_PATH = os.path.join(DATA_DIR, "markets.db")
 
+# Streaming limits: market pages buffered while the event crawl finishes, rows per DB write,
+# and the RSS budget we warn about at the end of the run.
+SCRAPE_BUFFER_PAGES = int(os.environ.get("SCRAPE_BUFFER_PAGES", "8"))
+SCRAPE_CHUNK_ROWS = int(os.environ.get("SCRAPE_CHUNK_ROWS", "2000"))
+SCRAPE_RSS_LIMIT_MB = float(os.environ.get("SCRAPE_RSS_LIMIT_MB", "512"))
+# Page cache used while loading staging tables (restored afterwards)
+SCRAPE_LOAD_CACHE_MB = float(os.environ.get("SCRAPE_LOAD_CACHE_MB", "64"))
+# Incremental mode: update only markets whose content hash changed, in place. A full rebuild
+# still runs when the last one is older than SCRAPE_FULL_REBUILD_HOURS (refreshes time-derived APR).
+SCRAPE_INCREMENTAL = env_flag("SCRAPE_INCREMENTAL", default=False)
+SCRAPE_FULL_REBUILD_HOURS = float(os.environ.get("SCRAPE_FULL_REBUILD_HOURS", "24"))
+# Append each published snapshot to the price/liquidity history (see price_history.py)
+SCRAPE_RECORD_HISTORY = env_flag("SCRAPE_RECORD_HISTORY", default=True)
+
+OUTCOME_COLUMNS = (
+    "snapshot_at", "market_id", "condition_id", "outcome_index", "event_slug", "question", "url", "outcome_name",
+    "price", "apr", "spread", "volume_usd", "liquidity_usd", "start_date", "end_date",
+    "category", "icon_url",
+)
+
+def _outcome_insert_sql(table: str) -> str:
+    return f"INSERT INTO {table} ({', '.join(OUTCOME_COLUMNS)}) VALUES ({','.join('?' * len(OUTCOME_COLUMNS))})"
+
+def _tag_insert_sql(table: str) -> str:
+    return f"INSERT INTO {table} (snapshot_at, market_id, tag_label) VALUES (?,?,?)"
+
+def _hash_insert_sql(table: str) -> str:
+    return f"INSERT OR REPLACE INTO {table} (market_id, condition_id, content_hash, snapshot_at) VALUES (?,?,?,?)"
+
+OUTCOME_INSERT_SQL = _outcome_insert_sql(staging_name("active_market_outcomes"))
+TAG_INSERT_SQL = _tag_insert_sql(staging_name("market_tags"))
+HASH_INSERT_SQL = _hash_insert_sql(staging_name("market_content_hashes"))
+OUTCOME_UPDATE_SQL = f"UPDATE active_market_outcomes SET {', '.join(f'{c} = ?' for c in OUTCOME_COLUMNS)} WHERE id = ?"
+
+# Compact per-event info kept while markets stream in: (slug, tag labels, icon)
+EventInfo = Tuple[str, Tuple[str, ...], str]
+
 def setup_db():
+    """
+    Opens the markets DB and prepares empty staging tables for the next snapshot.
+    The live tables keep serving readers until `publish_staging_tables` swaps them.
+    """
     os.makedirs(DATA_DIR, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     
     # Enable WAL mode for better concurrency (Reader doesn't block Writer)
     conn.execute("PRAGMA journal_mode=WAL;")
     
-    cursor = conn.cursor()
-    
-    # Drop tables for clean snapshot
-    cursor.execute('DROP TABLE IF EXISTS active_market_outcomes')
-    cursor.execute('DROP TABLE IF EXISTS market_tags')
-    
-    # Create Tables
-    cursor.execute('''
-        CREATE TABLE active_market_outcomes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            snapshot_at TEXT,
-            market_id TEXT,
-            condition_id TEXT,
-            outcome_index INTEGER,
-            event_slug TEXT,
-            question TEXT,
-            url TEXT,
-            outcome_name TEXT,
-            price REAL,
-            apr REAL,
-            spread REAL,
-            volume_usd REAL,
-            liquidity_usd REAL,
-            start_date TEXT,
-            end_date TEXT,
-            category TEXT,
-            icon_url TEXT
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE market_tags (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            snapshot_at TEXT,
-            market_id TEXT,
-            tag_label TEXT
-        )
-    ''')
-    
-    conn.commit()
+    create_staging_tables(conn)
     return conn
 
-def run_scrape(limit_count: Optional[int] = None):
-    start_total = time.time()
-    logger.info("Starting scrape...")
-    
-    fetcher = MarketFetcher()
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+def compact_event(ev: Dict[str, Any]) -> EventInfo:
+    slug = ev.get("slug") or ""
+    icon = ev.get("icon") or ev.get("image") or ""
+    tags = ()
+    if isinstance(ev.get("tags"), list):
+        tags = tuple(sys.intern(str(t.get("label"))) for t in ev.get("tags") if t.get("label"))
+    return slug, tags, icon
+
+def normalize_market(
+    m: Dict[str, Any],
+    events_map: Dict[str, EventInfo],
+    snapshot_at: str,
+    snap_dt: Optional[datetime.datetime] = None,
+) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Turns one Gamma market payload into `(outcome_rows, tag_rows)` ready for insertion.
+    `snap_dt` is `snapshot_at` already parsed; pass it when normalizing many markets.
+    """
+    if snap_dt is None:
+        snap_dt = datetime.datetime.fromisoformat(snapshot_at)
+    m_id = str(m.get("id"))
+    question = m.get("question") or ""
     
-    # 1. Fetch Events (for Tags & Icons)
-    t0 = time.time()
-    raw_events = fetcher.fetch_all_events()
+    # Resolve Event Info
+    event_slug = ""
+    icon_url = ""
+    tag_labels = ()
     
-    # Build Map
-    events_map = {}
-    for ev in raw_events:
-        e_id = str(ev.get("id"))
-        slug = ev.get("slug") or ""
-        icon = ev.get("icon") or ev.get("image") or ""
-        
-        tags = []
-        if isinstance(ev.get("tags"), list):
-            tags = [t.get("label") for t in ev.get("tags") if t.get("label")]
-            
-        events_map[e_id] = {"slug": slug, "tags": tags, "icon": icon}
-        
-    logger.info("Events: %d (took %.2fs)", len(raw_events), (time.time() - t0))
+    # Find Event ID from nested events list
+    m_events = m.get("events")
+    if m_events and isinstance(m_events, list) and len(m_events) > 0:
+        e_id = str(m_events[0].get("id"))
+        if e_id in events_map:
+            event_slug, tag_labels, icon_url = events_map[e_id]
+        else:
+            # Fallback to nested data
+            event_slug = m_events[0].get("slug") or ""
+            icon_url = m_events[0].get("icon") or m_events[0].get("image") or ""
     
-    # 2. Fetch Markets
-    t0 = time.time()
-    raw_markets = fetcher.fetch_all_markets()
-    if limit_count:
-        raw_markets = raw_markets[:limit_count]
-    logger.info("Markets: %d (took %.2fs)", len(raw_markets), (time.time() - t0))
+    # Fallback 2
+    if not event_slug: event_slug = m.get("slug") or ""
+    if not icon_url: icon_url = m.get("icon") or m.get("image") or ""
     
-    # 3. Process & Store
-    conn = setup_db()
-    cursor = conn.cursor()
-    snapshot_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    url = f"https://polymarket.com/event/{event_slug}" if event_slug else ""
+    primary_category = tag_labels[0] if tag_labels else ""
     
-    count_outcomes = 0
-    count_tags = 0
+    tag_rows = [(snapshot_at, m_id, t) for t in tag_labels]
+        
+    # Outcomes
+    outcomes = m.get("outcomes")
+    prices = m.get("outcomePrices")
     
-    for m in raw_markets:
-        m_id = str(m.get("id"))
-        question = m.get("question") or ""
+    # Parsing stringified JSON if needed (sometimes API returns strings)
+    if isinstance(outcomes, str):
+        try: outcomes = ast.literal_eval(outcomes)
+        except: outcomes = [outcomes]
+    if isinstance(prices, str):
+        try: prices = ast.literal_eval(prices)
+        except: prices = []
         
-        # Resolve Event Info
-        event_slug = ""
-        icon_url = ""
-        tag_labels = []
+    if not isinstance(outcomes, list): outcomes = []
+    if not isinstance(prices, list): prices = []
+    
+    # Days to expiry is per market, so parse endDate once rather than per outcome
+    days_to_end = None
+    try:
+        end_s = (m.get("endDate") or "").strip()
+        if end_s.endswith("Z"):
+            end_s = end_s[:-1] + "+00:00"
+        end_dt = datetime.datetime.fromisoformat(end_s) if end_s else None
+        if end_dt is not None and end_dt.tzinfo is not None and snap_dt.tzinfo is not None:
+            days_to_end = (end_dt - snap_dt).total_seconds() / 86400.0
+    except Exception:
+        days_to_end = None
+
+    spread = float(m.get("spread") or 0)
+    volume = float(m.get("volume") or 0)
+    liquidity = float(m.get("liquidity") or 0)
+    condition_id = m.get("conditionId")
+    start_date = m.get("startDate")
+    end_date = m.get("endDate")
+
+    outcome_rows = []
+    for i, outcome_name in enumerate(outcomes):
+        price = 0.0
+        if i < len(prices):
+            try: price = float(prices[i])
+            except: pass
+
+        apr = None
+        if days_to_end is not None and days_to_end > 0.0 and 0.0 < price < 1.0:
+            roi = (1.0 / price) - 1.0
+            apr_val = roi * (365.0 / days_to_end)
+            if apr_val > 0.0 and apr_val != float("inf"):
+                apr = float(apr_val)
         
-        # Find Event ID from nested events list
-        m_events = m.get("events")
-        if m_events and isinstance(m_events, list) and len(m_events) > 0:
-            e_id = str(m_events[0].get("id"))
-            if e_id in events_map:
-                info = events_map[e_id]
-                event_slug = info["slug"]
-                icon_url = info["icon"]
-                tag_labels = info["tags"]
+        outcome_rows.append((
+            snapshot_at, m_id, condition_id, i, event_slug, question, url, str(outcome_name),
+            price, apr, spread, volume, liquidity,
+            start_date, end_date, primary_category, icon_url
+        ))
+    return outcome_rows, tag_rows
+
+def market_content_hash(outcome_rows: List[tuple], tag_rows: List[tuple]) -> str:
+    """
+    Hash of everything stored for a market except `snapshot_at` and the time-derived `apr`,
+    so a market only counts as changed when its Gamma content (or its event's tags) changed.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for row in outcome_rows:
+        h.update(repr(row[1:9] + row[10:]).encode("utf-8"))
+    for row in tag_rows:
+        h.update(repr(row[2]).encode("utf-8"))
+    return h.hexdigest()
+
+def _market_key(outcome_rows: List[tuple], tag_rows: List[tuple]) -> Tuple[Optional[str], Optional[str]]:
+    # (market_id, condition_id) from the normalized rows; markets with no rows are not stored
+    if outcome_rows:
+        return outcome_rows[0][1], outcome_rows[0][2]
+    if tag_rows:
+        return tag_rows[0][1], None
+    return None, None
+
+async def _stream_market_pages(fetcher: AsyncMarketFetcher, events_map: Dict[str, EventInfo], limit_count: Optional[int]):
+    """
+    Runs the market crawl into a bounded queue while the event crawl fills `events_map`,
+    then yields market pages. The queue bound is what caps buffered raw JSON.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, SCRAPE_BUFFER_PAGES))
+    done = object()
+
+    async def produce():
+        try:
+            async for page in fetcher.iter_market_pages():
+                await queue.put(page)
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        t0 = time.time()
+        event_count = 0
+        async for page in fetcher.iter_event_pages():
+            for ev in page:
+                events_map[str(ev.get("id"))] = compact_event(ev)
+            event_count += len(page)
+        logger.info("Events: %d (took %.2fs)", event_count, (time.time() - t0))
+
+        remaining = limit_count
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            if remaining is not None:
+                item = item[:remaining]
+                remaining -= len(item)
+            if item:
+                yield item
+            if remaining is not None and remaining <= 0:
+                break
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+@contextlib.contextmanager
+def bulk_load_pragmas(conn: sqlite3.Connection):
+    """
+    Relaxes durability and widens caches for the duration of a staging load, then restores the
+    connection's previous settings. Only staging tables are written under these PRAGMAs; the
+    publishing swap runs with the original `synchronous` level.
+    """
+    saved = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ("synchronous", "temp_store", "cache_size")}
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA cache_size=-{int(SCRAPE_LOAD_CACHE_MB * 1024)}")
+    try:
+        yield conn
+    finally:
+        for name, value in saved.items():
+            conn.execute(f"PRAGMA {name}={int(value)}")
+
+class BulkLoader:
+    """
+    Buffers normalized rows and writes them to the staging tables with `executemany`
+    every `batch_rows` outcome rows, tracking write throughput.
+
+    Each flush commits: staging tables are invisible to readers until publish, so there is no
+    reason to hold the write lock (and lock out other writers) for the whole crawl.
+    """
+    def __init__(self, conn: sqlite3.Connection, batch_rows: int = SCRAPE_CHUNK_ROWS):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.batch_rows = max(1, batch_rows)
+        self.outcome_rows: List[tuple] = []
+        self.tag_rows: List[tuple] = []
+        self.hash_rows: List[tuple] = []
+        self.outcomes_written = 0
+        self.tags_written = 0
+        self.write_seconds = 0.0
+
+    def add(self, outcome_rows: List[tuple], tag_rows: List[tuple]) -> None:
+        market_id, condition_id = _market_key(outcome_rows, tag_rows)
+        if market_id is None:
+            return
+        snapshot_at = (outcome_rows or tag_rows)[0][0]
+        self.hash_rows.append((market_id, condition_id, market_content_hash(outcome_rows, tag_rows), snapshot_at))
+        self.outcome_rows.extend(outcome_rows)
+        self.tag_rows.extend(tag_rows)
+        if len(self.outcome_rows) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.outcome_rows and not self.tag_rows:
+            return
+        t0 = time.perf_counter()
+        if self.tag_rows:
+            self.cursor.executemany(TAG_INSERT_SQL, self.tag_rows)
+        if self.outcome_rows:
+            self.cursor.executemany(OUTCOME_INSERT_SQL, self.outcome_rows)
+        if self.hash_rows:
+            self.cursor.executemany(HASH_INSERT_SQL, self.hash_rows)
+        self.conn.commit()
+        self.write_seconds += time.perf_counter() - t0
+        self.outcomes_written += len(self.outcome_rows)
+        self.tags_written += len(self.tag_rows)
+        self.outcome_rows = []
+        self.tag_rows = []
+        self.hash_rows = []
+
+    @property
+    def rows_per_second(self) -> float:
+        rows = self.outcomes_written + self.tags_written
+        return rows / self.write_seconds if self.write_seconds > 0 else 0.0
+
+class IncrementalWriter:
+    """
+    Applies one crawl to the live tables in place: markets whose content hash is unchanged are
+    skipped, changed markets have their outcome rows updated by `(market_id, outcome_index)` (so row
+    ids stay stable) and their tags replaced, and markets missing from the crawl are deleted.
+
+    Like `BulkLoader`, changed markets are buffered up to `batch_rows` outcome rows and each flush
+    commits, so neither memory nor the write lock grows with the crawl. `changes` lists the markets
+    whose writes are committed.
+    """
+    def __init__(self, conn: sqlite3.Connection, batch_rows: Optional[int] = None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.batch_rows = max(1, batch_rows or SCRAPE_CHUNK_ROWS)
+        self.known: Dict[str, Tuple[Optional[str], str]] = {
+            row[0]: (row[1], row[2])
+            for row in self.cursor.execute("SELECT market_id, condition_id, content_hash FROM market_content_hashes")
+        }
+        self.seen = set()
+        self.pending: List[tuple] = []
+        self.pending_rows = 0
+        self.changes: List[Tuple[str, Optional[str], str]] = []
+        self.unchanged = 0
+        self.outcomes_written = 0
+        self.tags_written = 0
+        self.write_seconds = 0.0
+
+    def add(self, outcome_rows: List[tuple], tag_rows: List[tuple]) -> None:
+        market_id, condition_id = _market_key(outcome_rows, tag_rows)
+        if market_id is None:
+            return
+        self.seen.add(market_id)
+        digest = market_content_hash(outcome_rows, tag_rows)
+        known = self.known.get(market_id)
+        if known is not None and known[1] == digest:
+            self.unchanged += 1
+            return
+        self.pending.append((market_id, condition_id, digest, outcome_rows, tag_rows))
+        self.pending_rows += len(outcome_rows)
+        self.known[market_id] = (condition_id, digest)
+        if self.pending_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        t0 = time.perf_counter()
+        try:
+            for item in self.pending:
+                self._apply(*item)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.write_seconds += time.perf_counter() - t0
+        self.changes.extend((market_id, condition_id, "upsert") for market_id, condition_id, *_ in self.pending)
+        self.pending = []
+        self.pending_rows = 0
+
+    def _apply(self, market_id, condition_id, digest, outcome_rows, tag_rows) -> None:
+        cur = self.cursor
+        existing: Dict[int, int] = {}
+        stale: List[Tuple[int]] = []
+        for row_id, outcome_index in cur.execute(
+            "SELECT id, outcome_index FROM active_market_outcomes WHERE market_id = ? ORDER BY id", (market_id,)
+        ).fetchall():
+            if outcome_index in existing:
+                stale.append((row_id,))
             else:
-                # Fallback to nested data
-                event_slug = m_events[0].get("slug") or ""
-                icon_url = m_events[0].get("icon") or m_events[0].get("image") or ""
-        
-        # Fallback 2
-        if not event_slug: event_slug = m.get("slug") or ""
-        if not icon_url: icon_url = m.get("icon") or m.get("image") or ""
-        
-        url = f"https://polymarket.com/event/{event_slug}" if event_slug else ""
-        primary_category = tag_labels[0] if tag_labels else ""
-        
-        # Save Tags
-        for t in tag_labels:
-            cursor.execute("INSERT INTO market_tags (snapshot_at, market_id, tag_label) VALUES (?,?,?)", 
-                           (snapshot_at, m_id, t))
-            count_tags += 1
-            
-        # Outcomes
-        outcomes = m.get("outcomes")
-        prices = m.get("outcomePrices")
-        
-        # Parsing stringified JSON if needed (sometimes API returns strings)
-        if isinstance(outcomes, str):
-            try: outcomes = ast.literal_eval(outcomes)
-            except: outcomes = [outcomes]
-        if isinstance(prices, str):
-            try: prices = ast.literal_eval(prices)
-            except: prices = []
-            
-        if not isinstance(outcomes, list): outcomes = []
-        if not isinstance(prices, list): prices = []
-        
-        for i, outcome_name in enumerate(outcomes):
-            price = 0.0
-            if i < len(prices):
-                try: price = float(prices[i])
-                except: pass
+                existing[outcome_index] = row_id
+
+        updates, inserts = [], []
+        for row in outcome_rows:
+            row_id = existing.pop(row[3], None)
+            if row_id is None:
+                inserts.append(row)
+            else:
+                updates.append(row + (row_id,))
+        stale.extend((row_id,) for row_id in existing.values())
+
+        if updates:
+            cur.executemany(OUTCOME_UPDATE_SQL, updates)
+        if inserts:
+            cur.executemany(_outcome_insert_sql("active_market_outcomes"), inserts)
+        if stale:
+            cur.executemany("DELETE FROM active_market_outcomes WHERE id = ?", stale)
+        cur.execute("DELETE FROM market_tags WHERE market_id = ?", (market_id,))
+        if tag_rows:
+            cur.executemany(_tag_insert_sql("market_tags"), tag_rows)
+        snapshot_at = (outcome_rows or tag_rows)[0][0]
+        cur.execute(_hash_insert_sql("market_content_hashes"), (market_id, condition_id, digest, snapshot_at))
+        self.outcomes_written += len(outcome_rows)
+        self.tags_written += len(tag_rows)
+
+    def remove_missing(self) -> int:
+        """
+        Deletes markets that were live but did not appear in this crawl. Returns how many.
+        """
+        missing = [(market_id,) for market_id in self.known if market_id not in self.seen]
+        if not missing:
+            return 0
+        t0 = time.perf_counter()
+        for table in ("active_market_outcomes", "market_tags", "market_content_hashes"):
+            self.cursor.executemany(f"DELETE FROM {table} WHERE market_id = ?", missing)
+        self.write_seconds += time.perf_counter() - t0
+        for (market_id,) in missing:
+            condition_id, _ = self.known.pop(market_id)
+            self.changes.append((market_id, condition_id, "delete"))
+        return len(missing)
+
+async def _ingest(conn: sqlite3.Connection, snapshot_at: str, limit_count: Optional[int], loader=None) -> Tuple[int, Any]:
+    """
+    Streams market pages through `normalize_market` into a `BulkLoader` (or another sink with the
+    same `add`/`flush` interface), so raw market dicts never outlive their page. Returns the market
+    count and the loader (for row counts and throughput).
+    """
+    fetcher = AsyncMarketFetcher()
+    events_map: Dict[str, EventInfo] = {}
+    snap_dt = datetime.datetime.fromisoformat(snapshot_at)
+    loader = loader if loader is not None else BulkLoader(conn)
+    count_markets = 0
 
-            apr = None
+    async with fetcher.session():
+        async for page in _stream_market_pages(fetcher, events_map, limit_count):
+            for m in page:
+                loader.add(*normalize_market(m, events_map, snapshot_at, snap_dt))
+            count_markets += len(page)
+        loader.flush()
+
+    return count_markets, loader
+
+def _record_history(conn: sqlite3.Connection, snapshot_at: str) -> None:
+    # History is best-effort: a failure here must not fail an already published scrape
+    if not SCRAPE_RECORD_HISTORY:
+        return
+    try:
+        record_and_compact(conn, snapshot_at)
+    except Exception as e:
+        logger.warning("Failed to record price history: %s", e)
+
+def _full_rebuild_due(conn: sqlite3.Connection, now: datetime.datetime) -> bool:
+    if not has_live_snapshot(conn):
+        return True
+    last_full = get_data_version(conn, FULL_SNAPSHOT_VERSION_KEY)
+    if not last_full or not last_full.get("updated_at"):
+        return True
+    try:
+        age = now - datetime.datetime.fromisoformat(last_full["updated_at"])
+    except ValueError:
+        return True
+    return age.total_seconds() >= SCRAPE_FULL_REBUILD_HOURS * 3600.0
+
+def run_incremental_scrape(conn: sqlite3.Connection, snapshot_at: str, limit_count: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Updates the live snapshot in place from a fresh crawl (see `IncrementalWriter`) and records the
+    changed markets under a new markets data version. With `limit_count` the crawl is partial, so
+    nothing is deleted.
+
+    Changed markets are committed chunk by chunk during the crawl. If the crawl fails, the chunks
+    already written still get their version, so consumers of the change log don't miss them.
+    """
+    writer = IncrementalWriter(conn)
+    try:
+        count_markets, _ = asyncio.run(_ingest(conn, snapshot_at, limit_count, loader=writer))
+        if not writer.seen:
+            raise RuntimeError("Scrape produced no markets; keeping the current snapshot")
+        # Deletions, the version bump and the change log are one short transaction after the crawl
+        removed = writer.remove_missing() if limit_count is None else 0
+        version = bump_data_version(conn, MARKETS_VERSION_KEY, updated_at=snapshot_at, keep_previous=True)
+        record_market_changes(conn, version, writer.changes)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        written = [change for change in writer.changes if change[2] == "upsert"]
+        if written:
             try:
-                end_s = (m.get("endDate") or "").strip()
-                if end_s.endswith("Z"):
-                    end_s = end_s[:-1] + "+00:00"
-                end_dt = datetime.datetime.fromisoformat(end_s) if end_s else None
-                snap_dt = datetime.datetime.fromisoformat(snapshot_at)
-                if (
-                    end_dt is not None
-                    and end_dt.tzinfo is not None
-                    and snap_dt.tzinfo is not None
-                    and price is not None
-                    and price > 0.0
-                    and price < 1.0
-                ):
-                    days = (end_dt - snap_dt).total_seconds() / 86400.0
-                    if days > 0.0:
-                        roi = (1.0 / float(price)) - 1.0
-                        apr_val = roi * (365.0 / days)
-                        if apr_val > 0.0 and apr_val != float("inf"):
-                            apr = float(apr_val)
-            except Exception:
-                apr = None
-            
-            cursor.execute('''
-                INSERT INTO active_market_outcomes (
-                    snapshot_at, market_id, condition_id, outcome_index, event_slug, question, url, outcome_name, 
-                    price, apr, spread, volume_usd, liquidity_usd, start_date, end_date, 
-                    category, icon_url
-                ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-            ''', (
-                snapshot_at, m_id, m.get("conditionId"), i, event_slug, question, url, str(outcome_name),
-                price, apr, float(m.get("spread") or 0), float(m.get("volume") or 0), float(m.get("liquidity") or 0),
-                m.get("startDate"), m.get("endDate"), primary_category, icon_url
-            ))
-            count_outcomes += 1
-            
-    conn.commit()
-
-    # Re-create indices after refresh (tables are dropped each run)
-    conn.executescript("""
-        CREATE INDEX IF NOT EXISTS idx_market_tags_label ON market_tags(tag_label);
-        CREATE INDEX IF NOT EXISTS idx_market_tags_market_id ON market_tags(market_id);
-        CREATE INDEX IF NOT EXISTS idx_amo_market_id ON active_market_outcomes(market_id);
-        CREATE INDEX IF NOT EXISTS idx_amo_volume ON active_market_outcomes(volume_usd DESC);
-        CREATE INDEX IF NOT EXISTS idx_amo_end_date ON active_market_outcomes(end_date);
-        CREATE INDEX IF NOT EXISTS idx_amo_price ON active_market_outcomes(price);
-        CREATE INDEX IF NOT EXISTS idx_amo_spread ON active_market_outcomes(spread);
-        CREATE INDEX IF NOT EXISTS idx_amo_liquidity ON active_market_outcomes(liquidity_usd);
-        CREATE INDEX IF NOT EXISTS idx_amo_apr ON active_market_outcomes(apr);
-        CREATE INDEX IF NOT EXISTS idx_amo_question ON active_market_outcomes(question);
-        CREATE INDEX IF NOT EXISTS idx_amo_outcome ON active_market_outcomes(outcome_name);
-        ANALYZE;
-    """)
-    conn.commit()
-    conn.close()
+                version = bump_data_version(conn, MARKETS_VERSION_KEY, updated_at=snapshot_at, keep_previous=True)
+                record_market_changes(conn, version, written)
+                conn.commit()
+                logger.warning("Incremental scrape failed; recorded %d markets already written as v%d", len(written), version)
+            except Exception as e:
+                conn.rollback()
+                logger.warning("Failed to record changes of a failed incremental scrape: %s", e)
+        raise
+    return {
+        "mode": "incremental",
+        "version": version,
+        "markets": count_markets,
+        "changed": len(writer.changes) - removed,
+        "removed": removed,
+        "unchanged": writer.unchanged,
+        "outcomes_written": writer.outcomes_written,
+        "tags_written": writer.tags_written,
+    }
+
+def _log_run_stats(start_total: float) -> None:
+    # Shared exit path of full and incremental runs
+    log_transport_stats()
+    log_rate_limit_stats()
+    log_cache_stats()
+    peak_mb = peak_rss_mb()
+    if peak_mb is not None:
+        if peak_mb > SCRAPE_RSS_LIMIT_MB:
+            logger.warning("Peak RSS %.1f MiB exceeded budget of %.0f MiB", peak_mb, SCRAPE_RSS_LIMIT_MB)
+        else:
+            logger.info("Peak RSS: %.1f MiB (budget %.0f MiB)", peak_mb, SCRAPE_RSS_LIMIT_MB)
+    logger.info("Total time: %.2fs", (time.time() - start_total))
+
+def run_scrape(limit_count: Optional[int] = None, incremental: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Scrapes Gamma into the markets DB and returns a summary dict (`mode`, `version`, counts).
+
+    `incremental` (default: `SCRAPE_INCREMENTAL`) updates only changed markets in place; it falls
+    back to a full staging rebuild when there is no live snapshot yet or the last full one is older
+    than `SCRAPE_FULL_REBUILD_HOURS`.
+    """
+    start_total = time.time()
+    logger.info("Starting scrape...")
+    if incremental is None:
+        incremental = SCRAPE_INCREMENTAL
+
+    if incremental:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            snapshot_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            if not _full_rebuild_due(conn, datetime.datetime.fromisoformat(snapshot_at)):
+                t0 = time.time()
+                summary = run_incremental_scrape(conn, snapshot_at, limit_count)
+                logger.info(
+                    "Incremental scrape v%d: %d markets, %d changed, %d removed, %d unchanged (took %.2fs)",
+                    summary["version"], summary["markets"], summary["changed"], summary["removed"],
+                    summary["unchanged"], (time.time() - t0),
+                )
+                _record_history(conn, snapshot_at)
+                _log_run_stats(start_total)
+                return summary
+            logger.info("Full rebuild due; running a full scrape instead of incremental.")
+        finally:
+            conn.close()
+
+    # 1. Stream Events (for Tags & Icons) and Markets concurrently, 2. normalize, 3. store in chunks
+    conn = setup_db()
+    try:
+        snapshot_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        t0 = time.time()
+        with bulk_load_pragmas(conn):
+            # The loader commits every chunk; only the publish swap below is one transaction
+            count_markets, loader = asyncio.run(_ingest(conn, snapshot_at, limit_count))
+        count_outcomes, count_tags = loader.outcomes_written, loader.tags_written
+        logger.info("Markets: %d (took %.2fs)", count_markets, (time.time() - t0))
+        logger.info(
+            "Bulk load: %d rows written in %.2fs (%.0f rows/s)",
+            count_outcomes + count_tags, loader.write_seconds, loader.rows_per_second,
+        )
+        if count_outcomes == 0:
+            raise RuntimeError("Scrape produced no outcomes; keeping the current snapshot")
+
+        # 4. Indexes (built after the data is loaded) + ANALYZE on staging, then publish with a single rename transaction
+        t0 = time.time()
+        with bulk_load_pragmas(conn):
+            finalize_staging_tables(conn)
+        version = publish_staging_tables(conn, snapshot_at=snapshot_at)
+        logger.info("Published snapshot generation %d (indexes + swap took %.2fs)", version, (time.time() - t0))
+        _record_history(conn, snapshot_at)
+    except Exception:
+        # Live tables are untouched; just discard the partial staging build
+        conn.rollback()
+        drop_staging_tables(conn)
+        raise
+    finally:
+        conn.close()
     
     logger.info("Saved: %d outcomes, %d tags.", count_outcomes, count_tags)
-    logger.info("Total time: %.2fs", (time.time() - start_total))
+    _log_run_stats(start_total)
+    return {
+        "mode": "full",
+        "version": version,
+        "markets": count_markets,
+        "changed": None,
+        "removed": None,
+        "unchanged": None,
+        "outcomes_written": count_outcomes,
+        "tags_written": count_tags,
+    }
 
 if __name__ == "__main__":
     from logging_setup import setup_logging
@@ -229,7 +632,19 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Scrape Polymarket data.")
     parser.add_argument("--limit", type=int, default=None, help="Limit number of markets to process (for testing)")
+    parser.add_argument("--incremental", action="store_true", help="Update only changed markets in place (full rebuild if one is due)")
+    parser.add_argument("--rollback", action="store_true", help="Swap the previous snapshot generation back in and exit")
     args = parser.parse_args()
 
     setup_logging("scraper")
-    run_scrape(limit_count=args.limit)
+    if args.rollback:
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            if rollback_snapshot(conn):
+                logger.info("Rolled back to the previous snapshot generation.")
+            else:
+                logger.error("No previous snapshot generation to roll back to.")
+        finally:
+            conn.close()
+    else:
+        run_scrape(limit_count=args.limit, incremental=True if args.incremental else None)
@@ -0,0 +1,130 @@
+"""
+Network-free throughput benchmark for the scrape and smart-money stages.
+
+Record an archive once against the live APIs:
+
+    UPSTREAM_MODE=record python scraper.py --limit 500
+    UPSTREAM_MODE=record python smart_money_scraper.py --limit 200
+
+then replay it at several catalog sizes:
+
+    python scripts/bench_upstream.py --scales 1,10,100 --latency-ms 40 --throttle-rate 0.01
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded upstream responses and time the pipeline stages.")
+    parser.add_argument("--archive", default=os.environ.get("UPSTREAM_ARCHIVE", "data/fixtures/upstream.jsonl.gz"))
+    parser.add_argument("--scales", default="1,10,100", help="Comma-separated catalog multipliers")
+    parser.add_argument("--stages", default="scrape,smart_money", help="scrape and/or smart_money")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", default="0", help="Retry-After sent with injected 429s")
+    parser.add_argument("--smart-money-limit", type=int, default=None, help="Cap markets for the smart-money stage")
+    parser.add_argument("--gamma-rps", type=float, default=1000.0, help="Gamma token-bucket rate during the benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="polylab-bench-")
+
+    # Module-level settings are read at import time, so configure them before importing the pipeline
+    os.environ.setdefault("MARKETS_DB_PATH", os.path.join(workdir, "markets.db"))
+    os.environ.setdefault("METRICS_DB_PATH", os.path.join(workdir, "metrics.db"))
+    os.environ["GAMMA_HTTP_CACHE"] = "0"
+    os.environ["GAMMA_RATE_LIMIT_RPS"] = str(args.gamma_rps)
+    os.environ["GAMMA_RATE_LIMIT_BURST"] = str(args.gamma_rps)
+    sys.path.insert(0, str(REPO_ROOT))
+
+    import main as api_main
+    import scraper
+    import smart_money_scraper
+    from http_transport import set_transport
+    from upstream_replay import ReplayTransport, load_archive
+
+    records = load_archive(args.archive)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    results = []
+
+    for scale in (int(s) for s in args.scales.split(",") if s.strip()):
+        transport = ReplayTransport(
+            records,
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            retry_after=args.retry_after,
+            scale=scale,
+            seed=args.seed,
+        )
+        set_transport(transport)
+        db_path = os.path.join(workdir, f"markets_{scale}x.db")
+        scraper.DB_PATH = db_path
+        scraper.DATA_DIR = workdir
+        api_main.DB_PATH = db_path
+
+        if "scrape" in stages:
+            t0 = time.perf_counter()
+            summary = scraper.run_scrape()
+            seconds = time.perf_counter() - t0
+            results.append({
+                "scale": scale,
+                "stage": "scrape",
+                "seconds": round(seconds, 3),
+                "markets": summary["markets"],
+                "markets_per_second": round(summary["markets"] / seconds, 1) if seconds else None,
+                "replay": transport.stats()["replay"],
+            })
+
+        if "smart_money" in stages:
+            api_main.ensure_indices()  # holders / wallets_stats tables on the fresh DB
+            before = dict(transport.stats()["replay"])
+            t0 = time.perf_counter()
+            sm_args = ["--limit", str(args.smart_money_limit)] if args.smart_money_limit else []
+            smart_money_scraper.run(sm_args)
+            seconds = time.perf_counter() - t0
+            after = transport.stats()["replay"]
+            requests = after["requests"] - before["requests"]
+            results.append({
+                "scale": scale,
+                "stage": "smart_money",
+                "seconds": round(seconds, 3),
+                "requests": requests,
+                "requests_per_second": round(requests / seconds, 1) if seconds else None,
+                "replay": {k: after[k] - before.get(k, 0) for k in after},
+            })
+
+    set_transport(None)
+    for row in results:
+        if args.json:
+            print(json.dumps(row))
+        else:
+            rate = row.get("markets_per_second") or row.get("requests_per_second")
+            unit = "markets/s" if row["stage"] == "scrape" else "req/s"
+            print(
+                f"{row['scale']:>4}x  {row['stage']:<12} {row['seconds']:>9.2f}s  {rate or 0:>10.1f} {unit}  "
+                f"(429: {row['replay']['throttled']}, errors: {row['replay']['errors']})"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
+from snapshot_tables import SMART_MONEY_VERSION_KEY, bump_data_version
+
 
 SMART_MONEY_SCHEMA_COLUMNS: tuple[tuple[str, str], ...] = (
     ("condition_id", "TEXT PRIMARY KEY"),
@@ -62,7 +64,123 @@ def ensure_market_smart_money_stats_schema(conn) -> None:
     )
 
 
+# Aggregates per market over holders joined with wallet PnL; {where} narrows the markets recomputed
+_UPSERT_STATS_SQL = """
+    INSERT INTO market_smart_money_stats (
+        condition_id,
+        yes_profitable_count,
+        yes_losing_count,
+        yes_total,
+        no_profitable_count,
+        no_losing_count,
+        no_total,
+        smart_money_win_rate,
+        last_updated_at
+    )
+    SELECT
+        h.market_id AS condition_id,
+        SUM(CASE WHEN h.outcome_index = 0 AND ws.total_pnl > 0 THEN 1 ELSE 0 END) AS yes_profitable_count,
+        SUM(CASE WHEN h.outcome_index = 0 AND ws.total_pnl < 0 THEN 1 ELSE 0 END) AS yes_losing_count,
+        SUM(CASE WHEN h.outcome_index = 0 THEN 1 ELSE 0 END) AS yes_total,
+        SUM(CASE WHEN h.outcome_index = 1 AND ws.total_pnl > 0 THEN 1 ELSE 0 END) AS no_profitable_count,
+        SUM(CASE WHEN h.outcome_index = 1 AND ws.total_pnl < 0 THEN 1 ELSE 0 END) AS no_losing_count,
+        SUM(CASE WHEN h.outcome_index = 1 THEN 1 ELSE 0 END) AS no_total,
+        CASE
+            WHEN COUNT(*) > 0
+            THEN CAST(SUM(CASE WHEN ws.total_pnl > 0 THEN 1 ELSE 0 END) AS REAL) / COUNT(*)
+            ELSE NULL
+        END AS smart_money_win_rate,
+        ? AS last_updated_at
+    FROM holders h
+    LEFT JOIN wallets_stats ws
+      ON h.wallet_address = ws.wallet_address
+    WHERE {where}
+    GROUP BY h.market_id
+    ON CONFLICT(condition_id) DO UPDATE SET
+        yes_profitable_count = excluded.yes_profitable_count,
+        yes_losing_count = excluded.yes_losing_count,
+        yes_total = excluded.yes_total,
+        no_profitable_count = excluded.no_profitable_count,
+        no_losing_count = excluded.no_losing_count,
+        no_total = excluded.no_total,
+        smart_money_win_rate = excluded.smart_money_win_rate,
+        last_updated_at = excluded.last_updated_at
+"""
+
+# Sign of a PnL value (NULL stays NULL); only a sign change moves the aggregates
+_PNL_SIGN = "(({col} > 0) - ({col} < 0))"
+
+
+def _table_exists(conn, name: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+def ensure_smart_money_dirty_tracking(conn) -> None:
+    """
+    Dirty set for incremental refreshes, filled by triggers on `holders` and `wallets_stats`.
+
+    Rows are ('market', condition_id) when a market's holders change and ('wallet', address) when
+    a wallet appears, disappears or its PnL changes sign. Installing the tracking records a
+    ('full', '*') marker, because changes made before it existed were not captured.
+    """
+
+    if _table_exists(conn, "smart_money_dirty"):
+        return
+    conn.executescript(
+        f"""
+        CREATE TABLE IF NOT EXISTS smart_money_dirty (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        ) WITHOUT ROWID;
+
+        CREATE TRIGGER IF NOT EXISTS trg_holders_dirty_insert AFTER INSERT ON holders
+        WHEN NEW.market_id IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key) VALUES ('market', NEW.market_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_holders_dirty_delete AFTER DELETE ON holders
+        WHEN OLD.market_id IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key) VALUES ('market', OLD.market_id);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_holders_dirty_update AFTER UPDATE ON holders
+        BEGIN
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key)
+            SELECT 'market', OLD.market_id WHERE OLD.market_id IS NOT NULL;
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key)
+            SELECT 'market', NEW.market_id WHERE NEW.market_id IS NOT NULL;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_wallets_stats_dirty_insert AFTER INSERT ON wallets_stats
+        BEGIN
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key) VALUES ('wallet', NEW.wallet_address);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_wallets_stats_dirty_delete AFTER DELETE ON wallets_stats
+        BEGIN
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key) VALUES ('wallet', OLD.wallet_address);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_wallets_stats_dirty_pnl AFTER UPDATE OF total_pnl ON wallets_stats
+        WHEN {_PNL_SIGN.format(col="NEW.total_pnl")} IS NOT {_PNL_SIGN.format(col="OLD.total_pnl")}
+        BEGIN
+            INSERT OR IGNORE INTO smart_money_dirty (kind, key) VALUES ('wallet', NEW.wallet_address);
+        END;
+
+        INSERT OR IGNORE INTO smart_money_dirty (kind, key) VALUES ('full', '*');
+        """
+    )
+
+
 def rebuild_market_smart_money_stats(conn, generated_at: str | None = None) -> str:
+    """
+    Full recompute of every market (also the reference the incremental refresh is verified against).
+    """
+
     ensure_market_smart_money_stats_schema(conn)
     now_iso = generated_at or datetime.now(timezone.utc).isoformat()
 
@@ -77,48 +195,74 @@ def rebuild_market_smart_money_stats(conn, generated_at: str | None = None) -> s
         """
     )
 
-    conn.execute(
+    conn.execute(_UPSERT_STATS_SQL.format(where="h.market_id IS NOT NULL"), (now_iso,))
+    if _table_exists(conn, "smart_money_dirty"):
+        conn.execute("DELETE FROM smart_money_dirty")
+    bump_data_version(conn, SMART_MONEY_VERSION_KEY, updated_at=now_iso)
+    return now_iso
+
+
+def refresh_market_smart_money_stats(conn, generated_at: str | None = None, full: bool = False) -> dict:
+    """
+    Recomputes only markets in the dirty set: markets whose holders changed, plus every market held
+    by a wallet whose PnL changed sign (found through the holders wallet index). Falls back to a
+    full rebuild when asked, when tracking was just installed, or when the stats table is empty.
+
+    Returns {"mode", "markets", "wallets", "updated_at"}.
+    """
+
+    ensure_market_smart_money_stats_schema(conn)
+    ensure_smart_money_dirty_tracking(conn)
+
+    needs_full = full or conn.execute(
+        """
+        SELECT EXISTS (SELECT 1 FROM smart_money_dirty WHERE kind = 'full')
+            OR (NOT EXISTS (SELECT 1 FROM market_smart_money_stats) AND EXISTS (SELECT 1 FROM holders))
         """
-        INSERT INTO market_smart_money_stats (
-            condition_id,
-            yes_profitable_count,
-            yes_losing_count,
-            yes_total,
-            no_profitable_count,
-            no_losing_count,
-            no_total,
-            smart_money_win_rate,
-            last_updated_at
+    ).fetchone()[0]
+    if needs_full:
+        now_iso = rebuild_market_smart_money_stats(conn, generated_at=generated_at)
+        markets = conn.execute("SELECT COUNT(*) FROM market_smart_money_stats").fetchone()[0]
+        return {"mode": "full", "markets": markets, "wallets": 0, "updated_at": now_iso}
+
+    now_iso = generated_at or datetime.now(timezone.utc).isoformat()
+    # Work from a copy so changes committed by other writers meanwhile stay queued for next time
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _sm_dirty (kind TEXT, key TEXT, PRIMARY KEY (kind, key))")
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _sm_dirty_markets (condition_id TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM _sm_dirty")
+    conn.execute("DELETE FROM _sm_dirty_markets")
+    try:
+        conn.execute("INSERT INTO _sm_dirty (kind, key) SELECT kind, key FROM smart_money_dirty")
+        conn.execute("INSERT OR IGNORE INTO _sm_dirty_markets SELECT key FROM _sm_dirty WHERE kind = 'market'")
+        conn.execute(
+            """
+            INSERT OR IGNORE INTO _sm_dirty_markets
+            SELECT DISTINCT h.market_id
+            FROM _sm_dirty d
+            JOIN holders h ON h.wallet_address = d.key
+            WHERE d.kind = 'wallet' AND h.market_id IS NOT NULL
+            """
         )
-        SELECT
-            h.market_id AS condition_id,
-            SUM(CASE WHEN h.outcome_index = 0 AND ws.total_pnl > 0 THEN 1 ELSE 0 END) AS yes_profitable_count,
-            SUM(CASE WHEN h.outcome_index = 0 AND ws.total_pnl < 0 THEN 1 ELSE 0 END) AS yes_losing_count,
-            SUM(CASE WHEN h.outcome_index = 0 THEN 1 ELSE 0 END) AS yes_total,
-            SUM(CASE WHEN h.outcome_index = 1 AND ws.total_pnl > 0 THEN 1 ELSE 0 END) AS no_profitable_count,
-            SUM(CASE WHEN h.outcome_index = 1 AND ws.total_pnl < 0 THEN 1 ELSE 0 END) AS no_losing_count,
-            SUM(CASE WHEN h.outcome_index = 1 THEN 1 ELSE 0 END) AS no_total,
-            CASE
-                WHEN COUNT(*) > 0
-                THEN CAST(SUM(CASE WHEN ws.total_pnl > 0 THEN 1 ELSE 0 END) AS REAL) / COUNT(*)
-                ELSE NULL
-            END AS smart_money_win_rate,
-            ? AS last_updated_at
-        FROM holders h
-        LEFT JOIN wallets_stats ws
-          ON h.wallet_address = ws.wallet_address
-        WHERE h.market_id IS NOT NULL
-        GROUP BY h.market_id
-        ON CONFLICT(condition_id) DO UPDATE SET
-            yes_profitable_count = excluded.yes_profitable_count,
-            yes_losing_count = excluded.yes_losing_count,
-            yes_total = excluded.yes_total,
-            no_profitable_count = excluded.no_profitable_count,
-            no_losing_count = excluded.no_losing_count,
-            no_total = excluded.no_total,
-            smart_money_win_rate = excluded.smart_money_win_rate,
-            last_updated_at = excluded.last_updated_at
-        """,
-        (now_iso,),
-    )
-    return now_iso
+        markets = conn.execute("SELECT COUNT(*) FROM _sm_dirty_markets").fetchone()[0]
+        wallets = conn.execute("SELECT COUNT(*) FROM _sm_dirty WHERE kind = 'wallet'").fetchone()[0]
+
+        conn.execute(
+            """
+            DELETE FROM market_smart_money_stats
+            WHERE condition_id IN (SELECT condition_id FROM _sm_dirty_markets)
+              AND NOT EXISTS (SELECT 1 FROM holders h WHERE h.market_id = market_smart_money_stats.condition_id)
+            """
+        )
+        conn.execute(
+            _UPSERT_STATS_SQL.format(where="h.market_id IN (SELECT condition_id FROM _sm_dirty_markets)"),
+            (now_iso,),
+        )
+        conn.execute(
+            "DELETE FROM smart_money_dirty WHERE (kind, key) IN (SELECT kind, key FROM _sm_dirty)"
+        )
+    finally:
+        conn.execute("DELETE FROM _sm_dirty")
+        conn.execute("DELETE FROM _sm_dirty_markets")
+    if markets:
+        bump_data_version(conn, SMART_MONEY_VERSION_KEY, updated_at=now_iso)
+    return {"mode": "incremental", "markets": markets, "wallets": wallets, "updated_at": now_iso}
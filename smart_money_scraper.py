@@ -1,19 +1,68 @@
+import os
 import time
+import asyncio
 import logging
 import sqlite3
 import argparse
+import functools
 import concurrent.futures
 from datetime import datetime, timezone
-from typing import List, Set, Dict, Tuple, Optional
+from typing import Any, Callable, Iterable, List, Set, Dict, Tuple, Optional, Union
 
-from holders_client import HoldersClient, PnLClient
+from db_writer import DbWriter
+from goldsky_client import GoldskyHoldersClient
+from holder_changes import ensure_holder_changes_schema, prune_holder_changes, record_holder_changes
+from holders_client import FailoverHoldersClient, HoldersClient, PnLClient
+from http_transport import log_transport_stats
 from main import get_db_connection
 from logging_setup import setup_logging
-from smart_money_materialized import rebuild_market_smart_money_stats
+from rate_limit import CircuitBreaker, TokenBucket
+from run_ledger import (
+    MODE_FULL,
+    MODE_WALLETS,
+    PHASE_HOLDERS,
+    PHASE_METRICS,
+    PHASE_PNL,
+    RunLedger,
+    add_markets,
+    add_wallets,
+    ensure_run_ledger_schema,
+    finish_run,
+    mark_market_done,
+    mark_market_failed,
+    mark_wallets_done,
+    remaining_markets,
+    run_wallets,
+    set_phase,
+    start_run,
+)
+from refresh_planner import ensure_holder_schedule_schema, mark_holders_fetched, plan_holder_refresh, plan_pnl_refresh
+from runtime_paths import env_flag
+from smart_money_materialized import ensure_smart_money_dirty_tracking, refresh_market_smart_money_stats
 
 setup_logging("smart_money")
 logger = logging.getLogger("polylab.smart_money")
 
+# Legacy thread-pool mode: fixed pool size and a per-request pause to spread load
+LEGACY_WORKERS = 10
+LEGACY_WORKER_DELAY = 0.3
+# Async crawler mode: requests in flight and one requests/second budget shared by the holders and PnL phases
+SMART_MONEY_ASYNC = env_flag("SMART_MONEY_ASYNC", default=False)
+SMART_MONEY_CONCURRENCY = int(os.environ.get("SMART_MONEY_CONCURRENCY", "32"))
+SMART_MONEY_RPS = float(os.environ.get("SMART_MONEY_RPS", "20"))
+SMART_MONEY_BURST = float(os.environ.get("SMART_MONEY_BURST", "0")) or None
+# Pick markets by the tiered holder schedule (refresh_planner) instead of every active market each run
+SMART_MONEY_TIERED_HOLDERS = env_flag("SMART_MONEY_TIERED_HOLDERS", default=True)
+# Persist holders and wallet stats through one writer thread (batched transactions) instead of per-worker commits
+SMART_MONEY_SINGLE_WRITER = env_flag("SMART_MONEY_SINGLE_WRITER", default=True)
+# Holder source: "data-api" (top 20 per outcome, one call per market) or "goldsky" (full depth, batched subgraph queries)
+SMART_MONEY_HOLDERS_BACKEND = os.environ.get("SMART_MONEY_HOLDERS_BACKEND", "data-api")
+HOLDERS_BACKENDS = ("data-api", "goldsky")
+# Circuit breakers on the holder backends; when the chosen one trips, markets move to the other one
+SMART_MONEY_HOLDERS_FAILOVER = env_flag("SMART_MONEY_HOLDERS_FAILOVER", default=True)
+# Record per-market and per-wallet progress so a crashed or restarted run continues where it stopped
+SMART_MONEY_RUN_LEDGER = env_flag("SMART_MONEY_RUN_LEDGER", default=True)
+
 def get_active_market_ids(limit: Optional[int] = None, randomize: bool = False) -> List[str]:
     conn = get_db_connection()
     try:
@@ -30,7 +79,34 @@ def get_active_market_ids(limit: Optional[int] = None, randomize: bool = False)
     finally:
         conn.close()
 
+def get_scheduled_market_ids(budget: Optional[int] = None) -> List[str]:
+    """
+    Active markets whose holders are due under the tier schedule (hot markets first).
+    """
+    conn = get_db_connection()
+    try:
+        plan = plan_holder_refresh(conn, budget=budget)
+    finally:
+        conn.close()
+    logger.info(
+        f"Plán holderů: {len(plan.due)} trhů k obnovení {plan.due_by_tier}, {plan.not_due} ještě čerstvých, "
+        f"{len(plan.deferred)} odloženo (limit volání)."
+    )
+    return plan.due
+
 def save_holders_batch(conn: sqlite3.Connection, condition_id: str, holders: List[Dict]):
+    # Previous holder set, diffed below into the position change log
+    try:
+        previous = [
+            (r[0], r[1], r[2])
+            for r in conn.execute(
+                "SELECT outcome_index, wallet_address, position_size FROM holders WHERE market_id = ?", (condition_id,)
+            ).fetchall()
+        ]
+    except Exception as e:
+        logger.warning(f"Nelze načíst předchozí holdery pro {condition_id}: {e}")
+        previous = None
+
     # Delete existing for this market to avoid duplicates/stale data for the current snapshot
     conn.execute("DELETE FROM holders WHERE market_id = ?", (condition_id,))
     
@@ -52,6 +128,14 @@ def save_holders_batch(conn: sqlite3.Connection, condition_id: str, holders: Lis
             INSERT INTO holders (market_id, outcome_index, wallet_address, position_size, snapshot_at)
             VALUES (?, ?, ?, ?, ?)
         """, records)
+    mark_holders_fetched(conn, condition_id, snapshot_at)
+
+    if previous is not None:
+        # Best-effort: the change log must never block saving the holders themselves
+        try:
+            record_holder_changes(conn, condition_id, previous, [r[1:4] for r in records], snapshot_at)
+        except Exception as e:
+            logger.warning(f"Změny holderů pro {condition_id} se nepodařilo zapsat: {e}")
 
 def save_wallet_stats(conn: sqlite3.Connection, wallet: str, pnl: float, alias: Optional[str] = None):
     last_updated = datetime.now(timezone.utc).isoformat()
@@ -69,20 +153,35 @@ def save_wallet_stats(conn: sqlite3.Connection, wallet: str, pnl: float, alias:
             alias = COALESCE(excluded.alias, wallets_stats.alias)
     """, (wallet, pnl, last_updated, alias))
 
-def process_market_holders_worker(condition_id: str) -> Optional[Dict[str, Optional[str]]]:
+def save_wallet_aliases(conn: sqlite3.Connection, aliases: Dict[str, Optional[str]]):
+    """
+    Records aliases seen in holders for wallets whose PnL is not refreshed this run.
+    """
+    conn.executemany(
+        "UPDATE wallets_stats SET alias = ? WHERE wallet_address = ?",
+        [(alias, wallet) for wallet, alias in aliases.items() if alias],
+    )
+
+def process_market_holders_worker(
+    condition_id: str,
+    delay: float = LEGACY_WORKER_DELAY,
+    holders_client: Optional[HoldersClient] = None,
+    writer: Optional[DbWriter] = None,
+) -> Optional[Dict[str, Optional[str]]]:
     """
     Worker function to fetch holders for a single market using Legacy API.
     Returns a dict mapping wallet_address -> alias (or None) if successful,
     or None if the fetch failed (to be retried in second pass).
     """
-    # Small sleep to distribute load
-    time.sleep(0.3)
+    # Small sleep to distribute load (the async crawler paces through its rate limiter instead)
+    if delay:
+        time.sleep(delay)
     
-    unique_wallets = {} # address -> alias
     data = None
 
     try:
-        holders_client = HoldersClient()
+        # Clients are thin wrappers over the shared pooled transport, so per-call instances are cheap
+        holders_client = holders_client or HoldersClient()
         # Request 1000 to be safe and get as many holders as possible for win rate accuracy
         data = holders_client.fetch_holders(condition_id, limit=1000)
         if data is not None:
@@ -90,16 +189,22 @@ def process_market_holders_worker(condition_id: str) -> Optional[Dict[str, Optio
     except Exception as e:
         logger.error(f"Legacy API fetch failed for {condition_id}: {e}")
 
+    return store_market_holders(condition_id, data, writer=writer)
+
+def store_market_holders(
+    condition_id: str,
+    data: Optional[List[Dict]],
+    writer: Optional[DbWriter] = None,
+) -> Union[Optional[Dict[str, Optional[str]]], concurrent.futures.Future]:
+    """
+    Saves a market's fetched holders and returns {wallet_address: alias}, or None when there is
+    nothing to save (failed fetch) or saving failed, so the market goes to the retry pass.
+    With a writer the save is queued, and a future of that same result is returned instead; it
+    resolves once the writer has committed (or rolled back) the save.
+    """
+    unique_wallets = {} # address -> alias
     if data is not None:
         try:
-            # We need a fresh connection per thread for SQLite safety
-            conn = get_db_connection()
-            try:
-                save_holders_batch(conn, condition_id, data)
-                conn.commit()
-            finally:
-                conn.close()
-            
             # Extract unique wallets and aliases
             for h in data:
                 addr = h.get("address") or h.get("user")
@@ -110,6 +215,29 @@ def process_market_holders_worker(condition_id: str) -> Optional[Dict[str, Optio
                     if alias == "": 
                         alias = None
                     unique_wallets[addr] = alias
+
+            if writer is not None:
+                # Batched into the writer thread's next transaction
+                saved = writer.submit(save_holders_batch, condition_id, data)
+                result: concurrent.futures.Future = concurrent.futures.Future()
+
+                def on_saved(done: concurrent.futures.Future) -> None:
+                    if done.exception() is not None:
+                        logger.error(f"Failed to save holders for {condition_id}: {done.exception()}")
+                        result.set_result(None)
+                    else:
+                        result.set_result(unique_wallets)
+
+                saved.add_done_callback(on_saved)
+                return result
+
+            # We need a fresh connection per thread for SQLite safety
+            conn = get_db_connection()
+            try:
+                save_holders_batch(conn, condition_id, data)
+                conn.commit()
+            finally:
+                conn.close()
             
             return unique_wallets
 
@@ -117,18 +245,137 @@ def process_market_holders_worker(condition_id: str) -> Optional[Dict[str, Optio
             logger.error(f"Failed to save holders for {condition_id}: {e}")
             return None # Treat save failure as something that might need retry or investigation
     else:
-        logger.warning(f"No holders data found for market {condition_id} (Legacy API failed).")
+        logger.warning(f"No holders data found for market {condition_id} (fetch failed).")
         return None
 
-def fetch_pnl_worker(wallet: str) -> Tuple[str, float]:
+def map_goldsky_holders(
+    client: GoldskyHoldersClient,
+    worker: Callable[[Any], Any],
+    items: Iterable[str],
+    on_result: Callable[[Any, concurrent.futures.Future], None],
+    writer: Optional[DbWriter] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    fallback: Optional[Callable] = None,
+) -> None:
+    """
+    Goldsky backend for the holders phase, with the `map_threaded` contract: the client fetches
+    many markets per request and hands back each one as its pages complete.
+
+    With a `breaker` and a `fallback` map, markets the open breaker refuses, and markets that fail
+    while it trips, are run through `fallback(worker, markets, on_result)` (the per-market data-api worker).
+    """
+    diverted = []
+
+    def admitted():
+        for condition_id in items:
+            if breaker is None or fallback is None or breaker.allow():
+                yield condition_id
+            else:
+                diverted.append(condition_id)
+
+    for condition_id, data in client.iter_holders(admitted()):
+        if breaker is not None:
+            breaker.record(data is not None)
+            if data is None and fallback is not None and breaker.state != CircuitBreaker.CLOSED:
+                diverted.append(condition_id)
+                continue
+        future = concurrent.futures.Future()
+        future.set_result(store_market_holders(condition_id, data, writer=writer))
+        on_result(condition_id, future)
+
+    if diverted:
+        logger.warning(f"Goldsky nedostupný (circuit {breaker.state}), {len(diverted)} trhů přes data-api.")
+        fallback(worker, diverted, on_result)
+
+def fetch_pnl_worker(
+    wallet: str,
+    delay: float = LEGACY_WORKER_DELAY,
+    client: Optional[PnLClient] = None,
+) -> Tuple[str, Optional[float]]:
     """
     Worker function to fetch PnL for a single wallet with a safety sleep.
+    PnL is None when the fetch failed; the wallet is then left due for the next run.
     """
     # Sleep to respect rate limits (distributes load across workers)
-    time.sleep(0.3)
-    client = PnLClient() 
-    val = client.fetch_user_pnl(wallet)
-    return wallet, (val if val is not None else 0.0)
+    if delay:
+        time.sleep(delay)
+    client = client or PnLClient()
+    return wallet, client.fetch_user_pnl(wallet)
+
+def map_threaded(
+    worker: Callable[[Any], Any],
+    items: Iterable[Any],
+    on_result: Callable[[Any, concurrent.futures.Future], None],
+) -> None:
+    """
+    Legacy mode: runs `worker` over `items` on a fixed thread pool and hands each finished
+    future to `on_result` (on the calling thread, in completion order).
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=LEGACY_WORKERS) as executor:
+        future_to_item = {executor.submit(worker, item): item for item in items}
+        for future in concurrent.futures.as_completed(future_to_item):
+            on_result(future_to_item[future], future)
+
+class SmartMoneyCrawler:
+    """
+    Async crawler for the holders and PnL phases.
+
+    Requests run through the blocking clients on a worker pool with at most `concurrency` in
+    flight, paced by one token bucket that both phases share. A 429 halves the bucket's rate and
+    pauses every worker for the server's `Retry-After` instead of each worker backing off on its own.
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, rps: Optional[float] = None, burst: Optional[float] = None):
+        self.concurrency = max(1, concurrency or SMART_MONEY_CONCURRENCY)
+        rate = rps or SMART_MONEY_RPS
+        self.limiter = TokenBucket(rate, burst or SMART_MONEY_BURST or rate, name="smart_money")
+
+    def holders_worker(
+        self,
+        condition_id: str,
+        writer: Optional[DbWriter] = None,
+        holders_client: Optional[Any] = None,
+    ) -> Optional[Dict[str, Optional[str]]]:
+        return process_market_holders_worker(
+            condition_id, delay=0, holders_client=holders_client or HoldersClient(limiter=self.limiter), writer=writer
+        )
+
+    def pnl_worker(self, wallet: str) -> Tuple[str, Optional[float]]:
+        return fetch_pnl_worker(wallet, delay=0, client=PnLClient(limiter=self.limiter))
+
+    async def _map(self, worker, items, on_result) -> None:
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="smart_money")
+
+        async def _run(item):
+            async with semaphore:
+                future = loop.create_future()
+                try:
+                    future.set_result(await loop.run_in_executor(executor, worker, item))
+                except Exception as e:
+                    future.set_exception(e)
+                return item, future
+
+        try:
+            for task in asyncio.as_completed([_run(item) for item in items]):
+                item, future = await task
+                on_result(item, future)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def map(self, worker, items, on_result) -> None:
+        """
+        Same contract as `map_threaded`: `on_result(item, future)` runs on the calling thread.
+        """
+        asyncio.run(self._map(worker, list(items), on_result))
+
+    def log_stats(self) -> None:
+        stats = self.limiter.stats()
+        logger.info(
+            "Async crawler: %d requests, %d throttled, %.1fs waited, rate %.2f/%.2f req/s",
+            stats["acquired"], stats["throttled"], stats["waited_seconds"], stats["rate"], stats["max_rate"],
+        )
 
 def get_unique_wallets_from_db() -> Dict[str, Optional[str]]:
     """
@@ -148,41 +395,177 @@ def run(args_list: Optional[List[str]] = None):
     parser.add_argument("--limit", type=int, default=None, help="Limit number of markets to process (for testing)")
     parser.add_argument("--randomize", action="store_true", help="Randomize market selection (use with --limit)")
     parser.add_argument("--resume", action="store_true", help="Only fetch PnL for existing wallets in DB")
+    parser.add_argument("--async", dest="use_async", action="store_true", default=SMART_MONEY_ASYNC,
+                        help="Use the async crawler with a shared rate budget (env SMART_MONEY_ASYNC)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Async crawler: requests in flight")
+    parser.add_argument("--rps", type=float, default=None, help="Async crawler: requests per second across both phases")
+    parser.add_argument("--pnl-ttl-hours", type=float, default=None,
+                        help="Skip wallets whose PnL is younger than this (env SMART_MONEY_PNL_TTL_HOURS, 0 = refresh all)")
+    parser.add_argument("--pnl-budget", type=int, default=None,
+                        help="Max PnL calls this run (env SMART_MONEY_PNL_BUDGET, 0 = no cap)")
+    parser.add_argument("--all-markets", dest="tiered", action="store_false", default=SMART_MONEY_TIERED_HOLDERS,
+                        help="Refresh holders of every active market instead of only those due under the tier schedule")
+    parser.add_argument("--holders-budget", type=int, default=None,
+                        help="Max holder calls this run (env HOLDERS_REFRESH_BUDGET, 0 = no cap)")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Recompute smart-money stats for every market instead of only the changed ones")
+    parser.add_argument("--no-single-writer", dest="single_writer", action="store_false", default=SMART_MONEY_SINGLE_WRITER,
+                        help="Commit from each worker instead of the batching writer thread")
+    parser.add_argument("--holders-backend", choices=HOLDERS_BACKENDS, default=SMART_MONEY_HOLDERS_BACKEND,
+                        help="Where holders come from (env SMART_MONEY_HOLDERS_BACKEND)")
+    parser.add_argument("--no-failover", dest="failover", action="store_false", default=SMART_MONEY_HOLDERS_FAILOVER,
+                        help="Do not switch holder backends when the chosen one trips its circuit breaker")
+    parser.add_argument("--fresh-run", action="store_true",
+                        help="Start a new run even if an unfinished one could be continued")
+    parser.add_argument("--no-ledger", dest="ledger", action="store_false", default=SMART_MONEY_RUN_LEDGER,
+                        help="Do not record run progress (env SMART_MONEY_RUN_LEDGER)")
     args = parser.parse_args(args_list)
 
     start_time = time.time()
-    logger.info(f"Starting Smart Money Scraper job... (Resume mode: {args.resume})")
+    logger.info(
+        f"Starting Smart Money Scraper job... (Resume mode: {args.resume}, async: {args.use_async}, "
+        f"holders: {args.holders_backend})"
+    )
+
+    crawler = SmartMoneyCrawler(concurrency=args.concurrency, rps=args.rps) if args.use_async else None
+    map_results = crawler.map if crawler else map_threaded
+    holders_worker = crawler.holders_worker if crawler else process_market_holders_worker
+    pnl_worker = crawler.pnl_worker if crawler else fetch_pnl_worker
     
-    all_unique_wallets = {} # address -> alias
+    try:
+        # Install change tracking before phase 1 writes, so phase 3 can recompute only dirty markets
+        conn = get_db_connection()
+        try:
+            ensure_smart_money_dirty_tracking(conn)
+            ensure_holder_schedule_schema(conn)
+            ensure_holder_changes_schema(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Sledování změn pro smart money metriky nelze zapnout: {e}")
 
-    if args.resume:
-        logger.info("Načítám unikátní peněženky z existující tabulky holders...")
-        all_unique_wallets = get_unique_wallets_from_db()
-    else:
+    writer = DbWriter(get_db_connection).start() if args.single_writer else None
+    if writer is not None:
+        holders_worker = functools.partial(holders_worker, writer=writer)
+    failover = None
+    if args.failover:
+        data_api = HoldersClient(limiter=crawler.limiter) if crawler else HoldersClient()
+        backends = [("data-api", data_api)]
+        if args.holders_backend == "data-api":
+            backends.append(("goldsky", GoldskyHoldersClient()))
+        failover = FailoverHoldersClient(backends)
+        holders_worker = functools.partial(holders_worker, holders_client=failover)
+    map_holders = map_results
+    goldsky_breaker = None
+    if args.holders_backend == "goldsky":
+        goldsky_breaker = CircuitBreaker(name="holders:goldsky") if failover else None
+        map_holders = functools.partial(
+            map_goldsky_holders,
+            GoldskyHoldersClient(),
+            writer=writer,
+            breaker=goldsky_breaker,
+            fallback=map_results if failover else None,
+        )
+
+    ledger = None
+    if args.ledger:
         try:
-            condition_ids = get_active_market_ids(limit=args.limit, randomize=args.randomize)
+            conn = get_db_connection()
+            try:
+                ensure_run_ledger_schema(conn)
+                if args.fresh_run:
+                    for row in conn.execute("SELECT run_id FROM smart_money_runs WHERE finished_at IS NULL").fetchall():
+                        finish_run(conn, row[0], status="abandoned")
+                state = start_run(conn, MODE_WALLETS if args.resume else MODE_FULL)
+                conn.commit()
+            finally:
+                conn.close()
+            ledger = RunLedger(get_db_connection, state, writer)
         except Exception as e:
-            logger.error(f"Failed to get active markets: {e}")
-            return
+            # The ledger only makes runs resumable; without it the run starts from scratch as before
+            logger.warning(f"Ledger běhu nelze otevřít, běh nepůjde po pádu navázat: {e}")
+
+    try:
+        all_unique_wallets = {} # address -> alias
+        done_wallets = set()  # PnL already handled by the resumed run
 
-        logger.info(f"Found {len(condition_ids)} active markets to process.")
+        if ledger is not None and ledger.state.resumed:
+            all_unique_wallets, done_wallets = ledger.read(run_wallets)
+            logger.info(
+                f"Navazuji na nedokončený běh {ledger.run_id} (fáze {ledger.state.phase}): "
+                f"{len(all_unique_wallets)} známých peněženek, {len(done_wallets)} již zpracovaných."
+            )
+
+        if args.resume:
+            if not all_unique_wallets:
+                logger.info("Načítám unikátní peněženky z existující tabulky holders...")
+                all_unique_wallets = get_unique_wallets_from_db()
+                if ledger is not None:
+                    ledger.record(add_wallets, all_unique_wallets)
+        elif ledger is not None and ledger.state.resumed and ledger.state.phase != PHASE_HOLDERS:
+            logger.info("Faze 1 byla v přerušeném běhu dokončena, přeskakuji ji.")
+        else:
+            condition_ids = None
+            if ledger is not None and ledger.state.resumed:
+                # Failed markets of the interrupted run come first and go through the retry pass again
+                condition_ids = ledger.read(remaining_markets)
+            if condition_ids is None and args.tiered and args.limit is None and not args.randomize:
+                try:
+                    condition_ids = get_scheduled_market_ids(budget=args.holders_budget)
+                except Exception as e:
+                    # The schedule only trims work; without it every active market is refreshed
+                    logger.warning(f"Plán holderů selhal, zpracuji všechny aktivní trhy: {e}")
+            if condition_ids is None:
+                try:
+                    condition_ids = get_active_market_ids(limit=args.limit, randomize=args.randomize)
+                except Exception as e:
+                    logger.error(f"Failed to get active markets: {e}")
+                    if ledger is not None:
+                        ledger.record(finish_run, "abandoned")
+                    return
+            if ledger is not None and not ledger.state.resumed:
+                ledger.record(add_markets, condition_ids)
+
+            logger.info(f"Found {len(condition_ids)} active markets to process.")
         
-        # 1. Fetch Holders (Parallelized)
-        logger.info("Faze 1: Stahování holderů pro trhy...")
+            # 1. Fetch Holders (Parallelized)
+            logger.info("Faze 1: Stahování holderů pro trhy...")
         
-        def run_holders_batch(cids: List[str]) -> List[str]:
-            failed_cids = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_cid = {executor.submit(process_market_holders_worker, cid): cid for cid in cids}
-                
+            def run_holders_batch(cids: List[str]) -> List[str]:
+                failed_cids = []
                 count = 0
-                for future in concurrent.futures.as_completed(future_to_cid):
-                    cid = future_to_cid[future]
-                    wallets_dict = future.result()
-                    
+                # Saves still queued in the writer; a market counts only once its save is committed
+                unconfirmed: List[Tuple[str, concurrent.futures.Future]] = []
+
+                def confirm(wait: bool = False) -> None:
+                    if wait:
+                        writer.flush()
+                    still = []
+                    for cid, saved in unconfirmed:
+                        if saved.done():
+                            on_saved(cid, saved.result())
+                        else:
+                            still.append((cid, saved))
+                    unconfirmed[:] = still
+
+                def on_holders(cid: str, future) -> None:
+                    result = future.result()
+                    if isinstance(result, concurrent.futures.Future):
+                        unconfirmed.append((cid, result))
+                        confirm()
+                    else:
+                        on_saved(cid, result)
+
+                def on_saved(cid: str, wallets_dict) -> None:
+                    nonlocal count
                     if wallets_dict is None:
                         failed_cids.append(cid)
+                        if ledger is not None:
+                            ledger.record(mark_market_failed, cid)
                     else:
+                        if ledger is not None:
+                            ledger.record(mark_market_done, cid, wallets_dict)
                         # Update our master dict. If we find an alias later, it overwrites None.
                         # If we have an alias and new one is None, we should keep the alias.
                         for addr, alias in wallets_dict.items():
@@ -190,64 +573,134 @@ def run(args_list: Optional[List[str]] = None):
                                 all_unique_wallets[addr] = alias
                             elif all_unique_wallets[addr] is None and alias is not None:
                                 all_unique_wallets[addr] = alias
-                                
+
                     count += 1
                     if count % 100 == 0:
                         logger.info(f"Zpracováno držitelů pro {count}/{len(cids)} trhů.")
-            return failed_cids
 
-        # First pass
-        failed_markets = run_holders_batch(condition_ids)
+                map_holders(holders_worker, cids, on_holders)
+                if unconfirmed:
+                    confirm(wait=True)
+                return failed_cids
+
+            # First pass
+            failed_markets = run_holders_batch(condition_ids)
         
-        # Second pass (Retry)
-        if failed_markets:
-            logger.info(f"Faze 1b: Druhý průchod (Retry) pro {len(failed_markets)} selhaných trhů...")
-            # Wait a bit before second pass to let rate limits settle
-            time.sleep(5)
-            still_failed = run_holders_batch(failed_markets)
+            # Second pass (Retry)
+            if failed_markets:
+                logger.info(f"Faze 1b: Druhý průchod (Retry) pro {len(failed_markets)} selhaných trhů...")
+                # Wait a bit before second pass to let rate limits settle (the async limiter already backs off)
+                if crawler is None:
+                    time.sleep(5)
+                still_failed = run_holders_batch(failed_markets)
             
-            recovered = len(failed_markets) - len(still_failed)
-            logger.info(f"Druhý průchod dokončen. Zachráněno {recovered} trhů, stále selhává {len(still_failed)}.")
+                recovered = len(failed_markets) - len(still_failed)
+                logger.info(f"Druhý průchod dokončen. Zachráněno {recovered} trhů, stále selhává {len(still_failed)}.")
+
+        if ledger is not None:
+            ledger.record(set_phase, PHASE_PNL)
                         
-    logger.info(f"Nalezeno {len(all_unique_wallets)} unikátních peněženek k analýze.")
+        logger.info(f"Nalezeno {len(all_unique_wallets)} unikátních peněženek k analýze.")
     
-    # 2. Fetch PnL (Parallelized with robust Retry)
-    if not all_unique_wallets:
-        logger.info("Žádné peněženky ke zpracování.")
-        return
+        # 2. Fetch PnL (Parallelized with robust Retry)
+        if not all_unique_wallets:
+            logger.info("Žádné peněženky ke zpracování.")
+            if ledger is not None:
+                ledger.record(finish_run, "done")
+            return
+
+        logger.info("Faze 2: Stahování P/L pro peněženky (s Retry logikou)...")
+        conn = get_db_connection()
+        try:
+            if writer is not None:
+                writer.flush()  # the planner reads the holders written in phase 1
+            try:
+                pending = [w for w in all_unique_wallets if w not in done_wallets]
+                plan = plan_pnl_refresh(conn, pending, ttl_hours=args.pnl_ttl_hours, budget=args.pnl_budget)
+                to_refresh = plan.refresh
+                aliases = {w: all_unique_wallets[w] for w in plan.fresh + plan.deferred}
+                if writer is not None:
+                    writer.submit(save_wallet_aliases, aliases)
+                else:
+                    save_wallet_aliases(conn, aliases)
+                if ledger is not None:
+                    # Skipped wallets count as handled, so a restart keeps this run's call budget
+                    ledger.record(mark_wallets_done, plan.fresh + plan.deferred, conn=conn)
+                logger.info(
+                    f"Plán P/L: {len(plan.refresh)} k obnovení, {len(plan.fresh)} čerstvých (TTL), "
+                    f"{len(plan.deferred)} odloženo (limit volání)."
+                )
+            except Exception as e:
+                # Planning is an optimisation only; without it every wallet is refreshed as before
+                logger.warning(f"Plánování P/L selhalo, obnovuji všechny peněženky: {e}")
+                to_refresh = [w for w in all_unique_wallets if w not in done_wallets]
+            conn.commit()  # release the write lock before workers start saving
 
-    logger.info("Faze 2: Stahování P/L pro peněženky (s Retry logikou)...")
-    conn = get_db_connection()
-    try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            future_to_wallet = {executor.submit(fetch_pnl_worker, w): w for w in all_unique_wallets.keys()}
-            
             count = 0
-            for future in concurrent.futures.as_completed(future_to_wallet):
-                w = future_to_wallet[future]
+
+            def on_pnl(w: str, future) -> None:
+                nonlocal count
                 try:
                     wallet, pnl = future.result()
+                    if pnl is None:
+                        # No made-up 0: a stamped row would sit out the TTL with a wrong PnL sign
+                        logger.warning(f"P/L pro {wallet} se nepodařilo stáhnout, zůstává k obnovení.")
+                        return
                     # Retrieve the alias we found earlier
                     alias = all_unique_wallets.get(wallet)
-                    save_wallet_stats(conn, wallet, pnl, alias=alias)
+                    if writer is not None:
+                        writer.submit(save_wallet_stats, wallet, pnl, alias)
+                    else:
+                        save_wallet_stats(conn, wallet, pnl, alias=alias)
+                    if ledger is not None:
+                        ledger.record(mark_wallets_done, [wallet], conn=conn)
                     count += 1
                     if count % 100 == 0:
-                        conn.commit() # Batch commit
-                        logger.info(f"Zpracováno P/L pro {count}/{len(all_unique_wallets)} peněženek.")
+                        if writer is None:
+                            conn.commit() # Batch commit
+                        logger.info(f"Zpracováno P/L pro {count}/{len(to_refresh)} peněženek.")
                 except Exception as e:
                     logger.error(f"Kritická chyba při zpracování workeru pro {w}: {e}")
-            
-            conn.commit() 
+
+            map_results(pnl_worker, to_refresh, on_pnl)
+            if ledger is not None:
+                ledger.record(set_phase, PHASE_METRICS, conn=conn)
+            if writer is not None:
+                writer.flush()
+            conn.commit()
         
-        # 3. Calculate and Update Metrics
-        logger.info("Faze 3: Výpočet a aktualizace Smart Money metrik...")
-        now_iso = rebuild_market_smart_money_stats(conn)
-        conn.commit()
-        logger.info("Všechny metriky byly úspěšně aktualizovány v tabulce market_smart_money_stats.")
+            # 3. Calculate and Update Metrics
+            logger.info("Faze 3: Výpočet a aktualizace Smart Money metrik...")
+            result = refresh_market_smart_money_stats(conn, full=args.full_rebuild)
+            try:
+                prune_holder_changes(conn)
+            except Exception as e:
+                logger.warning(f"Promazání logu změn holderů selhalo: {e}")
+            if ledger is not None:
+                ledger.record(finish_run, "done", conn=conn)
+            conn.commit()
+            logger.info(
+                f"Metriky v market_smart_money_stats aktualizovány ({result['mode']}): "
+                f"{result['markets']} trhů, {result['wallets']} peněženek se změnou P/L."
+            )
 
+        finally:
+            conn.close()
     finally:
-        conn.close()
+        if writer is not None:
+            writer.close()
 
+    if crawler is not None:
+        crawler.log_stats()
+    if failover is not None:
+        failover.log_stats()
+    if goldsky_breaker is not None:
+        stats = goldsky_breaker.stats()
+        logger.info(
+            f"Circuit holders:goldsky: {stats['state']}, {stats['failures']} selhání, "
+            f"otevřen {stats['opened']}x, odmítnuto {stats['rejected']} trhů"
+        )
+    log_transport_stats()
     duration = time.time() - start_time
     logger.info(f"Smart Money Scraper dokončen za {duration:.2f}s")
 
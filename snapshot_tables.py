@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from market_search import SEARCH_TABLE, build_search_index
+
+
+logger = logging.getLogger("polylab.snapshot_tables")
+
+
+STAGING_SUFFIX = "_staging"
+PREV_SUFFIX = "_prev"
+
+SNAPSHOT_TABLE_DDL: dict[str, str] = {
+    "active_market_outcomes": """
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            snapshot_at TEXT,
+            market_id TEXT,
+            condition_id TEXT,
+            outcome_index INTEGER,
+            event_slug TEXT,
+            question TEXT,
+            url TEXT,
+            outcome_name TEXT,
+            price REAL,
+            apr REAL,
+            spread REAL,
+            volume_usd REAL,
+            liquidity_usd REAL,
+            start_date TEXT,
+            end_date TEXT,
+            category TEXT,
+            icon_url TEXT
+        )
+    """,
+    "market_tags": """
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            snapshot_at TEXT,
+            market_id TEXT,
+            tag_label TEXT
+        )
+    """,
+    # Per-market content hash of the stored rows; lets incremental scrapes skip unchanged markets.
+    "market_content_hashes": """
+        CREATE TABLE {name} (
+            market_id TEXT PRIMARY KEY,
+            condition_id TEXT,
+            content_hash TEXT NOT NULL,
+            snapshot_at TEXT
+        ) WITHOUT ROWID
+    """,
+}
+SNAPSHOT_TABLES: tuple[str, ...] = tuple(SNAPSHOT_TABLE_DDL)
+
+# (index name, table, indexed columns). Index names are global in SQLite and travel with a table
+# when it is renamed, so each generation (live / prev / staging) uses its own name slot.
+SNAPSHOT_INDEXES: tuple[tuple[str, str, str], ...] = (
+    ("idx_market_tags_label", "market_tags", "tag_label"),
+    ("idx_market_tags_market_id", "market_tags", "market_id"),
+    ("idx_amo_market_id", "active_market_outcomes", "market_id"),
+    ("idx_amo_condition_id", "active_market_outcomes", "condition_id"),
+    ("idx_amo_outcome_index", "active_market_outcomes", "outcome_index"),
+    ("idx_amo_volume", "active_market_outcomes", "volume_usd DESC"),
+    ("idx_amo_liquidity", "active_market_outcomes", "liquidity_usd DESC"),
+    ("idx_amo_end_date", "active_market_outcomes", "end_date"),
+    ("idx_amo_price", "active_market_outcomes", "price"),
+    ("idx_amo_spread", "active_market_outcomes", "spread"),
+    ("idx_amo_apr", "active_market_outcomes", "apr"),
+    ("idx_amo_question", "active_market_outcomes", "question"),
+    ("idx_amo_outcome", "active_market_outcomes", "outcome_name"),
+)
+INDEX_SLOTS: tuple[str, ...] = ("", "_g1", "_g2")
+
+MARKETS_VERSION_KEY = "markets"
+# Bumped only by full rebuilds, so callers can tell how old the last complete snapshot is.
+FULL_SNAPSHOT_VERSION_KEY = "markets_full"
+# Bumped whenever market_smart_money_stats changes, which /api/markets joins in.
+SMART_MONEY_VERSION_KEY = "smart_money"
+# How many markets versions of per-market changes are kept for downstream consumers.
+MARKET_CHANGES_KEEP_VERSIONS = 48
+
+
+def staging_name(table: str) -> str:
+    return f"{table}{STAGING_SUFFIX}"
+
+
+def prev_name(table: str) -> str:
+    return f"{table}{PREV_SUFFIX}"
+
+
+def _table_exists(conn, table_name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ? LIMIT 1",
+        (table_name,),
+    ).fetchone()
+    return bool(row)
+
+
+def _index_names(conn) -> set[str]:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()}
+
+
+def _table_index_names(conn, table_name: str) -> set[str]:
+    return {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+            (table_name,),
+        ).fetchall()
+    }
+
+
+def ensure_data_versions_schema(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            previous_version INTEGER,
+            updated_at TEXT
+        )
+        """
+    )
+
+
+def get_data_version(conn, name: str = MARKETS_VERSION_KEY) -> Optional[dict]:
+    try:
+        row = conn.execute(
+            "SELECT version, previous_version, updated_at FROM data_versions WHERE name = ?",
+            (name,),
+        ).fetchone()
+    except Exception:
+        return None
+    if not row:
+        return None
+    return {"version": row[0], "previous_version": row[1], "updated_at": row[2]}
+
+
+def bump_data_version(
+    conn,
+    name: str = MARKETS_VERSION_KEY,
+    updated_at: Optional[str] = None,
+    keep_previous: bool = False,
+) -> int:
+    """
+    Moves `name` to a new, never reused version number.
+
+    `keep_previous` leaves `previous_version` alone; used for in-place updates, where the `_prev`
+    tables still hold the generation recorded there.
+    """
+
+    ensure_data_versions_schema(conn)
+    updated_at = updated_at or datetime.now(timezone.utc).isoformat()
+    previous = "data_versions.previous_version" if keep_previous else "data_versions.version"
+    # After a rollback `version` < `previous_version`; numbering continues past both.
+    conn.execute(
+        f"""
+        INSERT INTO data_versions (name, version, previous_version, updated_at)
+        VALUES (?, 1, NULL, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            previous_version = {previous},
+            version = MAX(data_versions.version, COALESCE(data_versions.previous_version, 0)) + 1,
+            updated_at = excluded.updated_at
+        """,
+        (name, updated_at),
+    )
+    return int(conn.execute("SELECT version FROM data_versions WHERE name = ?", (name,)).fetchone()[0])
+
+
+def has_live_snapshot(conn) -> bool:
+    return all(_table_exists(conn, table) for table in SNAPSHOT_TABLES)
+
+
+def ensure_market_changes_schema(conn) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS market_change_batches (
+            version INTEGER PRIMARY KEY,
+            mode TEXT,
+            changed INTEGER,
+            removed INTEGER,
+            recorded_at TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS market_changes (
+            version INTEGER NOT NULL,
+            market_id TEXT NOT NULL,
+            condition_id TEXT,
+            change TEXT NOT NULL,
+            PRIMARY KEY (version, market_id)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _prune_market_changes(conn, version: int) -> None:
+    cutoff = version - MARKET_CHANGES_KEEP_VERSIONS
+    conn.execute("DELETE FROM market_changes WHERE version <= ?", (cutoff,))
+    conn.execute("DELETE FROM market_change_batches WHERE version <= ?", (cutoff,))
+
+
+def record_market_changes(
+    conn,
+    version: int,
+    changes: Iterable[tuple[str, Optional[str], str]],
+    mode: str = "incremental",
+) -> None:
+    """
+    Stores `(market_id, condition_id, change)` rows ("upsert" / "delete") for one markets version.
+    Runs inside the caller's transaction.
+    """
+
+    ensure_market_changes_schema(conn)
+    rows = [(version, market_id, condition_id, change) for market_id, condition_id, change in changes]
+    conn.executemany(
+        "INSERT OR REPLACE INTO market_changes (version, market_id, condition_id, change) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    removed = sum(1 for row in rows if row[3] == "delete")
+    conn.execute(
+        "INSERT OR REPLACE INTO market_change_batches (version, mode, changed, removed, recorded_at) VALUES (?, ?, ?, ?, ?)",
+        (version, mode, len(rows) - removed, removed, datetime.now(timezone.utc).isoformat()),
+    )
+    _prune_market_changes(conn, version)
+
+
+def _record_generation_changes(conn, version: int) -> None:
+    # Diff of the content hashes between the generation just published and the one it replaced.
+    live, prev = "market_content_hashes", prev_name("market_content_hashes")
+    if not _table_exists(conn, prev):
+        return
+    changes = conn.execute(
+        f"""
+        SELECT n.market_id, n.condition_id, 'upsert' FROM {live} n
+        LEFT JOIN {prev} p ON p.market_id = n.market_id
+        WHERE p.content_hash IS NULL OR p.content_hash != n.content_hash
+        UNION ALL
+        SELECT p.market_id, p.condition_id, 'delete' FROM {prev} p
+        WHERE NOT EXISTS (SELECT 1 FROM {live} n WHERE n.market_id = p.market_id)
+        """
+    ).fetchall()
+    record_market_changes(conn, version, changes, mode="full")
+
+
+def get_market_changes(conn, since_version: int) -> Optional[dict[str, tuple[Optional[str], str]]]:
+    """
+    Markets changed after `since_version`, as `{market_id: (condition_id, last change)}`.
+
+    Returns None when the change log does not cover every version since then (pruned, rollback,
+    first generation); callers should then treat every market as changed.
+    """
+
+    current = get_data_version(conn)
+    if current is None:
+        return None
+    version = int(current["version"])
+    if since_version >= version:
+        return {}
+    try:
+        covered = conn.execute(
+            "SELECT COUNT(*) FROM market_change_batches WHERE version > ? AND version <= ?",
+            (since_version, version),
+        ).fetchone()[0]
+        if covered != version - since_version:
+            return None
+        rows = conn.execute(
+            "SELECT market_id, condition_id, change FROM market_changes WHERE version > ? ORDER BY version",
+            (since_version,),
+        ).fetchall()
+    except Exception:
+        return None
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def create_staging_tables(conn) -> None:
+    """
+    (Re)creates empty staging tables for the next snapshot. Leftovers from a crashed run are dropped.
+    """
+
+    for table, ddl in SNAPSHOT_TABLE_DDL.items():
+        name = staging_name(table)
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.execute(ddl.format(name=name))
+    conn.execute(f"DROP TABLE IF EXISTS {staging_name(SEARCH_TABLE)}")
+    conn.commit()
+
+
+def drop_staging_tables(conn) -> None:
+    for table in SNAPSHOT_TABLES + (SEARCH_TABLE,):
+        conn.execute(f"DROP TABLE IF EXISTS {staging_name(table)}")
+    conn.commit()
+
+
+def _free_index_slot(conn) -> str:
+    used = _index_names(conn)
+    for slot in INDEX_SLOTS:
+        if not any(f"{base}{slot}" in used for base, _, _ in SNAPSHOT_INDEXES):
+            return slot
+    raise RuntimeError("No free snapshot index slot (live, prev and staging all hold indexes)")
+
+
+def finalize_staging_tables(conn) -> None:
+    """
+    Builds all indexes and planner statistics on the staging tables before they are published.
+    """
+
+    slot = _free_index_slot(conn)
+    for base, table, columns in SNAPSHOT_INDEXES:
+        conn.execute(f"CREATE INDEX {base}{slot} ON {staging_name(table)}({columns})")
+    for table in SNAPSHOT_TABLES:
+        conn.execute(f"ANALYZE {staging_name(table)}")
+    build_search_index(conn, staging_name(SEARCH_TABLE), staging_name("active_market_outcomes"))
+    conn.commit()
+
+
+def _rename_table(conn, old: str, new: str) -> None:
+    conn.execute(f"ALTER TABLE {old} RENAME TO {new}")
+    # sqlite_stat1 is keyed by table name and is not rewritten by RENAME.
+    if _table_exists(conn, "sqlite_stat1"):
+        conn.execute("UPDATE sqlite_stat1 SET tbl = ? WHERE tbl = ?", (new, old))
+
+
+def _drop_table(conn, name: str) -> None:
+    conn.execute(f"DROP TABLE IF EXISTS {name}")
+    if _table_exists(conn, "sqlite_stat1"):
+        conn.execute("DELETE FROM sqlite_stat1 WHERE tbl = ?", (name,))
+
+
+def publish_staging_tables(conn, snapshot_at: Optional[str] = None) -> int:
+    """
+    Atomically promotes staging -> live and live -> prev in one transaction.
+
+    Readers see either the old or the new generation, never an empty or index-less table.
+    Returns the new markets data version.
+    """
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in SNAPSHOT_TABLES:
+            _drop_table(conn, prev_name(table))
+            if _table_exists(conn, table):
+                _rename_table(conn, table, prev_name(table))
+            _rename_table(conn, staging_name(table), table)
+        # Without a staging index the live one would describe the old rows; it moves to prev regardless.
+        _drop_table(conn, prev_name(SEARCH_TABLE))
+        if _table_exists(conn, SEARCH_TABLE):
+            _rename_table(conn, SEARCH_TABLE, prev_name(SEARCH_TABLE))
+        if _table_exists(conn, staging_name(SEARCH_TABLE)):
+            _rename_table(conn, staging_name(SEARCH_TABLE), SEARCH_TABLE)
+        version = bump_data_version(conn, MARKETS_VERSION_KEY, updated_at=snapshot_at)
+        bump_data_version(conn, FULL_SNAPSHOT_VERSION_KEY, updated_at=snapshot_at)
+        _record_generation_changes(conn, version)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return version
+
+
+def _swap_search_generations(conn) -> None:
+    live, prev = _table_exists(conn, SEARCH_TABLE), _table_exists(conn, prev_name(SEARCH_TABLE))
+    if live and prev:
+        swap = f"{SEARCH_TABLE}_swap"
+        _drop_table(conn, swap)
+        _rename_table(conn, SEARCH_TABLE, swap)
+        _rename_table(conn, prev_name(SEARCH_TABLE), SEARCH_TABLE)
+        _rename_table(conn, swap, prev_name(SEARCH_TABLE))
+    elif live:
+        _rename_table(conn, SEARCH_TABLE, prev_name(SEARCH_TABLE))
+    elif prev:
+        _rename_table(conn, prev_name(SEARCH_TABLE), SEARCH_TABLE)
+
+
+def rollback_snapshot(conn) -> bool:
+    """
+    Swaps the live and previous generations back. Returns False if there is no previous generation.
+    """
+
+    if not all(_table_exists(conn, prev_name(table)) for table in SNAPSHOT_TABLES):
+        return False
+
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in SNAPSHOT_TABLES:
+            swap = f"{table}_swap"
+            _drop_table(conn, swap)
+            _rename_table(conn, table, swap)
+            _rename_table(conn, prev_name(table), table)
+            _rename_table(conn, swap, prev_name(table))
+        _swap_search_generations(conn)
+        ensure_data_versions_schema(conn)
+        conn.execute(
+            """
+            UPDATE data_versions
+            SET version = previous_version, previous_version = version
+            WHERE name = ? AND previous_version IS NOT NULL
+            """,
+            (MARKETS_VERSION_KEY,),
+        )
+        # The change log describes forward steps only; consumers fall back to a full pass.
+        if _table_exists(conn, "market_change_batches"):
+            conn.execute("DELETE FROM market_change_batches")
+            conn.execute("DELETE FROM market_changes")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def ensure_snapshot_indexes(conn) -> None:
+    """
+    Creates missing snapshot indexes on the live tables (e.g. databases from before the swap flow).
+
+    An index counts as present if it exists under any generation slot, so startup never duplicates
+    indexes that arrived with a published staging table.
+    """
+
+    used = _index_names(conn)
+    existing: dict[str, set[str]] = {}
+    for base, table, columns in SNAPSHOT_INDEXES:
+        if not _table_exists(conn, table):
+            continue
+        names = existing.setdefault(table, _table_index_names(conn, table))
+        if any(f"{base}{slot}" in names for slot in INDEX_SLOTS):
+            continue
+        free = next((f"{base}{slot}" for slot in INDEX_SLOTS if f"{base}{slot}" not in used), None)
+        if free is None:
+            continue
+        conn.execute(f"CREATE INDEX {free} ON {table}({columns})")
+        used.add(free)
@@ -4,7 +4,7 @@ import unittest
 from datetime import datetime, timedelta, timezone
 from typing import Iterable
 
-from fastapi import Response
+from fastapi import Request, Response
 
 from tests._db_snapshot import snapshot_main_db
 
@@ -517,7 +517,7 @@ class TestMarketsFilters(unittest.TestCase):
             self.assertTrue(term in q or term in o)
 
     def test_tags_endpoint_returns_data(self):
-        data = self.app_main.get_tags()
+        data = self.app_main.get_tags(Request({"type": "http", "headers": []}), Response())
         self.assertGreater(len(data), 0)
 
     def test_apr_index_exists(self):
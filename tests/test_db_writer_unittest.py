@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from db_writer import DbWriter
+
+
+def _insert(conn, value):
+    conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+
+
+def _insert_then_fail(conn, value):
+    conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    raise ValueError("bad row")
+
+
+class TestDbWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "writer.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE items (value INTEGER)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _values(self):
+        conn = self._connect()
+        try:
+            return sorted(r[0] for r in conn.execute("SELECT value FROM items"))
+        finally:
+            conn.close()
+
+    def test_groups_operations_into_batches(self):
+        with DbWriter(self._connect, batch_size=3, flush_interval=60) as writer:
+            for i in range(7):
+                writer.submit(_insert, i)
+
+        self.assertEqual(self._values(), list(range(7)))
+        stats = writer.stats()
+        self.assertEqual(stats["ops"], 7)
+        self.assertEqual(stats["commits"], 3)
+
+    def test_failed_operation_is_rolled_back_alone(self):
+        with DbWriter(self._connect, batch_size=10, flush_interval=60) as writer:
+            writer.submit(_insert, 1)
+            writer.submit(_insert_then_fail, 2)
+            writer.submit(_insert, 3)
+
+        self.assertEqual(self._values(), [1, 3])
+        self.assertEqual(writer.stats()["failed"], 1)
+
+    def test_submit_future_resolves_on_commit_or_failure(self):
+        with DbWriter(self._connect, batch_size=10, flush_interval=60) as writer:
+            ok = writer.submit(_insert, 1)
+            bad = writer.submit(_insert_then_fail, 2)
+            self.assertIsInstance(bad.exception(timeout=5), ValueError)
+            self.assertFalse(ok.done())  # applied, but its transaction is still open
+            writer.flush()
+            self.assertTrue(ok.done())
+            self.assertIsNone(ok.result())
+
+    def test_flush_commits_pending_work(self):
+        with DbWriter(self._connect, batch_size=100, flush_interval=60) as writer:
+            writer.submit(_insert, 5)
+            writer.flush()
+            self.assertEqual(self._values(), [5])
+            self.assertEqual(writer.stats()["commits"], 1)
+
+    def test_records_time_waiting_for_the_write_lock(self):
+        holder = sqlite3.connect(self.db_path, check_same_thread=False)
+        holder.execute("BEGIN IMMEDIATE")
+        release = threading.Timer(0.2, holder.commit)
+        release.start()
+        try:
+            with DbWriter(self._connect, batch_size=1, flush_interval=0) as writer:
+                started = time.monotonic()
+                writer.submit(_insert, 1)
+                writer.flush()
+                self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        finally:
+            release.join()
+            holder.close()
+
+        self.assertGreaterEqual(writer.stats()["lock_wait_seconds"], 0.15)
+        self.assertEqual(self._values(), [1])
+
+    def test_submit_fails_once_writer_died(self):
+        def broken_connect():
+            raise sqlite3.OperationalError("unable to open database file")
+
+        writer = DbWriter(broken_connect).start()
+        writer._thread.join()
+        with self.assertRaises(RuntimeError):
+            writer.submit(_insert, 1)
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,20 @@
 import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
 import gamma_client
+from http_cache import ResponseCache
+from rate_limit import TokenBucket
 
 
 class _FakeResponse:
-    def __init__(self, payload, status_code=200):
+    def __init__(self, payload, status_code=200, headers=None):
         self._payload = payload
         self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode()
 
     def raise_for_status(self):
         if self.status_code >= 400:
@@ -18,7 +24,24 @@ class _FakeResponse:
         return json.loads(json.dumps(self._payload))
 
 
-class TestMarketFetcherPagination(unittest.TestCase):
+class _IsolatedCacheTestCase(unittest.TestCase):
+    """
+    Clients built without an explicit cache get this one instead of the process-wide cache in data/.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(path=os.path.join(self.tmp.name, "http_cache.db"))
+        self.cache_patch = patch("gamma_client.get_response_cache", return_value=self.cache)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.cache.close()
+        self.tmp.cleanup()
+
+
+class TestMarketFetcherPagination(_IsolatedCacheTestCase):
     def test_fetch_all_markets_paginates_until_short_page(self):
         fetcher = gamma_client.MarketFetcher()
 
@@ -35,7 +58,7 @@ class TestMarketFetcherPagination(unittest.TestCase):
             self.assertIn("/markets", url)
             return _FakeResponse(payload)
 
-        with patch("requests.get", side_effect=_fake_get):
+        with patch("requests.Session.get", side_effect=_fake_get):
             markets = fetcher.fetch_all_markets(limit=2)
 
         self.assertEqual(len(markets), 3)
@@ -47,11 +70,30 @@ class TestMarketFetcherPagination(unittest.TestCase):
             self.assertIn("/events", url)
             return _FakeResponse([])
 
-        with patch("requests.get", side_effect=_fake_get):
+        with patch("requests.Session.get", side_effect=_fake_get):
             events = fetcher.fetch_all_events(limit=50)
 
         self.assertEqual(events, [])
 
+    def test_repeated_event_crawl_sends_conditional_request(self):
+        fetcher = gamma_client.MarketFetcher()
+        seen_headers = []
+
+        def _fake_get(url, params=None, timeout=None, headers=None):
+            seen_headers.append(headers)
+            if headers:
+                return _FakeResponse(None, 304)
+            return _FakeResponse([{"id": "e1"}], headers={"ETag": '"v1"'})
+
+        with patch("requests.Session.get", side_effect=_fake_get):
+            first = fetcher.fetch_all_events(limit=50)
+            second = fetcher.fetch_all_events(limit=50)
+
+        self.assertEqual(second, first)
+        self.assertIsNone(seen_headers[0])
+        self.assertEqual(seen_headers[1], {"If-None-Match": '"v1"'})
+        self.assertEqual(self.cache.stats()["not_modified"], 1)
+
     def test_gamma_client_retries_then_succeeds(self):
         client = gamma_client.GammaClient()
 
@@ -63,9 +105,100 @@ class TestMarketFetcherPagination(unittest.TestCase):
                 raise RuntimeError("boom")
             return _FakeResponse([{"id": "ok"}])
 
-        with patch("requests.get", side_effect=_fake_get), patch("time.sleep", return_value=None):
+        with patch("requests.Session.get", side_effect=_fake_get), patch("time.sleep", return_value=None):
             markets = client.get_markets({"limit": 1, "offset": 0})
 
         self.assertEqual(markets, [{"id": "ok"}])
         self.assertEqual(call_count["n"], 3)
 
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestGammaRateLimiting(_IsolatedCacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = _FakeClock()
+        self.patches = [patch("time.monotonic", self.clock.monotonic), patch("time.sleep", self.clock.sleep)]
+        for p in self.patches:
+            p.start()
+        self.limiter = TokenBucket(10, burst=10, name="gamma-test")
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        super().tearDown()
+
+    def test_honours_retry_after_and_slows_down(self):
+        client = gamma_client.GammaClient(limiter=self.limiter)
+        responses = [_FakeResponse([], 429, {"Retry-After": "7"}), _FakeResponse([{"id": "ok"}])]
+
+        with patch("requests.Session.get", side_effect=lambda *a, **k: responses.pop(0)):
+            markets = client.get_markets({"limit": 1, "offset": 0})
+
+        self.assertEqual(markets, [{"id": "ok"}])
+        self.assertAlmostEqual(sum(self.clock.slept), 7.0)
+        self.assertEqual(self.limiter.stats()["throttled"], 1)
+        self.assertLess(self.limiter.rate, self.limiter.max_rate)
+
+    def test_failed_page_raises_instead_of_ending_pagination(self):
+        fetcher = gamma_client.MarketFetcher()
+        fetcher.client = gamma_client.GammaClient(limiter=self.limiter, retries=3)
+
+        def _fake_get(url, params=None, timeout=None):
+            if int(params["offset"]) == 0:
+                return _FakeResponse([{"id": "m1"}, {"id": "m2"}])
+            return _FakeResponse(None, 503)
+
+        with patch("requests.Session.get", side_effect=_fake_get):
+            with self.assertRaises(gamma_client.GammaFetchError) as ctx:
+                fetcher.fetch_all_markets(limit=2)
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(ctx.exception.params["offset"], 2)
+
+    def test_client_errors_are_not_retried(self):
+        client = gamma_client.GammaClient(limiter=self.limiter)
+        calls = []
+
+        def _fake_get(url, params=None, timeout=None):
+            calls.append(url)
+            return _FakeResponse(None, 422)
+
+        with patch("requests.Session.get", side_effect=_fake_get):
+            with self.assertRaises(gamma_client.GammaFetchError):
+                client.get_events({"limit": 1, "offset": 0})
+        self.assertEqual(len(calls), 1)
+
+
+class TestAsyncMarketFetcher(_IsolatedCacheTestCase):
+    def test_fetch_events_and_markets_crawls_both_until_short_page(self):
+        fetcher = gamma_client.AsyncMarketFetcher(concurrency=4, prefetch=3)
+
+        market_pages = {0: [{"id": "m1"}, {"id": "m2"}], 2: [{"id": "m3"}, {"id": "m4"}], 4: [{"id": "m5"}]}
+        event_pages = {0: [{"id": "e1"}]}
+        requested = []
+
+        def _fake_get(url, params=None, timeout=None):
+            offset = int((params or {}).get("offset", 0))
+            requested.append((url.rsplit("/", 1)[-1], offset))
+            pages = market_pages if url.endswith("/markets") else event_pages
+            return _FakeResponse(pages.get(offset, []))
+
+        with patch("requests.Session.get", side_effect=_fake_get):
+            events, markets = fetcher.fetch_events_and_markets(limit=2)
+
+        self.assertEqual([e["id"] for e in events], ["e1"])
+        self.assertEqual([m["id"] for m in markets], ["m1", "m2", "m3", "m4", "m5"])
+        # Offsets are prefetched ahead of the page being consumed
+        self.assertIn(("markets", 4), requested)
+        self.assertIn(("events", 2), requested)
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import smart_money_scraper
+from goldsky_client import GoldskyHoldersClient
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSubgraph:
+    """
+    Serves `userBalances` pages for aliased queries: b{i} reads $c{i}, $o{i} and the $after{i} cursor.
+    """
+
+    def __init__(self, balances, broken=()):
+        # {(condition_id, outcome_index): [(user, raw_balance), ...]}
+        self.balances = {
+            key: sorted((f"{user}-{key[0]}-{key[1]}", user, raw) for user, raw in rows)
+            for key, rows in balances.items()
+        }
+        self.broken = set(broken)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None):
+        variables = json["variables"]
+        streams = []
+        i = 0
+        while f"c{i}" in variables:
+            streams.append((variables[f"c{i}"], int(variables[f"o{i}"]), variables[f"after{i}"]))
+            i += 1
+        with self.lock:
+            self.requests.append(streams)
+        if any(cid in self.broken for cid, _, _ in streams):
+            return FakeResponse({"errors": [{"message": "indexer error"}]})
+        data = {}
+        for i, (cid, outcome, after) in enumerate(streams):
+            rows = [r for r in self.balances.get((cid, outcome), []) if r[0] > after and r[2] > int(variables["minBalance"])]
+            data[f"b{i}"] = [{"id": r[0], "user": r[1], "balance": str(r[2])} for r in rows[: variables["first"]]]
+        return FakeResponse({"data": data})
+
+
+def _client(subgraph, **kwargs):
+    kwargs.setdefault("min_shares", 0)
+    return GoldskyHoldersClient(transport=subgraph, limiter=MagicMock(), **kwargs)
+
+
+class TestGoldskyHoldersClient(unittest.TestCase):
+    def test_batches_markets_and_pages_to_full_depth(self):
+        subgraph = FakeSubgraph({
+            ("deep", 0): [(f"0x{i}", (i + 1) * 1_000_000) for i in range(7)],
+            ("deep", 1): [("0xno", 2_500_000)],
+            **{(f"m{n}", 0): [(f"0xm{n}", 1_000_000)] for n in range(5)},
+        })
+        client = _client(subgraph, batch_size=8, page_size=3, concurrency=2)
+
+        results = dict(client.iter_holders(["deep"] + [f"m{n}" for n in range(5)]))
+
+        self.assertEqual(set(results), {"deep", "m0", "m1", "m2", "m3", "m4"})
+        deep = results["deep"]
+        self.assertEqual(len(deep), 8)
+        self.assertEqual(deep[0], {"address": "0x6", "positionSize": 7.0, "outcomeIndex": 0, "name": None})
+        self.assertEqual([h["positionSize"] for h in deep], sorted((h["positionSize"] for h in deep), reverse=True))
+        self.assertEqual(results["m3"][0]["address"], "0xm3")
+        # 12 streams and 3 pages for the deepest one, in a handful of aliased requests
+        self.assertLessEqual(len(subgraph.requests), 4)
+        self.assertTrue(all(len(batch) <= 8 for batch in subgraph.requests))
+        cursors = [after for batch in subgraph.requests for cid, outcome, after in batch if (cid, outcome) == ("deep", 0)]
+        self.assertEqual(cursors, ["", "0x2-deep-0", "0x5-deep-0"])
+
+    def test_failed_batch_fails_only_its_markets(self):
+        subgraph = FakeSubgraph({("ok", 0): [("0xa", 5_000_000)], ("bad", 0): [("0xb", 5_000_000)]}, broken={"bad"})
+        client = _client(subgraph, batch_size=2, concurrency=1)
+
+        results = dict(client.iter_holders(["ok", "bad"]))
+
+        self.assertIsNone(results["bad"])
+        self.assertEqual(results["ok"][0]["address"], "0xa")
+
+    def test_dust_balances_are_skipped(self):
+        subgraph = FakeSubgraph({("m", 0): [("0xwhale", 50_000_000), ("0xdust", 400_000)]})
+        rows = _client(subgraph, min_shares=1).fetch_holders("m")
+        self.assertEqual([h["address"] for h in rows], ["0xwhale"])
+
+
+class TestGoldskyBackendRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "markets.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE wallets_stats (wallet_address TEXT PRIMARY KEY, total_pnl REAL, last_updated TEXT, alias TEXT)")
+        conn.execute("CREATE TABLE holders (market_id TEXT, outcome_index INTEGER, wallet_address TEXT, position_size REAL, snapshot_at TEXT)")
+        conn.execute("CREATE TABLE active_market_outcomes (condition_id TEXT)")
+        conn.executemany("INSERT INTO active_market_outcomes (condition_id) VALUES (?)", [(f"cid{i}",) for i in range(4)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _add_markets(self, count):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM active_market_outcomes")
+        conn.executemany("INSERT INTO active_market_outcomes (condition_id) VALUES (?)", [(f"cid{i}",) for i in range(count)])
+        conn.commit()
+        conn.close()
+
+    def _run(self, subgraph, args, data_api=None):
+        with patch("smart_money_scraper.get_db_connection", side_effect=self._get_conn), \
+             patch("smart_money_scraper.refresh_market_smart_money_stats",
+                   return_value={"mode": "incremental", "markets": 0, "wallets": 0}), \
+             patch("smart_money_scraper.GoldskyHoldersClient", side_effect=lambda: _client(subgraph)), \
+             patch("smart_money_scraper.HoldersClient") as MockHolders, \
+             patch("smart_money_scraper.PnLClient") as MockPnL, \
+             patch("time.sleep"):
+            MockHolders.return_value.fetch_holders.side_effect = data_api
+            MockPnL.return_value.fetch_user_pnl.return_value = 4.0
+            smart_money_scraper.run(args)
+        return MockHolders.return_value.fetch_holders
+
+    def _saved_markets(self):
+        conn = self._get_conn()
+        try:
+            return {r[0] for r in conn.execute("SELECT DISTINCT market_id FROM holders")}
+        finally:
+            conn.close()
+
+    def test_run_fetches_holders_through_goldsky(self):
+        subgraph = FakeSubgraph({(f"cid{i}", i % 2): [(f"0x{i}", 3_000_000)] for i in range(4)})
+
+        data_api = self._run(subgraph, ["--holders-backend", "goldsky"])
+
+        data_api.assert_not_called()
+        self.assertEqual(len(subgraph.requests), 1)
+        conn = self._get_conn()
+        holders = conn.execute("SELECT market_id, outcome_index, wallet_address, position_size FROM holders ORDER BY market_id").fetchall()
+        wallets = conn.execute("SELECT COUNT(*) FROM wallets_stats").fetchone()[0]
+        conn.close()
+        self.assertEqual([tuple(r) for r in holders][:2], [("cid0", 0, "0x0", 3.0), ("cid1", 1, "0x1", 3.0)])
+        self.assertEqual(wallets, 4)
+
+    def test_degraded_data_api_fails_over_to_goldsky(self):
+        self._add_markets(12)
+        subgraph = FakeSubgraph({(f"cid{i}", 0): [(f"0x{i}", 3_000_000)] for i in range(12)})
+
+        data_api = self._run(subgraph, ["--async", "--concurrency", "1", "--rps", "1000"], data_api=lambda cid, limit: None)
+
+        # The breaker trips after a handful of failures; the rest, and the retry pass, go to the subgraph
+        self.assertLessEqual(data_api.call_count, 5)
+        self.assertEqual(self._saved_markets(), {f"cid{i}" for i in range(12)})
+
+    def test_failing_goldsky_falls_back_to_data_api(self):
+        self._add_markets(12)
+        subgraph = FakeSubgraph({}, broken={f"cid{i}" for i in range(12)})
+
+        data_api = self._run(
+            subgraph,
+            ["--holders-backend", "goldsky", "--async", "--concurrency", "1", "--rps", "1000"],
+            data_api=lambda cid, limit: [{"address": f"0x{cid}", "positionSize": 5, "outcomeIndex": 0, "name": ""}],
+        )
+
+        self.assertEqual(self._saved_markets(), {f"cid{i}" for i in range(12)})
+        self.assertGreater(data_api.call_count, 0)
+        self.assertLess(len(subgraph.requests), 12)
+
+    def test_no_failover_keeps_the_chosen_backend(self):
+        subgraph = FakeSubgraph({})
+        data_api = self._run(subgraph, ["--no-failover"], data_api=lambda cid, limit: None)
+
+        self.assertEqual(data_api.call_count, 8)  # both passes over 4 markets
+        self.assertEqual(subgraph.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main
+import smart_money_scraper
+from holder_changes import diff_holders, ensure_holder_changes_schema, prune_holder_changes
+from refresh_planner import ensure_holder_schedule_schema
+from snapshot_tables import SNAPSHOT_TABLE_DDL
+
+
+T0 = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+class TestDiffHolders(unittest.TestCase):
+    def test_entries_exits_and_resizes_above_threshold(self):
+        previous = [(0, "0xExit", 5000), (0, "0xGrow", 10000), (0, "0xDrift", 50000), (1, "0xDust", 50)]
+        current = [(0, "0xEnter", 2000), (0, "0xGrow", 13000), (0, "0xDrift", 51500), (1, "0xNewDust", 10)]
+
+        changes = diff_holders(previous, current, min_delta=1000, min_ratio=0.1)
+
+        self.assertEqual(
+            changes,
+            [
+                (0, "0xExit", "exit", 5000.0, None, -5000.0),
+                (0, "0xGrow", "resize", 10000.0, 13000.0, 3000.0),
+                (0, "0xEnter", "enter", None, 2000.0, 2000.0),
+            ],
+        )
+
+    def test_same_wallet_on_other_outcome_is_a_separate_position(self):
+        changes = diff_holders([(0, "0xA", 5000)], [(1, "0xA", 5000)], min_delta=1000, min_ratio=0.1)
+        self.assertEqual({c[2] for c in changes}, {"enter", "exit"})
+
+
+class TestHolderChangeLog(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(SNAPSHOT_TABLE_DDL["active_market_outcomes"].format(name="active_market_outcomes"))
+        conn.execute(
+            "INSERT INTO active_market_outcomes (market_id, condition_id, question, outcome_index, outcome_name) "
+            "VALUES ('m1', 'c1', 'Will it rain?', 0, 'Yes')"
+        )
+        conn.execute("CREATE TABLE holders (market_id TEXT, outcome_index INTEGER, wallet_address TEXT, position_size REAL, snapshot_at TEXT)")
+        conn.execute("CREATE TABLE wallets_stats (wallet_address TEXT PRIMARY KEY, total_pnl REAL, last_updated TEXT, alias TEXT)")
+        conn.execute("INSERT INTO wallets_stats VALUES ('0xWhale', 250000, '', 'whale')")
+        ensure_holder_schedule_schema(conn)
+        ensure_holder_changes_schema(conn)
+        conn.commit()
+        conn.close()
+        self.patcher = patch("main.DB_PATH", self.db_path)
+        self.patcher.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.patcher.stop()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def _save(self, holders):
+        conn = sqlite3.connect(self.db_path)
+        smart_money_scraper.save_holders_batch(conn, "c1", holders)
+        conn.commit()
+        conn.close()
+
+    def test_save_logs_changes_and_endpoint_serves_them(self):
+        self._save([{"address": "0xWhale", "positionSize": 20000, "outcomeIndex": 0}])
+        self._save([{"address": "0xWhale", "positionSize": 80000, "outcomeIndex": 0},
+                    {"address": "0xSmall", "positionSize": 5, "outcomeIndex": 0}])
+
+        conn = sqlite3.connect(self.db_path)
+        logged = conn.execute("SELECT change, old_size, new_size, delta FROM holder_changes").fetchall()
+        conn.close()
+        # The first save has nothing to compare against; the dust entry is below the threshold
+        self.assertEqual(logged, [("resize", 20000.0, 80000.0, 60000.0)])
+
+        response = self.client.get("/api/whale-moves", params={"min_delta": 10000})
+        self.assertEqual(response.status_code, 200)
+        moves = response.json()
+        self.assertEqual(len(moves), 1)
+        self.assertEqual(moves[0]["condition_id"], "c1")
+        self.assertEqual(moves[0]["alias"], "whale")
+        self.assertEqual(moves[0]["question"], "Will it rain?")
+        self.assertEqual(moves[0]["outcome_name"], "Yes")
+
+        self.assertEqual(self.client.get("/api/whale-moves", params={"change": "exit"}).json(), [])
+        old = self.client.get("/api/whale-moves", params={"since": "2020-01-01T00:00:00Z", "until": "2020-01-02T00:00:00Z"})
+        self.assertEqual(old.json(), [])
+
+    def test_rejects_bad_params(self):
+        self.assertEqual(self.client.get("/api/whale-moves", params={"change": "flip"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/whale-moves", params={"since": "yesterday"}).status_code, 400)
+
+    def test_prune_drops_entries_past_retention(self):
+        conn = sqlite3.connect(self.db_path)
+        for days_ago in (1, 40):
+            conn.execute(
+                "INSERT INTO holder_changes (detected_at, market_id, outcome_index, wallet_address, change, delta) "
+                "VALUES (?, 'c1', 0, '0xA', 'enter', 5000)",
+                ((T0 - timedelta(days=days_ago)).isoformat(),),
+            )
+        self.assertEqual(prune_holder_changes(conn, now=T0, retention_days=30), 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM holder_changes").fetchone()[0], 1)
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
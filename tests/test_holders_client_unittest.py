@@ -10,7 +10,7 @@ class TestHoldersClient(unittest.TestCase):
         # because the file doesn't exist yet for the first run
         pass
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_fetch_holders_success(self, mock_get):
         from holders_client import HoldersClient
         client = HoldersClient()
@@ -33,7 +33,7 @@ class TestHoldersClient(unittest.TestCase):
         # We expect 20 per outcome. 2 outcomes = 40 total.
         self.assertEqual(len(holders), 40)
         
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_fetch_holders_unsorted_warning(self, mock_get):
         from holders_client import HoldersClient
         client = HoldersClient()
@@ -56,7 +56,7 @@ class TestHoldersClient(unittest.TestCase):
         # Should be sorted DESC by amount (which we mapped to positionSize)
         self.assertEqual(holders[0]['positionSize'], 19)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_fetch_pnl_success(self, mock_get):
         from holders_client import PnLClient
         client = PnLClient()
@@ -74,5 +74,41 @@ class TestHoldersClient(unittest.TestCase):
         pnl = client.fetch_user_pnl("0xABC")
         self.assertEqual(pnl, 15.5)
 
+class TestFailoverHoldersClient(unittest.TestCase):
+    def _client(self):
+        from holders_client import FailoverHoldersClient
+        from rate_limit import CircuitBreaker
+
+        self.primary, self.secondary = MagicMock(), MagicMock()
+        self.secondary.fetch_holders.return_value = [{"address": "0xB", "positionSize": 1}]
+        breakers = {
+            "data-api": CircuitBreaker("data-api", window=10, min_calls=3, error_rate=0.5, cooldown=60),
+            "goldsky": CircuitBreaker("goldsky", window=10, min_calls=3, error_rate=0.5, cooldown=60),
+        }
+        return FailoverHoldersClient([("data-api", self.primary), ("goldsky", self.secondary)], breakers=breakers)
+
+    def test_isolated_failure_is_not_failed_over(self):
+        client = self._client()
+        self.primary.fetch_holders.side_effect = [None, [{"address": "0xA", "positionSize": 2}]]
+
+        self.assertIsNone(client.fetch_holders("m1", limit=1000))
+        self.assertEqual(client.fetch_holders("m1", limit=1000)[0]["address"], "0xA")
+        self.secondary.fetch_holders.assert_not_called()
+
+    def test_tripped_breaker_moves_markets_to_the_next_backend(self):
+        client = self._client()
+        self.primary.fetch_holders.return_value = None
+
+        results = [client.fetch_holders(f"m{i}", limit=1000) for i in range(10)]
+
+        # Two isolated failures, the third trips the breaker and is served by the subgraph
+        self.assertEqual(results[:2], [None, None])
+        self.assertTrue(all(r is not None for r in results[2:]))
+        self.assertEqual(self.primary.fetch_holders.call_count, 3)
+        stats = client.stats()
+        self.assertEqual(stats["failovers"], 8)
+        self.assertEqual(stats["breakers"]["data-api"]["state"], "open")
+        self.assertEqual(stats["breakers"]["data-api"]["rejected"], 7)
+
 if __name__ == '__main__':
     unittest.main()
@@ -4,7 +4,7 @@ import requests
 from holders_client import HoldersClient
 
 class TestHoldersRetry(unittest.TestCase):
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)  # Don't wait during tests
     def test_fetch_holders_retries_on_failure(self, mock_sleep, mock_get):
         client = HoldersClient()
@@ -28,7 +28,7 @@ class TestHoldersRetry(unittest.TestCase):
         self.assertEqual(mock_get.call_count, 3)
         self.assertEqual(mock_sleep.call_count, 2)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_holders_fails_after_max_retries(self, mock_sleep, mock_get):
         client = HoldersClient()
@@ -42,7 +42,7 @@ class TestHoldersRetry(unittest.TestCase):
         self.assertEqual(mock_get.call_count, 3)
         self.assertEqual(mock_sleep.call_count, 2)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_fetch_holders_unexpected_format(self, mock_get):
         client = HoldersClient()
         mock_response = MagicMock()
@@ -54,7 +54,7 @@ class TestHoldersRetry(unittest.TestCase):
         self.assertIsNone(holders)
 
 class TestPnLClientRetry(unittest.TestCase):
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_pnl_rate_limit(self, mock_sleep, mock_get):
         from holders_client import PnLClient
@@ -75,7 +75,7 @@ class TestPnLClientRetry(unittest.TestCase):
         self.assertEqual(mock_get.call_count, 2)
         self.assertEqual(mock_sleep.call_count, 1)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_pnl_timeout_retry(self, mock_sleep, mock_get):
         from holders_client import PnLClient
@@ -88,7 +88,7 @@ class TestPnLClientRetry(unittest.TestCase):
         self.assertEqual(pnl, 50.0)
         self.assertEqual(mock_get.call_count, 2)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_pnl_unexpected_exception(self, mock_sleep, mock_get):
         from holders_client import PnLClient
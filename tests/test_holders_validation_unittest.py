@@ -4,7 +4,7 @@ import requests
 from holders_client import HoldersClient
 
 class TestHoldersValidation(unittest.TestCase):
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_holders_limit_is_capped(self, mock_sleep, mock_get):
         client = HoldersClient()
@@ -19,7 +19,7 @@ class TestHoldersValidation(unittest.TestCase):
         args, kwargs = mock_get.call_args
         self.assertEqual(kwargs['params']['limit'], 40)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_holders_validation_success(self, mock_sleep, mock_get):
         client = HoldersClient()
@@ -41,7 +41,7 @@ class TestHoldersValidation(unittest.TestCase):
         # Should return all 20 per outcome as they are under limit
         self.assertEqual(len(result), 20)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     @patch('time.sleep', return_value=None)
     def test_fetch_holders_allows_low_counts(self, mock_sleep, mock_get):
         client = HoldersClient()
@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import gamma_client
+from http_cache import ResponseCache
+from rate_limit import TokenBucket
+
+
+class _FakeResponse:
+    def __init__(self, payload=None, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode("utf-8") if payload is not None else b""
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(path=os.path.join(self.tmp.name, "http_cache.db"), max_bytes=10_000_000)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def _client(self):
+        return gamma_client.GammaClient(limiter=TokenBucket(1000, 1000), cache=self.cache, cache_paths=("events",))
+
+    def test_conditional_request_reuses_body_on_304(self):
+        client = self._client()
+        seen_headers = []
+        responses = [
+            _FakeResponse([{"id": "e1"}], headers={"ETag": 'W/"v1"', "Last-Modified": "Wed, 01 Jan 2026 00:00:00 GMT"}),
+            _FakeResponse(status_code=304),
+        ]
+
+        def _fake_get(url, params=None, timeout=None, headers=None):
+            seen_headers.append(headers)
+            return responses.pop(0)
+
+        params = {"limit": 100, "offset": 0}
+        with patch("requests.Session.get", side_effect=_fake_get):
+            first = client.get_events(params)
+            second = client.get_events(dict(params))
+
+        self.assertEqual(second, first)
+        self.assertIsNone(seen_headers[0])
+        self.assertEqual(seen_headers[1]["If-None-Match"], 'W/"v1"')
+        self.assertEqual(seen_headers[1]["If-Modified-Since"], "Wed, 01 Jan 2026 00:00:00 GMT")
+        self.assertEqual(self.cache.stats()["not_modified"], 1)
+
+    def test_entry_evicted_before_304_is_refetched_unconditionally(self):
+        client = self._client()
+        seen_headers = []
+        params = {"limit": 100, "offset": 0}
+
+        def _evicted_304():
+            # Another page worker's store() evicts the entry between lookup() and the 304
+            with self.cache._lock:
+                self.cache._db().execute("DELETE FROM http_cache")
+                self.cache._db().commit()
+            return _FakeResponse(status_code=304)
+
+        responses = [
+            lambda: _FakeResponse([{"id": "e1"}], headers={"ETag": 'W/"v1"'}),
+            _evicted_304,
+            lambda: _FakeResponse([{"id": "e1"}], headers={"ETag": 'W/"v1"'}),
+        ]
+
+        def _fake_get(url, params=None, timeout=None, headers=None):
+            seen_headers.append(headers)
+            return responses.pop(0)()
+
+        with patch("requests.Session.get", side_effect=_fake_get):
+            client.get_events(params)
+            second = client.get_events(dict(params))
+
+        self.assertEqual(second, [{"id": "e1"}])
+        self.assertEqual(seen_headers[1]["If-None-Match"], 'W/"v1"')
+        self.assertIsNone(seen_headers[2])
+        self.assertIsNotNone(self.cache.lookup(client.base_url + "/events", params))
+
+    def test_unchanged_body_of_evicted_entry_is_stored_again(self):
+        body = json.dumps([{"id": "e1"}]).encode("utf-8")
+        self.cache.store("u", {"offset": 0}, body)
+        entry = self.cache.lookup("u", {"offset": 0})
+        with self.cache._lock:
+            self.cache._db().execute("DELETE FROM http_cache")
+            self.cache._db().commit()
+
+        self.cache.store("u", {"offset": 0}, body, entry=entry)
+
+        self.assertIsNotNone(self.cache.lookup("u", {"offset": 0}))
+        self.assertEqual(self.cache.stats()["stored"], 2)
+
+    def test_unchanged_body_skips_store_and_parse(self):
+        client = self._client()
+        payload = [{"id": "e1", "tags": [{"label": "Politics"}]}]
+
+        with patch("requests.Session.get", side_effect=lambda *a, **k: _FakeResponse(payload)):
+            first = client.get_events({"offset": 0})
+            second = client.get_events({"offset": 0})
+
+        self.assertEqual(second, first)
+        self.assertIsNot(second, first)  # re-parsed, no payloads held between calls
+        self.assertEqual(self.cache.stats()["stored"], 1)
+        self.assertEqual(self.cache.stats()["unchanged"], 1)
+
+    def test_uncached_paths_bypass_cache(self):
+        client = self._client()
+        with patch("requests.Session.get", side_effect=lambda *a, **k: _FakeResponse([{"id": "m1"}])):
+            client.get_markets({"offset": 0})
+        self.assertEqual(self.cache.stats()["stored"], 0)
+
+    def test_lru_eviction_bounds_size(self):
+        cache = ResponseCache(path=os.path.join(self.tmp.name, "small.db"), max_bytes=4000)
+        try:
+            # Poorly compressible bodies of ~1 KiB each
+            bodies = [json.dumps([os.urandom(400).hex()]).encode() for _ in range(10)]
+            cache.store("u", {"offset": 0}, bodies[0])
+            for i, body in enumerate(bodies[1:], start=1):
+                cache.load(cache.lookup("u", {"offset": 0}))  # keep offset 0 recently used
+                cache.store("u", {"offset": i}, body)
+
+            self.assertLessEqual(cache.total_bytes(), 4000)
+            self.assertIsNotNone(cache.lookup("u", {"offset": 0}))
+            self.assertIsNone(cache.lookup("u", {"offset": 1}))
+            self.assertGreater(cache.stats()["evicted"], 0)
+        finally:
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
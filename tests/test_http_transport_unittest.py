@@ -0,0 +1,74 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from http_transport import HttpTransport, get_transport, parse_host_limits
+
+
+class TestHttpTransport(unittest.TestCase):
+    def test_parse_host_limits(self):
+        limits = parse_host_limits("data-api.polymarket.com=10, User-PnL-Api.polymarket.com=4,broken,x=abc")
+        self.assertEqual(limits, {"data-api.polymarket.com": 10, "user-pnl-api.polymarket.com": 4})
+
+    def test_session_negotiates_gzip_and_pools_per_host(self):
+        transport = HttpTransport(pool_connections=2, pool_maxsize=7, host_limits={})
+        self.assertIn("gzip", transport.session.headers["Accept-Encoding"])
+        self.assertEqual(transport.adapter._pool_maxsize, 7)
+        self.assertIs(transport.session.get_adapter("https://data-api.polymarket.com/holders"), transport.adapter)
+
+    def test_host_limit_caps_concurrent_requests(self):
+        transport = HttpTransport(host_limits={"data-api.polymarket.com": 2})
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def _fake_get(url, **kwargs):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            release.wait(0.05)
+            with lock:
+                state["active"] -= 1
+            return None
+
+        with patch("requests.Session.get", side_effect=_fake_get):
+            threads = [
+                threading.Thread(target=transport.get, args=("https://data-api.polymarket.com/holders",))
+                for _ in range(6)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        self.assertEqual(state["peak"], 2)
+        self.assertEqual(transport.stats()["requests"], 6)
+
+    def test_adaptive_window_tracks_throttling_per_host(self):
+        transport = HttpTransport(host_limits={}, adaptive_hosts=["data-api.polymarket.com"])
+        responses = [MagicMock(status_code=200)] * 4 + [MagicMock(status_code=429), requests.exceptions.Timeout("slow")]
+
+        with patch("requests.Session.get", side_effect=responses):
+            for _ in range(5):
+                transport.get("https://data-api.polymarket.com/holders")
+            with self.assertRaises(requests.exceptions.Timeout):
+                transport.get("https://data-api.polymarket.com/holders")
+
+        stats = transport.stats()["adaptive"]
+        self.assertEqual(list(stats), ["data-api.polymarket.com"])
+        window = stats["data-api.polymarket.com"]
+        self.assertEqual(window["successes"], 4)
+        self.assertEqual(window["throttle_events"], 1)
+        self.assertEqual(window["timeouts"], 1)
+        self.assertEqual(window["cuts"], 2)
+        self.assertEqual(window["in_flight"], 0)
+        self.assertLess(window["window"], 8)
+
+    def test_get_transport_is_shared(self):
+        self.assertIs(get_transport(), get_transport())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import sqlite3
+import unittest
+
+from market_queries import build_markets_sql, query_markets
+from market_search import build_search_index, ensure_search_index, fts_match_expression
+from smart_money_materialized import ensure_market_smart_money_stats_schema
+from snapshot_tables import (
+    SNAPSHOT_TABLE_DDL,
+    create_staging_tables,
+    finalize_staging_tables,
+    publish_staging_tables,
+    rollback_snapshot,
+    staging_name,
+)
+
+
+QUESTIONS = [
+    ("m1", "Will Trump win the election?", "Yes", 100.0),
+    ("m2", "Trump approval above 50%?", "No", 300.0),
+    ("m3", "Will Bitcoin reach $100k?", "Yes", 200.0),
+    ("m4", "Élection présidentielle: Macron?", "Yes", 50.0),
+]
+
+
+class TestMatchExpression(unittest.TestCase):
+    def test_search_becomes_one_substring_phrase(self):
+        self.assertEqual(fts_match_expression("trump elect"), '"trump elect"')
+        self.assertEqual(fts_match_expression('say "hi"'), '"say ""hi"""')
+        self.assertEqual(fts_match_expression("$100k"), '"$100k"')
+
+    def test_short_searches_and_wildcards_stay_on_like(self):
+        for search in ("ab", "50%", "a_b", "", None):
+            self.assertIsNone(fts_match_expression(search))
+
+
+class TestSearchQueries(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        ensure_market_smart_money_stats_schema(self.conn)
+        self._publish(QUESTIONS)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _publish(self, rows):
+        create_staging_tables(self.conn)
+        self.conn.executemany(
+            f"INSERT INTO {staging_name('active_market_outcomes')} (market_id, question, outcome_name, volume_usd, price) "
+            "VALUES (?, ?, ?, ?, 0.5)",
+            rows,
+        )
+        self.conn.commit()
+        finalize_staging_tables(self.conn)
+        publish_staging_tables(self.conn)
+
+    def _search(self, search, **kwargs):
+        return [r["market_id"] for r in query_markets(self.conn, search=search, **kwargs)]
+
+    def test_substring_search_through_fts_matches_like(self):
+        self.assertEqual(self._search("coin"), ["m3"])  # inside a word, as with LIKE '%coin%'
+        self.assertEqual(self._search("rump app"), ["m2"])
+        self.assertEqual(self._search("yes bitcoin"), [])  # one substring, not words across columns
+        for search in ("trump", "TRUMP", "ump", "lection", "win the", "$100k", "Yes", "?"):
+            expected = [
+                m for m, question, outcome, _ in sorted(QUESTIONS, key=lambda q: -q[3])
+                if search.lower() in question.lower() or search.lower() in outcome.lower()
+            ]
+            self.assertEqual(self._search(search), expected, search)
+
+    def test_fts_path_is_an_index_lookup(self):
+        sql, params = build_markets_sql(self.conn, search="trump")
+        plan = " ".join(r[3] for r in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        self.assertIn("VIRTUAL TABLE INDEX", plan)
+        self.assertNotIn("SCAN amo", plan)
+
+    def test_relevance_sort(self):
+        self._publish(QUESTIONS + [("m5", "Trump Trump Trump?", "Yes", 1.0)])
+        self.assertEqual(self._search("trump", sort_by="relevance")[0], "m5")
+        self.assertEqual(self._search("trump", sort_by="relevance", sort_dir="asc")[-1], "m5")
+
+    def test_like_fallback_for_wildcards_short_searches_and_missing_index(self):
+        self.assertEqual(self._search("50%"), ["m2"])
+        self.assertEqual(self._search("Tr"), ["m2", "m1"])
+        self.conn.execute("DROP TABLE market_search")
+        self.assertEqual(self._search("rump", sort_by="relevance"), ["m2", "m1"])  # substring LIKE, volume order
+
+    def test_index_follows_publish_and_rollback(self):
+        self._publish([("m9", "Will it snow in Prague?", "Yes", 1.0)])
+        self.assertEqual(self._search("snow"), ["m9"])
+        self.assertEqual(self._search("trump"), [])
+
+        self.assertTrue(rollback_snapshot(self.conn))
+        self.assertEqual(self._search("snow"), [])
+        self.assertEqual(self._search("trump"), ["m2", "m1"])
+
+    def test_direct_writes_to_live_rows_are_indexed(self):
+        self.conn.execute("INSERT INTO active_market_outcomes (market_id, question, outcome_name, price) VALUES ('m7', 'Fed cuts rates?', 'Yes', 0.5)")
+        self.conn.execute("UPDATE active_market_outcomes SET question = 'Ceasefire by June?' WHERE market_id = 'm1'")
+        self.conn.execute("DELETE FROM active_market_outcomes WHERE market_id = 'm2'")
+
+        self.assertEqual(self._search("fed"), ["m7"])
+        self.assertEqual(self._search("ceasefire"), ["m1"])
+        self.assertEqual(self._search("trump"), [])
+
+    def test_ensure_builds_index_for_existing_databases(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute(SNAPSHOT_TABLE_DDL["active_market_outcomes"].format(name="active_market_outcomes"))
+        conn.execute("INSERT INTO active_market_outcomes (market_id, question, outcome_name) VALUES ('m1', 'Fed cuts rates?', 'Yes')")
+        self.assertTrue(ensure_search_index(conn))
+        self.assertEqual(conn.execute("SELECT rowid FROM market_search WHERE market_search MATCH 'fed'").fetchall(), [(1,)])
+        self.assertTrue(build_search_index(conn))
+
+        # A token index from before the trigram one is rebuilt
+        conn.execute("DROP TABLE market_search")
+        conn.execute("CREATE VIRTUAL TABLE market_search USING fts5(question, outcome_name)")
+        self.assertTrue(ensure_search_index(conn))
+        self.assertEqual(conn.execute("""SELECT rowid FROM market_search WHERE market_search MATCH '"cuts"'""").fetchall(), [(1,)])
+        self.assertEqual(conn.execute("""SELECT rowid FROM market_search WHERE market_search MATCH '"uts r"'""").fetchall(), [(1,)])
+        conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
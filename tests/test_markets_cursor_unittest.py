@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main
+from market_queries import VALID_SORTS
+from result_cache import ResultCache
+from smart_money_materialized import ensure_market_smart_money_stats_schema
+from snapshot_tables import (
+    SMART_MONEY_VERSION_KEY,
+    bump_data_version,
+    create_staging_tables,
+    finalize_staging_tables,
+    publish_staging_tables,
+    staging_name,
+)
+
+
+def _rows(count, volume_offset=0.0):
+    rows = []
+    for i in range(count):
+        rows.append(
+            (
+                f"m{i}",
+                f"c{i}",
+                f"Question {i}?",
+                "Yes",
+                # Repeated values so pages break inside ties; NULLs in the nullable sort columns
+                float(i % 4) * 100 + volume_offset,
+                None if i % 5 == 0 else float(i % 3) * 10,
+                round(0.05 + (i % 7) * 0.1, 2),
+                None if i % 4 == 0 else round((i % 3) * 0.01, 2),
+                None if i % 6 == 0 else f"2030-01-{1 + i % 9:02d}T00:00:00Z",
+            )
+        )
+    return rows
+
+
+class TestMarketsCursor(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(self.db_path)
+        ensure_market_smart_money_stats_schema(conn)
+        conn.commit()
+        conn.close()
+        self._publish(_rows(23))
+        self.patchers = [patch("main.DB_PATH", self.db_path), patch("main.markets_cache", ResultCache(max_entries=64))]
+        for patcher in self.patchers:
+            patcher.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        main.read_pool.close_all()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def _publish(self, rows):
+        conn = sqlite3.connect(self.db_path)
+        create_staging_tables(conn)
+        conn.executemany(
+            f"INSERT INTO {staging_name('active_market_outcomes')} "
+            "(market_id, condition_id, question, outcome_name, volume_usd, liquidity_usd, price, spread, end_date, snapshot_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '2029-12-01T00:00:00Z')",
+            rows,
+        )
+        conn.commit()
+        finalize_staging_tables(conn)
+        publish_staging_tables(conn)
+        conn.close()
+
+    def _get(self, **params):
+        return self.client.get("/api/markets", params={"min_volume": 0, "min_liquidity": 0, **params})
+
+    def _walk(self, **params):
+        seen, cursor = [], None
+        while True:
+            response = self._get(**params, **({"cursor": cursor} if cursor else {}))
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row["market_id"] for row in response.json())
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                return seen
+
+    def test_pages_match_offset_order_for_every_sort(self):
+        for sort_by in VALID_SORTS:
+            for sort_dir in ("asc", "desc"):
+                with self.subTest(sort_by=sort_by, sort_dir=sort_dir):
+                    expected = [row["market_id"] for row in self._get(sort_by=sort_by, sort_dir=sort_dir, limit=100).json()]
+                    self.assertEqual(len(expected), 23)
+                    self.assertEqual(self._walk(sort_by=sort_by, sort_dir=sort_dir, limit=5), expected)
+
+    def test_no_cursor_on_last_page(self):
+        self.assertNotIn("x-next-cursor", self._get(limit=24).headers)
+        # A full page can't tell whether more rows follow; the next one is then empty
+        last = self._get(limit=23, cursor=self._get(limit=23).headers["x-next-cursor"])
+        self.assertEqual(last.json(), [])
+        self.assertNotIn("x-next-cursor", last.headers)
+
+    def test_pages_stay_on_their_snapshot_across_a_refresh(self):
+        first = self._get(limit=10)
+        self._publish(_rows(23, volume_offset=1000.0)[:3])
+
+        rest = self._get(limit=10, cursor=first.headers["x-next-cursor"])
+        self.assertEqual(rest.status_code, 200)
+        # Still the old generation's rows, not the three new ones
+        self.assertEqual(len(rest.json()), 10)
+        self.assertTrue(all(row["volume_usd"] < 1000 for row in rest.json()))
+
+        self._publish(_rows(2))
+        expired = self._get(limit=10, cursor=rest.headers["x-next-cursor"])
+        self.assertEqual(expired.status_code, 410)
+
+    def _refresh_smart_money(self, yes_total):
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany(
+            "INSERT OR REPLACE INTO market_smart_money_stats (condition_id, yes_total) VALUES (?, ?)",
+            [(f"c{i}", yes_total(i)) for i in range(23)],
+        )
+        bump_data_version(conn, SMART_MONEY_VERSION_KEY)
+        conn.commit()
+        conn.close()
+
+    def test_smart_money_cursor_expires_when_stats_refresh(self):
+        self._refresh_smart_money(lambda i: i % 5)
+        first = self._get(limit=10, sort_by="yes_total")
+        by_volume = self._get(limit=10)
+
+        # A publish alone keeps the stats, so the previous generation still pages consistently
+        self._publish(_rows(23, volume_offset=1000.0))
+        self.assertEqual(self._get(limit=10, sort_by="yes_total", cursor=first.headers["x-next-cursor"]).status_code, 200)
+
+        # Re-ranked stats would shift rows under the cursor
+        self._refresh_smart_money(lambda i: 5 - i % 5)
+        expired = self._get(limit=10, sort_by="yes_total", cursor=first.headers["x-next-cursor"])
+        self.assertEqual(expired.status_code, 410)
+        # Orders that don't use the stats are unaffected
+        self.assertEqual(self._get(limit=10, cursor=by_volume.headers["x-next-cursor"]).status_code, 200)
+
+    def test_cursor_for_other_filters_or_garbage_is_rejected(self):
+        cursor = self._get(limit=5).headers["x-next-cursor"]
+        self.assertEqual(self._get(limit=7, cursor=cursor).status_code, 200)  # page size may change
+        self.assertEqual(self._get(limit=5, sort_by="price", cursor=cursor).status_code, 400)
+        self.assertEqual(self._get(limit=5, search="question", cursor=cursor).status_code, 400)
+        self.assertEqual(self._get(limit=5, cursor="not-a-cursor").status_code, 400)
+
+    def test_relevance_order_has_no_cursor(self):
+        response = self._get(limit=5, search="question", sort_by="relevance")
+        self.assertEqual(len(response.json()), 5)
+        self.assertNotIn("x-next-cursor", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main
+import price_history
+from snapshot_tables import SNAPSHOT_TABLE_DDL
+
+
+T0 = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+class TestPriceHistory(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(SNAPSHOT_TABLE_DDL["active_market_outcomes"].format(name="active_market_outcomes"))
+        for idx in (0, 1):
+            self.conn.execute(
+                "INSERT INTO active_market_outcomes (market_id, condition_id, outcome_index, price, spread, volume_usd, liquidity_usd) "
+                "VALUES ('m1', 'c1', ?, 0.5, 0.01, 1000.4, 50.6)",
+                (idx,),
+            )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def _record(self, at, yes_price):
+        self.conn.execute("UPDATE active_market_outcomes SET price = ? WHERE outcome_index = 0", (yes_price,))
+        price_history.record_and_compact(self.conn, at.isoformat())
+
+    def test_records_compact_integer_samples(self):
+        self._record(T0, 0.4321)
+        raw = self.conn.execute("SELECT resolution, ts, price, spread, volume, liquidity FROM price_history ORDER BY outcome_key").fetchall()
+        self.assertEqual(raw[0], (0, int(T0.timestamp()), 4321, 100, 1000, 51))
+
+        points = price_history.query_history(self.conn, "c1", T0 - timedelta(hours=1), T0 + timedelta(hours=1), outcome_index=0)
+        self.assertEqual(len(points), 1)
+        self.assertAlmostEqual(points[0]["price"], 0.4321)
+        self.assertEqual(points[0]["ts"], T0.isoformat())
+
+    def test_downsamples_tiers_and_applies_retention(self):
+        # Two samples per hour over 20 days, then compact as of the last one
+        with patch.object(price_history, "HISTORY_RAW_RETENTION_DAYS", 1), \
+             patch.object(price_history, "HISTORY_HOURLY_RETENTION_DAYS", 5), \
+             patch.object(price_history, "HISTORY_DAILY_RETENTION_DAYS", 10):
+            for step in range(20 * 48):
+                self._record(T0 + timedelta(minutes=30 * step), 0.3 + (step % 48) / 1000.0)
+            now = T0 + timedelta(minutes=30 * (20 * 48 - 1))
+
+        counts = dict(
+            self.conn.execute(
+                "SELECT resolution, COUNT(*) FROM price_history WHERE outcome_key = 1 GROUP BY resolution"
+            ).fetchall()
+        )
+        self.assertLessEqual(counts[price_history.RESOLUTION_RAW], 2 * 25)
+        self.assertLessEqual(counts[price_history.RESOLUTION_HOUR], 24 * 5)
+        self.assertLessEqual(counts[price_history.RESOLUTION_DAY], 11)
+
+        oldest = self.conn.execute("SELECT MIN(ts) FROM price_history").fetchone()[0]
+        self.assertGreaterEqual(oldest, int((now - timedelta(days=11)).timestamp()))
+
+        day = self.conn.execute(
+            "SELECT price, price_low, price_high FROM price_history WHERE outcome_key = 1 AND resolution = ? ORDER BY ts LIMIT 1",
+            (price_history.RESOLUTION_DAY,),
+        ).fetchone()
+        self.assertEqual((day[1], day[2]), (3000, 3470))  # low/high survive both rollups
+        self.assertEqual(day[0], 3470)  # close of the day
+
+        # Tiers are disjoint, so a full-range query returns each instant once
+        points = price_history.query_history(self.conn, "m1", now - timedelta(days=30), now, outcome_index=0)
+        stamps = [p["ts"] for p in points]
+        self.assertEqual(stamps, sorted(set(stamps)))
+
+        daily = price_history.query_history(self.conn, "m1", now - timedelta(days=30), now, outcome_index=0, resolution="day")
+        self.assertLessEqual(len(daily), 12)
+
+
+    def test_compaction_seeks_tiers_by_age(self):
+        self._record(T0, 0.5)
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        price_history.compact_history(self.conn, T0 + timedelta(days=400))
+        self.conn.set_trace_callback(None)
+
+        by_age = [sql for sql in statements if "ts <" in sql]
+        self.assertEqual(len(by_age), 5)  # two rollups (insert + delete each) and the daily expiry
+        for sql in by_age:
+            plan = " ".join(row[3] for row in self.conn.execute("EXPLAIN QUERY PLAN " + sql))
+            self.assertNotIn("SCAN price_history", plan, sql)
+
+
+class TestHistoryEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(SNAPSHOT_TABLE_DDL["active_market_outcomes"].format(name="active_market_outcomes"))
+        conn.execute(
+            "INSERT INTO active_market_outcomes (market_id, condition_id, outcome_index, price, spread, volume_usd, liquidity_usd) "
+            "VALUES ('m1', 'c1', 0, 0.25, 0.02, 10, 5)"
+        )
+        price_history.record_and_compact(conn, T0.isoformat())
+        conn.close()
+        self.patcher = patch("main.DB_PATH", self.db_path)
+        self.patcher.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.patcher.stop()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_range_query(self):
+        response = self.client.get(
+            "/api/markets/m1/history",
+            params={"start": (T0 - timedelta(days=1)).isoformat(), "end": (T0 + timedelta(days=1)).isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data), 1)
+        self.assertAlmostEqual(data[0]["price"], 0.25)
+
+        outside = self.client.get("/api/markets/m1/history", params={"start": "2020-01-01T00:00:00Z", "end": "2020-01-02T00:00:00Z"})
+        self.assertEqual(outside.json(), [])
+
+    def test_rejects_bad_params(self):
+        self.assertEqual(self.client.get("/api/markets/m1/history", params={"resolution": "minute"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/markets/m1/history", params={"start": "yesterday"}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from rate_limit import AimdConcurrency, CircuitBreaker, TokenBucket, parse_retry_after
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_parses_seconds_and_http_dates(self):
+        now = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        self.assertEqual(parse_retry_after("5"), 5.0)
+        self.assertEqual(parse_retry_after("Thu, 01 Jan 2026 12:00:30 GMT", now=now), 30.0)
+        self.assertEqual(parse_retry_after("Thu, 01 Jan 2026 11:00:00 GMT", now=now), 0.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_caps_long_pauses(self):
+        with patch("rate_limit.RATE_LIMIT_MAX_RETRY_AFTER", 60):
+            self.assertEqual(parse_retry_after("3600"), 60)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.patches = [
+            patch("time.monotonic", lambda: self.now),
+            patch("time.sleep", self._sleep),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def _sleep(self, seconds):
+        self.now += seconds
+
+    def test_burst_then_steady_rate(self):
+        bucket = TokenBucket(rate=5, burst=2)
+        waits = [bucket.acquire() for _ in range(4)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.2)
+        self.assertAlmostEqual(self.now, 0.4)
+
+    def test_throttle_pauses_halves_rate_and_recovers(self):
+        bucket = TokenBucket(rate=8, burst=8)
+        bucket.throttle(retry_after=3)
+        self.assertEqual(bucket.rate, 4)
+        bucket.acquire()
+        self.assertGreaterEqual(self.now, 3.0)
+
+        for _ in range(40):
+            bucket.record_success()
+        self.assertEqual(bucket.rate, 8)
+
+
+class TestAimdConcurrency(unittest.TestCase):
+    def test_grows_additively_and_cuts_once_per_congestion_event(self):
+        window = AimdConcurrency(initial=4, min_window=1, max_window=10, decrease=0.5)
+        for _ in range(8):
+            window.release(window.acquire(), "ok")
+        self.assertAlmostEqual(window.window, 5.69, places=2)
+
+        # A whole window of requests issued before the cut all come back throttled: one cut
+        tickets = [window.acquire() for _ in range(5)]
+        for ticket in tickets:
+            window.release(ticket, "throttled")
+        self.assertAlmostEqual(window.window, 2.84, places=2)
+        self.assertEqual(window.stats()["throttle_events"], 5)
+        self.assertEqual(window.stats()["cuts"], 1)
+
+        # Requests issued after that cut can cut again; the floor holds
+        for _ in range(4):
+            window.release(window.acquire(), "timeout")
+        self.assertEqual(window.window, 1.0)
+        self.assertEqual(window.stats()["timeouts"], 4)
+
+        for _ in range(200):
+            window.release(window.acquire(), "ok")
+        self.assertEqual(window.window, 10.0)
+        self.assertEqual(window.stats()["in_flight"], 0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(
+            "test", window=10, min_calls=4, error_rate=0.5, cooldown=30, max_cooldown=100, clock=lambda: self.now
+        )
+
+    def test_opens_on_error_rate_and_refuses_calls(self):
+        for ok in (True, False, True, True, False):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)  # 2 of 5 failed
+
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+        self.assertEqual(self.breaker.stats()["opened"], 1)
+
+    def test_half_open_probe_closes_or_reopens_with_longer_cooldown(self):
+        for _ in range(4):
+            self.breaker.record(False)
+        self.now = 30
+        self.assertTrue(self.breaker.allow())  # the probe
+        self.assertFalse(self.breaker.allow())  # only one probe at a time
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.now = 80
+        self.assertFalse(self.breaker.allow())  # cooldown doubled to 60s
+        self.now = 90
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.cooldown, 30)
+        self.assertEqual(self.breaker.stats()["probes"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from read_pool import ReadConnectionPool
+from snapshot_tables import bump_data_version
+
+
+class TestReadConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = self._make_db("markets.db", 1)
+        self.pool = ReadConnectionPool(mmap_size=1 << 20, cache_size=-2048, temp_store="memory", statement_cache=32)
+
+    def tearDown(self):
+        self.pool.close_all()
+        self.tmp.cleanup()
+
+    def _make_db(self, name, value):
+        path = os.path.join(self.tmp.name, name)
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (?)", (value,))
+        bump_data_version(conn)
+        conn.commit()
+        conn.close()
+        return path
+
+    def _read(self, path=None):
+        with self.pool.connection(path or self.db_path) as conn:
+            return conn, conn.execute("SELECT x FROM t").fetchone()[0]
+
+    def test_thread_keeps_its_tuned_read_only_connection(self):
+        first, _ = self._read()
+        second, _ = self._read()
+        self.assertIs(first, second)
+        self.assertEqual(first.execute("PRAGMA cache_size").fetchone()[0], -2048)
+        self.assertEqual(first.execute("PRAGMA temp_store").fetchone()[0], 2)
+        with self.assertRaises(sqlite3.OperationalError):
+            first.execute("INSERT INTO t VALUES (2)")
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self._read()[0]))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], first)
+        self.assertEqual(self.pool.stats(), {"open": 2, "opened": 2})
+
+    def test_sees_commits_and_reopens_on_new_generation(self):
+        first, _ = self._read()
+        writer = sqlite3.connect(self.db_path)
+        writer.execute("UPDATE t SET x = 5")
+        writer.commit()
+        again, value = self._read()
+        self.assertEqual(value, 5)
+        self.assertIs(again, first)
+
+        bump_data_version(writer)
+        writer.commit()
+        writer.close()
+        reopened, _ = self._read()
+        self.assertIsNot(reopened, first)
+        self.assertEqual(self.pool.stats()["open"], 1)
+
+    def test_reopens_on_other_path_or_replaced_file(self):
+        other_path = self._make_db("other.db", 7)
+        first, _ = self._read(other_path)
+        self.assertIsNot(self._read()[0], first)
+
+        # A restored copy at the same path, even with the same data version
+        second, _ = self._read()
+        os.replace(other_path, self.db_path)
+        conn, value = self._read()
+        self.assertEqual(value, 7)
+        self.assertIsNot(conn, second)
+
+    def test_missing_file_falls_back_to_one_off_connection(self):
+        missing = os.path.join(self.tmp.name, "missing.db")
+        with self.pool.connection(missing) as conn:
+            self.assertEqual(conn.execute("SELECT 1").fetchone()[0], 1)
+        self.assertEqual(self.pool.stats()["open"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
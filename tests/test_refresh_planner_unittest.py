@@ -0,0 +1,137 @@
+import sqlite3
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from refresh_planner import (
+    HolderTier,
+    ensure_holder_schedule_schema,
+    mark_holders_fetched,
+    plan_holder_refresh,
+    plan_pnl_refresh,
+)
+
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestPnlRefreshPlanner(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.executescript(
+            """
+            CREATE TABLE wallets_stats (wallet_address TEXT PRIMARY KEY, total_pnl REAL, last_updated TEXT, alias TEXT);
+            CREATE TABLE holders (market_id TEXT, outcome_index INTEGER, wallet_address TEXT, position_size REAL, snapshot_at TEXT);
+            CREATE TABLE active_market_outcomes (condition_id TEXT);
+            INSERT INTO active_market_outcomes VALUES ('live');
+            """
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _wallet(self, address, hours_ago=None, exposure=0.0, market="live"):
+        if hours_ago is not None:
+            self.conn.execute(
+                "INSERT INTO wallets_stats VALUES (?, 0, ?, NULL)",
+                (address, (NOW - timedelta(hours=hours_ago)).isoformat()),
+            )
+        if exposure:
+            self.conn.execute("INSERT INTO holders VALUES (?, 0, ?, ?, '')", (market, address, exposure))
+
+    def test_skips_fresh_wallets_and_ranks_by_staleness_and_exposure(self):
+        self._wallet("fresh", hours_ago=2, exposure=1_000_000)
+        self._wallet("new_small", exposure=10)
+        self._wallet("new_whale", exposure=50_000)
+        self._wallet("stale_dust", hours_ago=40, exposure=1)
+        self._wallet("stale_whale", hours_ago=30, exposure=100_000)
+        # Exposure in markets that are no longer active does not count
+        self._wallet("stale_closed", hours_ago=30, exposure=100_000, market="closed")
+
+        plan = plan_pnl_refresh(
+            self.conn,
+            ["fresh", "new_small", "new_whale", "stale_dust", "stale_whale", "stale_closed"],
+            ttl_hours=24, budget=0, now=NOW,
+        )
+
+        self.assertEqual(plan.fresh, ["fresh"])
+        self.assertEqual(plan.refresh, ["new_whale", "new_small", "stale_whale", "stale_dust", "stale_closed"])
+        self.assertEqual(plan.deferred, [])
+
+    def test_budget_defers_lowest_priority(self):
+        for i in range(5):
+            self._wallet(f"w{i}", hours_ago=25 + i, exposure=100)
+
+        plan = plan_pnl_refresh(self.conn, [f"w{i}" for i in range(5)], ttl_hours=24, budget=2, now=NOW)
+
+        self.assertEqual(plan.refresh, ["w4", "w3"])
+        self.assertEqual(plan.deferred, ["w2", "w1", "w0"])
+
+    def test_zero_ttl_refreshes_everything(self):
+        self._wallet("a", hours_ago=0.1)
+        plan = plan_pnl_refresh(self.conn, ["a"], ttl_hours=0, budget=0, now=NOW)
+        self.assertEqual(plan.refresh, ["a"])
+        self.assertEqual(plan.fresh, [])
+
+
+class TestHolderRefreshSchedule(unittest.TestCase):
+    TIERS = [
+        HolderTier("hot", 1, min_volume=1000, min_liquidity=500, max_hours_to_expire=24),
+        HolderTier("warm", 6, min_volume=100),
+        HolderTier("cold", 24),
+    ]
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.execute(
+            "CREATE TABLE active_market_outcomes (condition_id TEXT, outcome_index INTEGER, volume_usd REAL, liquidity_usd REAL, end_date TEXT)"
+        )
+        ensure_holder_schedule_schema(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _market(self, cid, volume=0, liquidity=0, expires_in_hours=24 * 30, fetched_hours_ago=None):
+        end = (NOW + timedelta(hours=expires_in_hours)).isoformat()
+        for outcome in (0, 1):
+            self.conn.execute(
+                "INSERT INTO active_market_outcomes VALUES (?, ?, ?, ?, ?)", (cid, outcome, volume, liquidity, end)
+            )
+        if fetched_hours_ago is not None:
+            mark_holders_fetched(self.conn, cid, (NOW - timedelta(hours=fetched_hours_ago)).isoformat())
+
+    def test_tiers_set_refresh_cadence(self):
+        self._market("hot_volume", volume=5000, fetched_hours_ago=1.5)
+        self._market("hot_expiring", expires_in_hours=5, fetched_hours_ago=3)
+        self._market("hot_recent", liquidity=900, fetched_hours_ago=0.5)
+        self._market("warm_due", volume=200, fetched_hours_ago=7)
+        self._market("warm_recent", volume=200, fetched_hours_ago=2)
+        self._market("cold_new")
+        self._market("cold_recent", fetched_hours_ago=10)
+        self._market("cold_due", fetched_hours_ago=30)
+
+        plan = plan_holder_refresh(self.conn, tiers=self.TIERS, budget=0, now=NOW)
+
+        self.assertEqual(plan.due, ["hot_expiring", "hot_volume", "warm_due", "cold_new", "cold_due"])
+        self.assertEqual(plan.due_by_tier, {"hot": 2, "warm": 1, "cold": 2})
+        self.assertEqual(plan.not_due, 3)
+
+    def test_budget_keeps_hot_markets_first(self):
+        self._market("cold_a")
+        self._market("cold_b")
+        self._market("hot", volume=5000, fetched_hours_ago=2)
+
+        plan = plan_holder_refresh(self.conn, tiers=self.TIERS, budget=2, now=NOW)
+
+        self.assertEqual(plan.due, ["hot", "cold_a"])
+        self.assertEqual(plan.deferred, ["cold_b"])
+
+    def test_fetch_stamp_is_upserted(self):
+        self._market("m", fetched_hours_ago=30)
+        mark_holders_fetched(self.conn, "m", NOW.isoformat())
+        plan = plan_holder_refresh(self.conn, tiers=self.TIERS, budget=0, now=NOW)
+        self.assertEqual(plan.due, [])
+        self.assertEqual(plan.not_due, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
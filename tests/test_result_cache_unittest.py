@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+import main
+from market_queries import markets_filter_key
+from result_cache import ResultCache
+from smart_money_materialized import ensure_market_smart_money_stats_schema, refresh_market_smart_money_stats
+from snapshot_tables import SNAPSHOT_TABLE_DDL, bump_data_version
+
+
+class TestResultCache(unittest.TestCase):
+    def test_evicts_least_recently_used_past_entry_limit(self):
+        cache = ResultCache(max_entries=2, max_bytes=10_000)
+        cache.put("a", [1])
+        cache.put("b", [2])
+        self.assertEqual(cache.get("a"), [1])
+        cache.put("c", [3])
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [1])
+        self.assertEqual(cache.get("c"), [3])
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"]), (2, 1))
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_ratio"]), (3, 1, 0.75))
+
+    def test_byte_budget_evicts_and_rejects_oversized_results(self):
+        cache = ResultCache(max_entries=10, max_bytes=100)
+        cache.put("a", "x", size=60)
+        cache.put("b", "y", size=60)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 60)
+
+        self.assertFalse(cache.put("huge", "z", size=101))
+        self.assertIsNone(cache.get("huge"))
+        self.assertEqual(cache.get("b"), "y")
+
+    def test_zero_entries_disables_cache(self):
+        cache = ResultCache(max_entries=0)
+        self.assertFalse(cache.put("a", [1]))
+        self.assertIsNone(cache.stats()["hit_ratio"])
+
+
+class TestMarketsFilterKey(unittest.TestCase):
+    def test_equivalent_filters_share_a_key(self):
+        self.assertEqual(
+            markets_filter_key(included_tags=["Politics, Crypto"], min_volume=1000, min_apr=0, max_hours_to_expire=24, min_hours_to_expire=48),
+            markets_filter_key(included_tags=["Crypto", "Politics", "Crypto"], min_volume=1000.0, min_hours_to_expire=24, max_hours_to_expire=48),
+        )
+        self.assertEqual(markets_filter_key(sort_by="bogus", search=""), markets_filter_key())
+
+    def test_different_filters_differ(self):
+        self.assertNotEqual(markets_filter_key(limit=50), markets_filter_key(limit=100))
+        self.assertNotEqual(markets_filter_key(included_tags=["A"]), markets_filter_key(excluded_tags=["A"]))
+
+
+class TestMarketsEndpointCache(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(SNAPSHOT_TABLE_DDL["active_market_outcomes"].format(name="active_market_outcomes"))
+        conn.execute(
+            "INSERT INTO active_market_outcomes (market_id, condition_id, question, outcome_index, outcome_name, volume_usd, price) "
+            "VALUES ('m1', 'c1', 'Will it rain?', 0, 'Yes', 5000, 0.4)"
+        )
+        conn.execute("CREATE TABLE holders (market_id TEXT, outcome_index INTEGER, wallet_address TEXT, position_size REAL, snapshot_at TEXT)")
+        conn.execute("CREATE TABLE wallets_stats (wallet_address TEXT PRIMARY KEY, total_pnl REAL, last_updated TEXT, alias TEXT)")
+        ensure_market_smart_money_stats_schema(conn)
+        bump_data_version(conn)
+        conn.commit()
+        conn.close()
+        self.patchers = [patch("main.DB_PATH", self.db_path), patch("main.markets_cache", ResultCache(max_entries=16))]
+        for patcher in self.patchers:
+            patcher.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def _execute(self, *statements):
+        conn = sqlite3.connect(self.db_path)
+        for sql in statements:
+            conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+    def _markets(self, **params):
+        response = self.client.get("/api/markets", params=params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_result_is_reused_until_a_new_markets_version(self):
+        self.assertEqual(len(self._markets(min_volume=1000)), 1)
+        self._execute("UPDATE active_market_outcomes SET volume_usd = 10")
+
+        # Same data version: the unpublished write is not visible yet
+        self.assertEqual(len(self._markets(min_volume="1000.0")), 1)
+        self.assertEqual(main.markets_cache.stats()["hits"], 1)
+
+        conn = sqlite3.connect(self.db_path)
+        bump_data_version(conn)
+        conn.commit()
+        conn.close()
+        self.assertEqual(self._markets(min_volume=1000), [])
+
+    def test_smart_money_refresh_invalidates(self):
+        self.assertEqual(self._markets()[0]["yes_total"], 0)
+        self._execute(
+            "INSERT INTO wallets_stats VALUES ('0xA', 5000, '', NULL)",
+            "INSERT INTO holders VALUES ('c1', 0, '0xA', 100, '')",
+        )
+        self.assertEqual(self._markets()[0]["yes_total"], 0)
+
+        conn = sqlite3.connect(self.db_path)
+        refresh_market_smart_money_stats(conn)
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(self._markets()[0]["yes_total"], 1)
+
+    def test_if_none_match_gets_304_without_running_the_query(self):
+        first = self.client.get("/api/markets", params={"min_volume": 1000})
+        etag = first.headers["etag"]
+        self.assertIn("max-age", first.headers["cache-control"])
+        self.assertNotIn("pragma", first.headers)
+
+        with patch("main.query_markets") as query:
+            again = self.client.get("/api/markets", params={"min_volume": "1000.0"}, headers={"If-None-Match": f"W/{etag}"})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["etag"], etag)
+        query.assert_not_called()
+
+        other = self.client.get("/api/markets", params={"min_volume": 10}, headers={"If-None-Match": etag})
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other.headers["etag"], etag)
+
+        conn = sqlite3.connect(self.db_path)
+        bump_data_version(conn)
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.client.get("/api/markets", params={"min_volume": 1000}, headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_status_and_tags_revalidate(self):
+        for path in ("/api/status", "/api/tags"):
+            etag = self.client.get(path).headers["etag"]
+            self.assertEqual(self.client.get(path, headers={"If-None-Match": etag}).status_code, 304)
+
+    def test_unversioned_database_is_not_cached(self):
+        self._execute("DELETE FROM data_versions")
+        self._markets()
+        response = self.client.get("/api/markets")
+        self.assertEqual(main.markets_cache.stats()["entries"], 0)
+        self.assertNotIn("etag", response.headers)
+        self.assertEqual(response.headers["cache-control"], "no-cache, no-store, must-revalidate")
+
+
+if __name__ == "__main__":
+    unittest.main()
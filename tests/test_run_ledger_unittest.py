@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import smart_money_scraper
+from run_ledger import (
+    MODE_FULL,
+    MODE_WALLETS,
+    add_markets,
+    ensure_run_ledger_schema,
+    mark_market_done,
+    mark_market_failed,
+    remaining_markets,
+    start_run,
+)
+from refresh_planner import plan_pnl_refresh
+
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class TestStartRun(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        ensure_run_ledger_schema(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _statuses(self):
+        return dict(self.conn.execute("SELECT run_id, status FROM smart_money_runs").fetchall())
+
+    def test_continues_recent_run_of_same_mode(self):
+        first = start_run(self.conn, MODE_FULL, now=NOW)
+        self.assertFalse(first.resumed)
+
+        again = start_run(self.conn, MODE_FULL, now=NOW + timedelta(hours=1), resume_hours=12)
+        self.assertTrue(again.resumed)
+        self.assertEqual(again.run_id, first.run_id)
+
+    def test_abandons_stale_and_other_mode_runs(self):
+        stale = start_run(self.conn, MODE_FULL, now=NOW - timedelta(hours=20))
+        other = start_run(self.conn, MODE_WALLETS, now=NOW - timedelta(hours=1))
+
+        state = start_run(self.conn, MODE_FULL, now=NOW, resume_hours=12)
+
+        self.assertFalse(state.resumed)
+        statuses = self._statuses()
+        self.assertEqual(statuses[stale.run_id], "abandoned")
+        self.assertEqual(statuses[other.run_id], "abandoned")
+        self.assertEqual(statuses[state.run_id], "running")
+
+    def test_failed_markets_are_remaining_and_come_first(self):
+        run_id = start_run(self.conn, MODE_FULL, now=NOW).run_id
+        add_markets(self.conn, run_id, ["a", "b", "c"])
+        mark_market_done(self.conn, run_id, "a", {"0x1": "alias"})
+        mark_market_failed(self.conn, run_id, "c")
+
+        self.assertEqual(remaining_markets(self.conn, run_id), ["c", "b"])
+
+
+class TestResumableRun(unittest.TestCase):
+    MARKETS = [f"cid{i}" for i in range(6)]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "markets.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE wallets_stats (wallet_address TEXT PRIMARY KEY, total_pnl REAL, last_updated TEXT, alias TEXT)")
+        conn.execute("CREATE TABLE holders (market_id TEXT, outcome_index INTEGER, wallet_address TEXT, position_size REAL, snapshot_at TEXT)")
+        conn.execute("CREATE TABLE active_market_outcomes (condition_id TEXT)")
+        conn.executemany("INSERT INTO active_market_outcomes (condition_id) VALUES (?)", [(c,) for c in self.MARKETS])
+        conn.commit()
+        conn.close()
+        self.holder_calls, self.pnl_calls = [], []
+        self.cid1_attempts = 0
+        self.crash_on = set()
+        self.pnl_fails = set()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _fetch_holders(self, cid, limit=1000):
+        self.holder_calls.append(cid)
+        if cid in self.crash_on:
+            self.crash_on.discard(cid)
+            raise SystemExit("container stopped")
+        if cid == "cid1":
+            self.cid1_attempts += 1
+            if self.cid1_attempts == 1:
+                return None  # fails the first pass, recovered by the retry pass
+        return [{"address": f"0x{cid}", "positionSize": 10, "outcomeIndex": 0, "name": ""}]
+
+    def _fetch_pnl(self, wallet):
+        self.pnl_calls.append(wallet)
+        if wallet in self.crash_on:
+            self.crash_on.discard(wallet)
+            raise SystemExit("container stopped")
+        if wallet in self.pnl_fails:
+            return None
+        return 1.0
+
+    def _run(self, *args):
+        with patch("smart_money_scraper.get_db_connection", side_effect=self._get_conn), \
+             patch("smart_money_scraper.refresh_market_smart_money_stats",
+                   return_value={"mode": "incremental", "markets": 0, "wallets": 0}), \
+             patch("smart_money_scraper.HoldersClient") as MockHolders, \
+             patch("smart_money_scraper.PnLClient") as MockPnL, \
+             patch("time.sleep"):
+            MockHolders.return_value.fetch_holders.side_effect = self._fetch_holders
+            MockPnL.return_value.fetch_user_pnl.side_effect = self._fetch_pnl
+            smart_money_scraper.run(list(args))
+
+    def _query(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def test_restart_continues_holders_phase_and_retries_failed_markets(self):
+        self.crash_on = {"cid4"}
+        with self.assertRaises(SystemExit):
+            self._run("--async", "--concurrency", "1", "--rps", "1000")
+
+        remaining = {r[0] for r in self._query("SELECT key FROM smart_money_run_items WHERE kind = 'market' AND state != 'done'")}
+        self.assertIn("cid4", remaining)
+        self.holder_calls.clear()
+
+        self._run("--async", "--concurrency", "1", "--rps", "1000")
+
+        # Markets saved before the crash are not fetched again
+        self.assertEqual(set(self.holder_calls), remaining)
+        stats = {r[0] for r in self._query("SELECT wallet_address FROM wallets_stats")}
+        self.assertEqual(stats, {f"0x{cid}" for cid in self.MARKETS})
+        self.assertEqual(self._query("SELECT status FROM smart_money_runs"), [("done",)])
+        self.assertEqual(self._query("SELECT COUNT(*) FROM smart_money_run_items"), [(0,)])
+
+    def test_restart_skips_wallets_already_saved(self):
+        self.crash_on = {"0xcid3"}
+        with self.assertRaises(SystemExit):
+            self._run("--pnl-ttl-hours", "0")
+
+        done = {r[0] for r in self._query("SELECT key FROM smart_money_run_items WHERE kind = 'wallet' AND state = 'done'")}
+        self.holder_calls.clear()
+        self.pnl_calls.clear()
+
+        self._run("--pnl-ttl-hours", "0")
+
+        self.assertEqual(self.holder_calls, [])
+        self.assertIn("0xcid3", self.pnl_calls)
+        self.assertFalse(done & set(self.pnl_calls))
+        self.assertEqual(len(self._query("SELECT * FROM wallets_stats")), len(self.MARKETS))
+
+    def test_failed_holders_save_goes_to_retry_pass_not_done(self):
+        real_save, real_done = smart_money_scraper.save_holders_batch, smart_money_scraper.mark_market_done
+        save_calls, done = [], []
+
+        def save(conn, cid, holders):
+            save_calls.append(cid)
+            if cid == "cid3" or (cid == "cid5" and save_calls.count("cid5") == 1):
+                raise sqlite3.OperationalError("disk I/O error")
+            real_save(conn, cid, holders)
+
+        def mark_done(conn, run_id, cid, wallets):
+            done.append(cid)
+            real_done(conn, run_id, cid, wallets)
+
+        with patch("smart_money_scraper.save_holders_batch", side_effect=save), \
+             patch("smart_money_scraper.mark_market_done", side_effect=mark_done):
+            self._run("--pnl-ttl-hours", "0")
+
+        # Both failed saves went through the retry pass (cid1's failed fetch too); only confirmed saves count as done
+        self.assertEqual(sorted(c for c in self.holder_calls if self.holder_calls.count(c) > 1), ["cid1", "cid1", "cid3", "cid3", "cid5", "cid5"])
+        self.assertNotIn("cid3", done)
+        self.assertEqual(sorted(done), sorted(c for c in self.MARKETS if c != "cid3"))
+        self.assertNotIn("0xcid3", self.pnl_calls)
+
+    def test_failed_pnl_fetch_stays_due(self):
+        self.pnl_fails = {"0xcid2"}
+        self._run("--pnl-ttl-hours", "24")
+
+        stats = {r[0] for r in self._query("SELECT wallet_address FROM wallets_stats")}
+        self.assertNotIn("0xcid2", stats)
+        self.assertEqual(len(stats), len(self.MARKETS) - 1)
+
+        conn = self._get_conn()
+        try:
+            plan = plan_pnl_refresh(conn, [f"0x{cid}" for cid in self.MARKETS], ttl_hours=24, budget=0)
+        finally:
+            conn.close()
+        self.assertEqual(plan.refresh, ["0xcid2"])
+
+        self.pnl_fails.clear()
+        self.pnl_calls.clear()
+        self._run("--pnl-ttl-hours", "24")
+        self.assertEqual(self.pnl_calls, ["0xcid2"])
+        self.assertEqual(self._query("SELECT total_pnl FROM wallets_stats WHERE wallet_address = '0xcid2'"), [(1.0,)])
+
+    def test_fresh_run_starts_over(self):
+        self.crash_on = {"0xcid3"}
+        with self.assertRaises(SystemExit):
+            self._run()
+        self.holder_calls.clear()
+
+        self._run("--fresh-run")
+
+        self.assertEqual(len(self.holder_calls), len(self.MARKETS))
+        statuses = sorted(r[0] for r in self._query("SELECT status FROM smart_money_runs"))
+        self.assertEqual(statuses, ["abandoned", "done"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,332 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import gamma_client
+import scraper
+
+
+class _FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def json(self):
+        return json.loads(json.dumps(self._payload))
+
+
+def _market(i):
+    return {
+        "id": f"m{i}",
+        "conditionId": f"c{i}",
+        "question": f"Question {i}?",
+        "outcomes": '["Yes", "No"]',
+        "outcomePrices": '["0.4", "0.6"]',
+        "volume": "1000",
+        "liquidity": "50",
+        "spread": "0.01",
+        "endDate": "2099-01-01T00:00:00Z",
+        "events": [{"id": "e1" if i % 2 == 0 else "e2"}],
+    }
+
+
+def _flush_after_m3(add):
+    # Commits m3 as its own chunk, as a full SCRAPE_CHUNK_ROWS batch would
+    def add_then_flush(writer, outcome_rows, tag_rows):
+        add(writer, outcome_rows, tag_rows)
+        if outcome_rows and outcome_rows[0][1] == "m3":
+            writer.flush()
+    return add_then_flush
+
+
+class _ScrapeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "markets.db")
+        self.market_pages = {offset: [_market(i) for i in range(offset, min(offset + 100, 250))] for offset in (0, 100, 200)}
+        self.event_pages = {
+            0: [
+                {"id": "e1", "slug": "even", "icon": "i1", "tags": [{"label": "Politics"}, {"label": "US"}]},
+                {"id": "e2", "slug": "odd", "tags": [{"label": "Crypto"}]},
+            ]
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _fake_get(self, url, params=None, timeout=None):
+        offset = int((params or {}).get("offset", 0))
+        pages = self.market_pages if url.endswith("/markets") else self.event_pages
+        payload = pages.get(offset, [])
+        return _FakeResponse([], 500) if payload is None else _FakeResponse(payload)
+
+    def _run(self, **kwargs):
+        with patch.object(scraper, "DATA_DIR", self.tmp.name), \
+             patch.object(scraper, "DB_PATH", self.db_path), \
+             patch.object(scraper, "SCRAPE_CHUNK_ROWS", 64), \
+             patch("http_cache.GAMMA_HTTP_CACHE", False), \
+             patch("requests.Session.get", side_effect=self._fake_get):
+            scraper.run_scrape(**kwargs)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+class TestStreamingScrape(_ScrapeTestCase):
+    def test_streams_all_pages_into_db_with_event_tags(self):
+        conn = self._run()
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM active_market_outcomes").fetchone()[0], 500)
+            row = conn.execute(
+                "SELECT event_slug, category, icon_url, url FROM active_market_outcomes WHERE market_id = 'm4' AND outcome_index = 0"
+            ).fetchone()
+            self.assertEqual(row["event_slug"], "even")
+            self.assertEqual(row["category"], "Politics")
+            self.assertEqual(row["icon_url"], "i1")
+            self.assertEqual(row["url"], "https://polymarket.com/event/even")
+            tags = {r[0] for r in conn.execute("SELECT tag_label FROM market_tags WHERE market_id = 'm4'")}
+            self.assertEqual(tags, {"Politics", "US"})
+        finally:
+            conn.close()
+
+    def test_limit_count_stops_stream(self):
+        conn = self._run(limit_count=130)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(DISTINCT market_id) FROM active_market_outcomes").fetchone()[0], 130)
+        finally:
+            conn.close()
+
+    def test_empty_crawl_keeps_live_snapshot(self):
+        self._run().close()
+        self.market_pages = {}
+        with self.assertRaises(RuntimeError):
+            self._run()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM active_market_outcomes").fetchone()[0], 500)
+            staging = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name = 'active_market_outcomes_staging'"
+            ).fetchone()[0]
+            self.assertEqual(staging, 0)
+        finally:
+            conn.close()
+
+
+class TestIncrementalScrape(_ScrapeTestCase):
+    def _ids(self, conn):
+        return {
+            (r["market_id"], r["outcome_index"]): r["id"]
+            for r in conn.execute("SELECT id, market_id, outcome_index FROM active_market_outcomes")
+        }
+
+    def test_incremental_updates_only_changed_markets_in_place(self):
+        conn = self._run()
+        ids_before = self._ids(conn)
+        version_before = conn.execute("SELECT version FROM data_versions WHERE name = 'markets'").fetchone()[0]
+        conn.close()
+
+        self.market_pages[0][3]["outcomePrices"] = '["0.7", "0.3"]'  # m3 changed
+        self.market_pages[200] = self.market_pages[200][:-1]  # m249 disappeared
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000):
+            conn = self._run(incremental=True)
+        try:
+            ids_after = self._ids(conn)
+            self.assertEqual(len(ids_after), 498)
+            self.assertEqual({k: v for k, v in ids_before.items() if k[0] != "m249"}, ids_after)
+            price = conn.execute(
+                "SELECT price FROM active_market_outcomes WHERE market_id = 'm3' AND outcome_index = 0"
+            ).fetchone()[0]
+            self.assertAlmostEqual(price, 0.7)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM market_tags WHERE market_id = 'm249'").fetchone()[0], 0)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM market_tags WHERE market_id = 'm3'").fetchone()[0], 1)
+
+            from snapshot_tables import get_market_changes
+            changes = get_market_changes(conn, version_before)
+            self.assertEqual(changes, {"m3": ("c3", "upsert"), "m249": ("c249", "delete")})
+        finally:
+            conn.close()
+
+    def test_incremental_crawl_does_not_hold_the_write_lock(self):
+        self._run().close()
+        self.market_pages[0][3]["outcomePrices"] = '["0.7", "0.3"]'  # m3 changed, seen early in the crawl
+        locked = []
+        add = scraper.IncrementalWriter.add
+
+        def add_then_probe(writer, outcome_rows, tag_rows):
+            add(writer, outcome_rows, tag_rows)
+            if outcome_rows and outcome_rows[0][1] == "m200":
+                other = sqlite3.connect(self.db_path, timeout=0)
+                try:
+                    other.execute("BEGIN IMMEDIATE")
+                    other.rollback()
+                except sqlite3.OperationalError:
+                    locked.append("m200")
+                finally:
+                    other.close()
+
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000), \
+             patch.object(scraper.IncrementalWriter, "add", add_then_probe):
+            conn = self._run(incremental=True)
+        try:
+            self.assertEqual(locked, [])
+            price = conn.execute(
+                "SELECT price FROM active_market_outcomes WHERE market_id = 'm3' AND outcome_index = 0"
+            ).fetchone()[0]
+            self.assertAlmostEqual(price, 0.7)
+        finally:
+            conn.close()
+
+    def test_incremental_writes_changed_markets_in_bounded_chunks(self):
+        self._run().close()
+        for page in self.market_pages.values():
+            for market in page:
+                market["outcomePrices"] = '["0.7", "0.3"]'  # every market changed
+        chunks = []
+        flush = scraper.IncrementalWriter.flush
+
+        def recording_flush(writer):
+            chunks.append(writer.pending_rows)
+            flush(writer)
+            self.assertFalse(writer.conn.in_transaction)
+
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000), \
+             patch.object(scraper.IncrementalWriter, "flush", recording_flush):
+            conn = self._run(incremental=True)
+        try:
+            self.assertGreater(len([rows for rows in chunks if rows]), 1)
+            self.assertLessEqual(max(chunks), 64)
+            self.assertEqual(sum(chunks), 500)
+            prices = {r[0] for r in conn.execute("SELECT price FROM active_market_outcomes WHERE outcome_index = 0")}
+            self.assertEqual(prices, {0.7})
+        finally:
+            conn.close()
+
+    def test_failed_incremental_run_records_chunks_already_written(self):
+        conn = self._run()
+        version_before = conn.execute("SELECT version FROM data_versions WHERE name = 'markets'").fetchone()[0]
+        conn.close()
+        self.market_pages[0][3]["outcomePrices"] = '["0.7", "0.3"]'  # m3 changed, committed in the first chunk
+        self.market_pages[200] = None  # served as HTTP 500
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000), \
+             patch("gamma_client.GAMMA_MAX_RETRIES", 1), \
+             patch("time.sleep", return_value=None), \
+             patch.object(scraper.IncrementalWriter, "add", _flush_after_m3(scraper.IncrementalWriter.add)):
+            with self.assertRaises(gamma_client.GammaFetchError):
+                self._run(incremental=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            from snapshot_tables import get_market_changes
+            self.assertEqual(get_market_changes(conn, version_before), {"m3": ("c3", "upsert")})
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM active_market_outcomes").fetchone()[0], 500)
+        finally:
+            conn.close()
+
+    def test_incremental_keeps_search_index_in_sync(self):
+        self._run().close()
+        self.market_pages[0][3]["question"] = "Will the comet return?"
+        self.market_pages[200] = self.market_pages[200][:-1]  # m249 disappeared
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000):
+            conn = self._run(incremental=True)
+        try:
+            def matches(query):
+                return sorted(
+                    r[0] for r in conn.execute(
+                        "SELECT amo.market_id FROM market_search JOIN active_market_outcomes amo ON amo.id = market_search.rowid "
+                        "WHERE market_search MATCH ?",
+                        (query,),
+                    )
+                )
+
+            self.assertEqual(matches('"comet"'), ["m3", "m3"])
+            self.assertEqual(matches('"Question 3?"'), [])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM market_search").fetchone()[0], 498)
+        finally:
+            conn.close()
+
+    def test_failed_page_aborts_incremental_run_without_deleting(self):
+        self._run().close()
+        self.market_pages[100] = None  # served as HTTP 500
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000), \
+             patch("gamma_client.GAMMA_MAX_RETRIES", 1), \
+             patch("time.sleep", return_value=None):
+            with self.assertRaises(gamma_client.GammaFetchError):
+                self._run(incremental=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM active_market_outcomes").fetchone()[0], 500)
+        finally:
+            conn.close()
+
+    def test_incremental_run_reports_peak_rss_budget(self):
+        self._run().close()
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 1000), \
+             patch.object(scraper, "SCRAPE_RSS_LIMIT_MB", 0), \
+             patch.object(scraper, "peak_rss_mb", return_value=12.5), \
+             self.assertLogs(scraper.logger, level="WARNING") as logs:
+            self._run(incremental=True).close()
+        self.assertTrue(any("Peak RSS 12.5 MiB exceeded" in line for line in logs.output))
+
+    def test_incremental_falls_back_to_full_rebuild_when_due(self):
+        self._run().close()
+        with patch.object(scraper, "SCRAPE_FULL_REBUILD_HOURS", 0):
+            conn = self._run(incremental=True)
+        try:
+            exists = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE name = 'active_market_outcomes_prev'"
+            ).fetchone()[0]
+            self.assertEqual(exists, 1)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM active_market_outcomes").fetchone()[0], 500)
+        finally:
+            conn.close()
+
+
+class TestBulkLoad(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        from snapshot_tables import create_staging_tables
+        create_staging_tables(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_loader_batches_rows_and_reports_throughput(self):
+        snapshot_at = "2098-01-01T00:00:00+00:00"
+        loader = scraper.BulkLoader(self.conn, batch_rows=3)
+        for i in range(5):
+            loader.add(*scraper.normalize_market(_market(i), {}, snapshot_at))
+        self.assertEqual(loader.outcomes_written, 8)  # flushed every 3+ outcome rows
+        loader.flush()
+
+        self.assertEqual(loader.outcomes_written, 10)
+        self.assertGreater(loader.rows_per_second, 0)
+        row = self.conn.execute(
+            "SELECT price, apr FROM active_market_outcomes_staging WHERE market_id = 'm0' AND outcome_index = 0"
+        ).fetchone()
+        self.assertAlmostEqual(row[0], 0.4)
+        self.assertAlmostEqual(row[1], 1.5, places=2)
+
+    def test_loader_commits_each_chunk(self):
+        loader = scraper.BulkLoader(self.conn, batch_rows=3)
+        for i in range(2):
+            loader.add(*scraper.normalize_market(_market(i), {}, "2098-01-01T00:00:00+00:00"))
+        # The chunk is written and the write lock released while the crawl goes on
+        self.assertEqual(loader.outcomes_written, 4)
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_bulk_load_pragmas_are_restored(self):
+        before = [self.conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ("synchronous", "temp_store", "cache_size")]
+        with scraper.bulk_load_pragmas(self.conn):
+            self.assertEqual(self.conn.execute("PRAGMA synchronous").fetchone()[0], 0)
+        after = [self.conn.execute(f"PRAGMA {name}").fetchone()[0] for name in ("synchronous", "temp_store", "cache_size")]
+        self.assertEqual(before, after)
+
+
+if __name__ == "__main__":
+    unittest.main()
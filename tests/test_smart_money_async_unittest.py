@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import smart_money_scraper
+from holders_client import HoldersClient, PnLClient
+
+
+class TestSmartMoneyCrawler(unittest.TestCase):
+    def test_map_bounds_in_flight_requests(self):
+        crawler = smart_money_scraper.SmartMoneyCrawler(concurrency=3, rps=1000)
+        lock = threading.Lock()
+        state = {"in_flight": 0, "peak": 0}
+
+        def worker(item):
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(0.01)
+            with lock:
+                state["in_flight"] -= 1
+            if item == 7:
+                raise ValueError("boom")
+            return item * 2
+
+        results, errors = {}, {}
+
+        def on_result(item, future):
+            try:
+                results[item] = future.result()
+            except ValueError as e:
+                errors[item] = str(e)
+
+        crawler.map(worker, range(20), on_result)
+
+        self.assertLessEqual(state["peak"], 3)
+        self.assertEqual(len(results), 19)
+        self.assertEqual(results[5], 10)
+        self.assertEqual(errors, {7: "boom"})
+
+    def test_clients_share_limiter_and_honor_retry_after(self):
+        limiter = MagicMock()
+        throttled = MagicMock(status_code=429, headers={"Retry-After": "2"})
+        ok = MagicMock(status_code=200, headers={})
+        ok.json.return_value = [{"p": 12.5}]
+
+        with patch("requests.Session.get", side_effect=[throttled, ok]), patch("time.sleep") as mock_sleep:
+            pnl = PnLClient(limiter=limiter).fetch_user_pnl("0x1")
+
+        self.assertEqual(pnl, 12.5)
+        self.assertEqual(limiter.acquire.call_count, 2)
+        limiter.throttle.assert_called_once_with(2.0)
+        limiter.record_success.assert_called_once()
+        mock_sleep.assert_not_called()  # the shared limiter pauses callers, not the client
+
+        holders = MagicMock(status_code=200, headers={})
+        holders.json.return_value = [{"holders": [{"proxyWallet": "0xA", "amount": 5}]}]
+        with patch("requests.Session.get", return_value=holders):
+            data = HoldersClient(limiter=limiter).fetch_holders("cid")
+        self.assertEqual(data[0]["address"], "0xA")
+        self.assertEqual(limiter.acquire.call_count, 3)
+
+
+class TestSmartMoneyAsyncRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "markets.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE wallets_stats (wallet_address TEXT PRIMARY KEY, total_pnl REAL, last_updated TEXT, alias TEXT)")
+        conn.execute("CREATE TABLE holders (market_id TEXT, outcome_index INTEGER, wallet_address TEXT, position_size REAL, snapshot_at TEXT)")
+        conn.execute("CREATE TABLE active_market_outcomes (condition_id TEXT)")
+        conn.executemany("INSERT INTO active_market_outcomes (condition_id) VALUES (?)", [(f"cid{i}",) for i in range(25)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def test_async_run_shares_one_budget_across_phases(self):
+        def fetch_holders(cid, limit=1000):
+            n = int(cid[3:])
+            return [{"address": f"0x{n}", "positionSize": 10, "outcomeIndex": 0, "name": f"w{n}"},
+                    {"address": "0xShared", "positionSize": 5, "outcomeIndex": 1, "name": ""}]
+
+        with patch("smart_money_scraper.get_db_connection", side_effect=self._get_conn), \
+             patch("smart_money_scraper.refresh_market_smart_money_stats"), \
+             patch("smart_money_scraper.HoldersClient") as MockHolders, \
+             patch("smart_money_scraper.PnLClient") as MockPnL:
+            MockHolders.return_value.fetch_holders.side_effect = fetch_holders
+            MockPnL.return_value.fetch_user_pnl.side_effect = lambda w: 1.0 if w == "0xShared" else 2.0
+            smart_money_scraper.run(["--async", "--concurrency", "4", "--rps", "1000"])
+
+        limiters = {c.kwargs["limiter"] for c in MockHolders.call_args_list + MockPnL.call_args_list}
+        self.assertEqual(len(limiters), 1)
+        self.assertEqual(MockHolders.return_value.fetch_holders.call_count, 25)
+
+        conn = self._get_conn()
+        rows = {r["wallet_address"]: (r["total_pnl"], r["alias"]) for r in conn.execute("SELECT * FROM wallets_stats")}
+        holders = conn.execute("SELECT COUNT(*) FROM holders").fetchone()[0]
+        conn.close()
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(rows["0xShared"], (1.0, None))
+        self.assertEqual(rows["0x3"], (2.0, "w3"))
+        self.assertEqual(holders, 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
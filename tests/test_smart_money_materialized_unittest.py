@@ -3,7 +3,11 @@ import sqlite3
 import tempfile
 import unittest
 
-from smart_money_materialized import rebuild_market_smart_money_stats
+from smart_money_materialized import (
+    ensure_smart_money_dirty_tracking,
+    rebuild_market_smart_money_stats,
+    refresh_market_smart_money_stats,
+)
 
 
 class TestSmartMoneyMaterializedStats(unittest.TestCase):
@@ -76,5 +80,54 @@ class TestSmartMoneyMaterializedStats(unittest.TestCase):
         self.assertAlmostEqual(row["smart_money_win_rate"], 0.5)
 
 
+class TestIncrementalSmartMoneyStats(TestSmartMoneyMaterializedStats):
+    def setUp(self):
+        super().setUp()
+        self.conn.execute("INSERT INTO holders VALUES ('c2', 0, 'w9', 1, '')")
+        self.conn.execute("INSERT INTO wallets_stats (wallet_address, total_pnl) VALUES ('w9', 3)")
+        ensure_smart_money_dirty_tracking(self.conn)
+        self.conn.commit()
+
+    def _stats(self):
+        rows = self.conn.execute("SELECT * FROM market_smart_money_stats ORDER BY condition_id").fetchall()
+        return {r["condition_id"]: {k: r[k] for k in r.keys() if k != "last_updated_at"} for r in rows}
+
+    def _updated_at(self):
+        rows = self.conn.execute("SELECT condition_id, last_updated_at FROM market_smart_money_stats").fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def test_first_refresh_after_installing_tracking_is_full(self):
+        result = refresh_market_smart_money_stats(self.conn, generated_at="t1")
+        self.assertEqual(result["mode"], "full")
+        self.assertEqual(set(self._stats()), {"c1", "c2"})
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM smart_money_dirty").fetchone()[0], 0)
+
+    def test_only_markets_touched_by_changes_are_recomputed(self):
+        refresh_market_smart_money_stats(self.conn, generated_at="t1")
+
+        # Same sign: not a change for the aggregates
+        self.conn.execute("UPDATE wallets_stats SET total_pnl = 900 WHERE wallet_address = 'w1'")
+        result = refresh_market_smart_money_stats(self.conn, generated_at="t2")
+        self.assertEqual((result["mode"], result["markets"]), ("incremental", 0))
+        self.assertEqual(self._updated_at(), {"c1": "t1", "c2": "t1"})
+
+        # w3 turns profitable -> c1 via the wallet index; c3 gets new holders; c2 untouched
+        self.conn.execute("UPDATE wallets_stats SET total_pnl = 5 WHERE wallet_address = 'w3'")
+        self.conn.execute("INSERT INTO holders VALUES ('c3', 1, 'w1', 4, '')")
+        result = refresh_market_smart_money_stats(self.conn, generated_at="t3")
+        self.assertEqual((result["mode"], result["markets"], result["wallets"]), ("incremental", 2, 1))
+        self.assertEqual(self._updated_at(), {"c1": "t3", "c2": "t1", "c3": "t3"})
+        self.assertEqual(self._stats()["c1"]["yes_profitable_count"], 3)
+
+        # A market whose holders disappear drops out
+        self.conn.execute("DELETE FROM holders WHERE market_id = 'c2'")
+        refresh_market_smart_money_stats(self.conn, generated_at="t4")
+        incremental = self._stats()
+        self.assertNotIn("c2", incremental)
+
+        rebuild_market_smart_money_stats(self.conn, generated_at="t5")
+        self.assertEqual(incremental, self._stats())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from snapshot_tables import (
+    SNAPSHOT_INDEXES,
+    create_staging_tables,
+    ensure_snapshot_indexes,
+    finalize_staging_tables,
+    get_data_version,
+    get_market_changes,
+    prev_name,
+    publish_staging_tables,
+    rollback_snapshot,
+    staging_name,
+)
+
+
+class TestSnapshotSwap(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.conn = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        os.close(self.db_fd)
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def _build_generation(self, market_ids, hashes=None):
+        create_staging_tables(self.conn)
+        self.conn.executemany(
+            f"INSERT INTO {staging_name('market_content_hashes')} (market_id, condition_id, content_hash) VALUES (?, ?, ?)",
+            [(m, f"c-{m}", (hashes or {}).get(m, "h")) for m in market_ids],
+        )
+        self.conn.executemany(
+            f"INSERT INTO {staging_name('active_market_outcomes')} (market_id, outcome_index, volume_usd) VALUES (?, 0, 1.0)",
+            [(m,) for m in market_ids],
+        )
+        self.conn.executemany(
+            f"INSERT INTO {staging_name('market_tags')} (market_id, tag_label) VALUES (?, 'Politics')",
+            [(m,) for m in market_ids],
+        )
+        self.conn.commit()
+        finalize_staging_tables(self.conn)
+
+    def _live_ids(self):
+        return sorted(r[0] for r in self.conn.execute("SELECT market_id FROM active_market_outcomes"))
+
+    def test_staging_build_does_not_touch_live_until_publish(self):
+        self._build_generation(["a"])
+        publish_staging_tables(self.conn, snapshot_at="2026-01-01T00:00:00+00:00")
+        self._build_generation(["b", "c"])
+
+        self.assertEqual(self._live_ids(), ["a"])
+        publish_staging_tables(self.conn, snapshot_at="2026-01-01T01:00:00+00:00")
+        self.assertEqual(self._live_ids(), ["b", "c"])
+
+        prev = [r[0] for r in self.conn.execute(f"SELECT market_id FROM {prev_name('active_market_outcomes')}")]
+        self.assertEqual(prev, ["a"])
+
+        version = get_data_version(self.conn)
+        self.assertEqual(version["version"], 2)
+        self.assertEqual(version["previous_version"], 1)
+        self.assertEqual(version["updated_at"], "2026-01-01T01:00:00+00:00")
+
+    def test_published_tables_carry_indexes_and_stats(self):
+        for ids in (["a"], ["b"], ["c"], ["d"]):
+            self._build_generation(ids)
+            publish_staging_tables(self.conn)
+
+        live_indexes = {
+            r[0] for r in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'active_market_outcomes'"
+            )
+        }
+        expected = [base for base, table, _ in SNAPSHOT_INDEXES if table == "active_market_outcomes"]
+        self.assertEqual(len(live_indexes), len(expected))
+        stat_tables = {r[0] for r in self.conn.execute("SELECT DISTINCT tbl FROM sqlite_stat1")}
+        self.assertIn("active_market_outcomes", stat_tables)
+        self.assertNotIn(staging_name("active_market_outcomes"), stat_tables)
+
+        plan = " ".join(
+            str(r[-1]) for r in self.conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM active_market_outcomes WHERE market_id = 'd'"
+            )
+        )
+        self.assertIn("idx_amo_market_id", plan)
+
+        # Startup backfill must not add duplicates next to slot-suffixed indexes
+        ensure_snapshot_indexes(self.conn)
+        after = {
+            r[0] for r in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'active_market_outcomes'"
+            )
+        }
+        self.assertEqual(after, live_indexes)
+
+    def test_rollback_restores_previous_generation(self):
+        self._build_generation(["old"])
+        publish_staging_tables(self.conn)
+        self._build_generation(["new"])
+        publish_staging_tables(self.conn)
+
+        self.assertTrue(rollback_snapshot(self.conn))
+        self.assertEqual(self._live_ids(), ["old"])
+        self.assertEqual(get_data_version(self.conn)["version"], 1)
+
+        self.assertTrue(rollback_snapshot(self.conn))
+        self.assertEqual(self._live_ids(), ["new"])
+
+    def test_rollback_never_reuses_version_numbers(self):
+        for ids in (["a"], ["b"]):
+            self._build_generation(ids)
+            publish_staging_tables(self.conn)
+        rollback_snapshot(self.conn)
+        self._build_generation(["c"])
+        self.assertEqual(publish_staging_tables(self.conn), 3)
+
+    def test_full_publish_records_market_changes(self):
+        self._build_generation(["a", "b"])
+        v1 = publish_staging_tables(self.conn)
+        self._build_generation(["a", "c"], hashes={"a": "h2"})
+        publish_staging_tables(self.conn)
+
+        changes = get_market_changes(self.conn, v1)
+        self.assertEqual(changes, {"a": ("c-a", "upsert"), "c": ("c-c", "upsert"), "b": ("c-b", "delete")})
+        # The first generation has nothing to diff against, so the log cannot cover it
+        self.assertIsNone(get_market_changes(self.conn, 0))
+
+    def test_rollback_without_previous_generation(self):
+        self._build_generation(["only"])
+        publish_staging_tables(self.conn)
+        self.assertFalse(rollback_snapshot(self.conn))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+import scraper
+from gamma_client import EVENTS_QUERY, MARKETS_QUERY
+from http_transport import set_transport
+from upstream_replay import RecordingTransport, ReplayTransport, load_archive
+
+
+def _market(i):
+    return {
+        "id": f"m{i}",
+        "conditionId": f"c{i}",
+        "question": f"Question {i}?",
+        "outcomes": '["Yes", "No"]',
+        "outcomePrices": '["0.4", "0.6"]',
+        "volume": "1000",
+        "liquidity": "50",
+        "endDate": "2099-01-01T00:00:00Z",
+        "events": [{"id": "e1"}],
+    }
+
+
+class _FakeInner:
+    """Stands in for the live HttpTransport while recording."""
+
+    def __init__(self):
+        self.markets = [_market(i) for i in range(5)]
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.encoding = "utf-8"
+        if url.endswith("/markets"):
+            offset, limit = int(params["offset"]), int(params["limit"])
+            body = self.markets[offset:offset + limit]
+        elif url.endswith("/events"):
+            body = [{"id": "e1", "slug": "ev", "tags": [{"label": "Politics"}]}] if int(params["offset"]) == 0 else []
+        elif url.endswith("/holders"):
+            body = [{"holders": [{"proxyWallet": "0xabc", "amount": 5, "outcomeIndex": 0}]}]
+        else:
+            body = [{"t": 1, "p": 12.5}]
+        response._content = json.dumps(body).encode("utf-8")
+        return response
+
+    def stats(self):
+        return {"requests": 0}
+
+    def close(self):
+        pass
+
+
+class TestRecordReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.tmp.name, "upstream.jsonl.gz")
+        recorder = RecordingTransport(_FakeInner(), self.archive)
+        gamma = "https://gamma-api.polymarket.com"
+        for offset in (0, 2, 4):
+            recorder.get(f"{gamma}/markets", params={**MARKETS_QUERY, "limit": 2, "offset": offset}, timeout=30)
+        recorder.get(f"{gamma}/events", params={**EVENTS_QUERY, "limit": 2, "offset": 0}, timeout=30)
+        recorder.get("https://data-api.polymarket.com/holders", params={"market": "c1", "limit": 40}, timeout=15)
+        recorder.get("https://user-pnl-api.polymarket.com/user-pnl", params={"user_address": "0xabc"}, timeout=15)
+        self.records = load_archive(self.archive)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_archive_is_compact_jsonl(self):
+        self.assertEqual(len(self.records), 6)
+        with gzip.open(self.archive, "rt") as f:
+            self.assertEqual(len(f.read().splitlines()), 6)
+
+    def test_scaled_catalog_replicates_ids(self):
+        replay = ReplayTransport(self.records, scale=3)
+        gamma = "https://gamma-api.polymarket.com/markets"
+        ids = []
+        offset = 0
+        while True:
+            page = replay.get(gamma, params={**MARKETS_QUERY, "limit": 4, "offset": offset}).json()
+            ids.extend(m["id"] for m in page)
+            if len(page) < 4:
+                break
+            offset += 4
+        self.assertEqual(len(ids), 15)
+        self.assertEqual(len(set(ids)), 15)
+        self.assertIn("m0~2", ids)
+
+        holders = replay.get("https://data-api.polymarket.com/holders", params={"market": "c1~2", "limit": 40}).json()
+        self.assertEqual(holders[0]["holders"][0]["proxyWallet"], "0xabc~2")
+        pnl = replay.get("https://user-pnl-api.polymarket.com/user-pnl", params={"user_address": "0xnew"})
+        self.assertEqual(pnl.status_code, 200)
+
+    def test_injects_throttling_and_errors(self):
+        replay = ReplayTransport(self.records, throttle_rate=1.0, retry_after="3")
+        response = replay.get("https://gamma-api.polymarket.com/events", params={**EVENTS_QUERY, "limit": 2, "offset": 0})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "3")
+
+        replay = ReplayTransport(self.records, error_rate=1.0)
+        self.assertEqual(replay.get("https://user-pnl-api.polymarket.com/user-pnl").status_code, 500)
+        self.assertEqual(replay.stats()["replay"]["errors"], 1)
+
+    def test_scrape_runs_offline_against_replay(self):
+        db_path = os.path.join(self.tmp.name, "markets.db")
+        previous = set_transport(ReplayTransport(self.records, scale=10))
+        try:
+            with patch.object(scraper, "DATA_DIR", self.tmp.name), patch.object(scraper, "DB_PATH", db_path), \
+                 patch("http_cache.GAMMA_HTTP_CACHE", False):
+                summary = scraper.run_scrape()
+        finally:
+            set_transport(previous)
+        self.assertEqual(summary["markets"], 50)
+        conn = sqlite3.connect(db_path)
+        try:
+            self.assertEqual(conn.execute("SELECT COUNT(DISTINCT condition_id) FROM active_market_outcomes").fetchone()[0], 50)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM market_tags WHERE tag_label = 'Politics'").fetchone()[0], 50)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from typing import Any, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from runtime_paths import resolve_repo_path
+
+
+logger = logging.getLogger("polylab.upstream_replay")
+
+
+# live: real network; record: real network + append 200 responses to the archive;
+# replay: serve the archive locally (no network)
+UPSTREAM_MODE = os.environ.get("UPSTREAM_MODE", "live").strip().lower()
+UPSTREAM_ARCHIVE = os.environ.get("UPSTREAM_ARCHIVE", "data/fixtures/upstream.jsonl.gz")
+UPSTREAM_REPLAY_LATENCY_MS = float(os.environ.get("UPSTREAM_REPLAY_LATENCY_MS", "0"))
+UPSTREAM_REPLAY_JITTER_MS = float(os.environ.get("UPSTREAM_REPLAY_JITTER_MS", "0"))
+UPSTREAM_REPLAY_ERROR_RATE = float(os.environ.get("UPSTREAM_REPLAY_ERROR_RATE", "0"))
+UPSTREAM_REPLAY_429_RATE = float(os.environ.get("UPSTREAM_REPLAY_429_RATE", "0"))
+UPSTREAM_REPLAY_RETRY_AFTER = os.environ.get("UPSTREAM_REPLAY_RETRY_AFTER", "1")
+# Catalog multiplier: Gamma pages, holders and wallets are replicated with suffixed ids
+UPSTREAM_REPLAY_SCALE = int(os.environ.get("UPSTREAM_REPLAY_SCALE", "1"))
+UPSTREAM_REPLAY_SEED = int(os.environ.get("UPSTREAM_REPLAY_SEED", "0"))
+
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+# Offset-paginated list endpoints that are served as one virtual (scalable) catalog
+PAGINATED_PATHS = {("gamma-api.polymarket.com", "/markets"), ("gamma-api.polymarket.com", "/events")}
+PAGING_PARAMS = ("limit", "offset")
+REPLICA_SEP = "~"
+
+
+def _canonical_params(params: Any) -> tuple[tuple[str, str], ...]:
+    items = params.items() if isinstance(params, dict) else (params or ())
+    return tuple(sorted((str(k), str(v)) for k, v in items))
+
+
+def _split_url(url: str) -> tuple[str, str]:
+    parts = urlsplit(url)
+    return (parts.hostname or "").lower(), parts.path or "/"
+
+
+def replica_id(value: Any, replica: int) -> Any:
+    if replica == 0 or value is None:
+        return value
+    return f"{value}{REPLICA_SEP}{replica}"
+
+
+def base_id(value: str) -> tuple[str, int]:
+    head, sep, tail = str(value).rpartition(REPLICA_SEP)
+    if sep and tail.isdigit():
+        return head, int(tail)
+    return str(value), 0
+
+
+def load_archive(path: str) -> list[dict[str, Any]]:
+    records = []
+    with gzip.open(resolve_repo_path(path), "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+
+class RecordingTransport:
+    """
+    Pass-through transport that appends every successful response to a gzip JSON-lines archive
+    (one record per request: host, path, params, status, a few headers and the body text).
+    """
+
+    def __init__(self, inner, archive_path: Optional[str] = None):
+        self.inner = inner
+        self.archive_path = str(resolve_repo_path(archive_path or UPSTREAM_ARCHIVE))
+        os.makedirs(os.path.dirname(self.archive_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self.recorded = 0
+
+    def _record(self, method: str, url: str, params: Any, response) -> None:
+        if getattr(response, "status_code", None) != 200:
+            return
+        host, path = _split_url(url)
+        headers = getattr(response, "headers", None) or {}
+        record = {
+            "method": method,
+            "host": host,
+            "path": path,
+            "params": [list(p) for p in _canonical_params(params)],
+            "status": 200,
+            "headers": {h: headers[h] for h in RECORDED_HEADERS if headers.get(h)},
+            "body": response.text,
+        }
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            # Each append is its own gzip member; gzip readers concatenate them
+            with gzip.open(self.archive_path, "at", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+
+    def get(self, url: str, **kwargs: Any):
+        response = self.inner.get(url, **kwargs)
+        self._record("GET", url, kwargs.get("params"), response)
+        return response
+
+    def post(self, url: str, **kwargs: Any):
+        return self.inner.post(url, **kwargs)
+
+    def stats(self) -> dict[str, Any]:
+        stats = dict(self.inner.stats())
+        stats["recorded"] = self.recorded
+        return stats
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class ReplayTransport:
+    """
+    Network-free stand-in for `HttpTransport` that serves a recorded archive.
+
+    - Gamma `/markets` and `/events` are served as one virtual catalog per query, `scale` times the
+      recorded size; replica k of an item gets `~k` appended to its ids (market, condition, event).
+    - Other endpoints match on path + params; ids carrying a replica suffix map back to the recorded
+      original (holder wallets are re-suffixed), and unknown params fall back to a deterministic
+      recorded response for the same path.
+    - Latency/jitter, 5xx errors and 429s (with `Retry-After`) are injected at the configured rates.
+    """
+
+    def __init__(
+        self,
+        records: Iterable[dict[str, Any]],
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: str = "1",
+        scale: int = 1,
+        seed: int = 0,
+    ):
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.jitter = max(0.0, jitter_ms) / 1000.0
+        self.error_rate = max(0.0, error_rate)
+        self.throttle_rate = max(0.0, throttle_rate)
+        self.retry_after = str(retry_after)
+        self.scale = max(1, int(scale))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "served": 0, "errors": 0, "throttled": 0, "missing": 0}
+        self._requests_by_host: dict[str, int] = {}
+
+        self._exact: dict[tuple, dict[str, Any]] = {}
+        self._by_path: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        pages: dict[tuple, list[tuple[int, list]]] = {}
+        for record in records:
+            host, path = record["host"], record["path"]
+            params = _canonical_params(record.get("params"))
+            self._exact[(host, path, params)] = record
+            self._by_path.setdefault((host, path), []).append(record)
+            if (host, path) in PAGINATED_PATHS:
+                offset = int(dict(params).get("offset", 0))
+                query = tuple(p for p in params if p[0] not in PAGING_PARAMS)
+                try:
+                    items = json.loads(record["body"])
+                except ValueError:
+                    continue
+                if isinstance(items, list):
+                    pages.setdefault((host, path, query), []).append((offset, items))
+
+        # Recorded pages concatenated in offset order (duplicate offsets keep the last recording)
+        self._catalogs: dict[tuple, list] = {}
+        for key, chunks in pages.items():
+            by_offset = dict(sorted(chunks, key=lambda c: c[0]))
+            self._catalogs[key] = [item for _, items in sorted(by_offset.items()) for item in items]
+
+    @classmethod
+    def from_archive(cls, path: Optional[str] = None, **overrides: Any) -> "ReplayTransport":
+        options = {
+            "latency_ms": UPSTREAM_REPLAY_LATENCY_MS,
+            "jitter_ms": UPSTREAM_REPLAY_JITTER_MS,
+            "error_rate": UPSTREAM_REPLAY_ERROR_RATE,
+            "throttle_rate": UPSTREAM_REPLAY_429_RATE,
+            "retry_after": UPSTREAM_REPLAY_RETRY_AFTER,
+            "scale": UPSTREAM_REPLAY_SCALE,
+            "seed": UPSTREAM_REPLAY_SEED,
+        }
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(load_archive(path or UPSTREAM_ARCHIVE), **options)
+
+    def catalog_size(self, path: str, host: str = "gamma-api.polymarket.com") -> int:
+        return self.scale * max((len(c) for (h, p, _), c in self._catalogs.items() if h == host and p == path), default=0)
+
+    def _response(self, url: str, status: int, body: str = "", headers: Optional[dict[str, str]] = None) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response._content = body.encode("utf-8")
+        response.headers.update(headers or {})
+        response.headers.setdefault("Content-Type", "application/json")
+        response.url = url
+        response.encoding = "utf-8"
+        return response
+
+    def _draw(self) -> tuple[float, float]:
+        with self._lock:
+            return self._rng.random(), self._rng.random()
+
+    def get(self, url: str, params: Any = None, headers: Any = None, timeout: Any = None, **kwargs: Any) -> requests.Response:
+        host, path = _split_url(url)
+        with self._lock:
+            self.counters["requests"] += 1
+            self._requests_by_host[host] = self._requests_by_host.get(host, 0) + 1
+
+        fault, jitter = self._draw()
+        delay = self.latency + (jitter * self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if fault < self.throttle_rate:
+            self._count("throttled")
+            return self._response(url, 429, '{"error":"rate limited"}', {"Retry-After": self.retry_after})
+        if fault < self.throttle_rate + self.error_rate:
+            self._count("errors")
+            return self._response(url, 500, '{"error":"injected"}')
+
+        params = _canonical_params(params)
+        if (host, path) in PAGINATED_PATHS:
+            return self._serve_page(url, host, path, params)
+        return self._serve_record(url, host, path, params)
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        self._count("missing")
+        return self._response(url, 404, '{"error":"not recorded"}')
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _serve_page(self, url: str, host: str, path: str, params: tuple) -> requests.Response:
+        query_params = dict(params)
+        query = tuple(p for p in params if p[0] not in PAGING_PARAMS)
+        catalog = self._catalogs.get((host, path, query))
+        if catalog is None:
+            self._count("missing")
+            return self._response(url, 404, '{"error":"not recorded"}')
+        offset = int(query_params.get("offset", 0))
+        limit = int(query_params.get("limit", 100))
+        total = len(catalog) * self.scale
+        page = [self._replicate(catalog[i % len(catalog)], i // len(catalog)) for i in range(offset, min(offset + limit, total))]
+        self._count("served")
+        return self._response(url, 200, json.dumps(page, separators=(",", ":")))
+
+    @staticmethod
+    def _replicate(item: dict[str, Any], replica: int) -> dict[str, Any]:
+        if replica == 0:
+            return item
+        item = json.loads(json.dumps(item))
+        for key in ("id", "conditionId", "slug"):
+            if key in item:
+                item[key] = replica_id(item[key], replica)
+        for nested in ("events", "markets"):
+            if isinstance(item.get(nested), list):
+                for child in item[nested]:
+                    if isinstance(child, dict):
+                        for key in ("id", "conditionId", "slug"):
+                            if key in child:
+                                child[key] = replica_id(child[key], replica)
+        return item
+
+    def _serve_record(self, url: str, host: str, path: str, params: tuple) -> requests.Response:
+        replica = 0
+        record = self._exact.get((host, path, params))
+        if record is None:
+            unscaled = []
+            for key, value in params:
+                base, r = base_id(value)
+                replica = max(replica, r)
+                unscaled.append((key, base))
+            record = self._exact.get((host, path, tuple(unscaled)))
+        if record is None:
+            candidates = self._by_path.get((host, path))
+            if not candidates:
+                self._count("missing")
+                return self._response(url, 404, '{"error":"not recorded"}')
+            record = candidates[zlib.crc32(repr(params).encode("utf-8")) % len(candidates)]
+        body = record["body"]
+        if replica and path == "/holders":
+            body = self._replicate_holders(body, replica)
+        self._count("served")
+        return self._response(url, int(record.get("status", 200)), body, record.get("headers"))
+
+    @staticmethod
+    def _replicate_holders(body: str, replica: int) -> str:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        for token in data if isinstance(data, list) else []:
+            for holder in token.get("holders", []) if isinstance(token, dict) else []:
+                if holder.get("proxyWallet"):
+                    holder["proxyWallet"] = replica_id(holder["proxyWallet"], replica)
+        return json.dumps(data, separators=(",", ":"))
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats = {
+                "requests": self.counters["requests"],
+                "pooled_requests": 0,
+                "connections_opened": 0,
+                "connections_reused": 0,
+                "reuse_ratio": 0.0,
+                "hosts": {host: {"requests": n, "connections": 0} for host, n in self._requests_by_host.items()},
+            }
+            stats["replay"] = dict(self.counters)
+        return stats
+
+    def close(self) -> None:
+        pass
+
+
+def build_transport(inner_factory):
+    """
+    Transport for the configured UPSTREAM_MODE; `inner_factory` builds the real network transport.
+    """
+
+    if UPSTREAM_MODE == "replay":
+        transport = ReplayTransport.from_archive()
+        logger.info("Upstream replay from %s (scale %dx)", UPSTREAM_ARCHIVE, transport.scale)
+        return transport
+    if UPSTREAM_MODE == "record":
+        logger.info("Recording upstream responses to %s", UPSTREAM_ARCHIVE)
+        return RecordingTransport(inner_factory())
+    return inner_factory()